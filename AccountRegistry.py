@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from EProtocols.IMAPClient import IMAPClient
+from EProtocols.SMTPClient import SMTPClient
+from config import ACCOUNT_POOL_SIZE, ACCOUNT_IDLE_TIMEOUT, ACCOUNT_EVICT_INTERVAL
+
+
+class ConnectionPool:
+    """
+    Пул клиентов одного протокола для одного аккаунта.
+
+    Одновременно выдается не больше max_size клиентов: почтовые серверы ограничивают
+    число соединений аккаунта. Клиент открывает соединение сам при первом обращении
+    и после возврата остается в пуле до вытеснения по простою.
+    """
+
+    def __init__(self, factory: Callable, max_size: int = ACCOUNT_POOL_SIZE):
+        self.factory = factory
+        self._slots = asyncio.Semaphore(max(max_size, 1))
+        self._idle: List[Tuple[object, float]] = []
+        self.in_use = 0
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator:
+        async with self._slots:
+            client = self._idle.pop()[0] if self._idle else self.factory()
+            self.in_use += 1
+            try:
+                yield client
+            finally:
+                self.in_use -= 1
+                self._idle.append((client, time.monotonic()))
+
+    @property
+    def empty(self) -> bool:
+        return not self._idle and not self.in_use
+
+    def take_idle(self, idle_timeout: Optional[float] = None) -> List:
+        """Забирает из пула клиентов, простаивающих дольше idle_timeout секунд (None - всех)."""
+        deadline = None if idle_timeout is None else time.monotonic() - idle_timeout
+        expired = [client for client, used in self._idle if deadline is None or used <= deadline]
+        self._idle = [(client, used) for client, used in self._idle if deadline is not None and used > deadline]
+        return expired
+
+
+class AccountRegistry:
+    """
+    Реестр аккаунтов сессий: для каждого аккаунта (адрес, сервер, порт и пароль) свои
+    пулы IMAP- и SMTP-клиентов в текущем процессе. Сессии одного аккаунта делят пулы,
+    запросы разных аккаунтов не ждут друг друга.
+
+    Фоновая задача закрывает соединения, простаивающие дольше idle_timeout, и забывает
+    аккаунты без соединений. Смена пароля дает новый ключ аккаунта, поэтому соединения
+    со старыми учетными данными не переиспользуются и уходят по простою.
+    """
+
+    def __init__(
+            self, pool_size: int = ACCOUNT_POOL_SIZE, idle_timeout: float = ACCOUNT_IDLE_TIMEOUT,
+            evict_interval: float = ACCOUNT_EVICT_INTERVAL,
+    ):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.evict_interval = evict_interval
+        self._pools: Dict[Tuple, ConnectionPool] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(protocol: str, account: Dict) -> Tuple:
+        secret = hashlib.sha256(account["email_pass"].encode("utf-8")).hexdigest()
+        return protocol, account["email_user"].lower(), account["server"], account["port"], secret
+
+    def _pool(self, protocol: str, account: Dict, factory: Callable) -> ConnectionPool:
+        key = self._key(protocol, account)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = ConnectionPool(factory, self.pool_size)
+        return pool
+
+    def imap(self, account: Dict):
+        """Клиент IMAP аккаунта из пула; используется как async with registry.imap(account) as client."""
+        return self._pool("imap", account, lambda: IMAPClient(
+            account["server"], account["email_user"], account["email_pass"], port=account["port"]
+        )).acquire()
+
+    def smtp(self, account: Dict):
+        """Клиент SMTP аккаунта из пула; используется как async with registry.smtp(account) as client."""
+        return self._pool("smtp", account, lambda: SMTPClient(
+            account["server"], account["email_user"], account["email_pass"], port=account["port"]
+        )).acquire()
+
+    @property
+    def accounts(self) -> List[str]:
+        """Адреса аккаунтов, для которых в процессе есть пулы."""
+        return sorted({key[1] for key in self._pools})
+
+    def start(self):
+        """Запускает периодическое вытеснение простаивающих соединений."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает вытеснение и закрывает все соединения."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.evict(idle_timeout=None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                await self.evict()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка при закрытии простаивающих соединений: {e}")
+
+    async def evict(self, idle_timeout: Optional[float] = -1) -> int:
+        """
+        Закрывает соединения, простаивающие дольше idle_timeout секунд (по умолчанию -
+        self.idle_timeout, None - все свободные), и удаляет опустевшие пулы.
+        Возвращает число закрытых клиентов.
+        """
+        if idle_timeout == -1:
+            idle_timeout = self.idle_timeout
+
+        expired = []
+        for key, pool in list(self._pools.items()):
+            expired += pool.take_idle(idle_timeout)
+            if pool.empty:
+                del self._pools[key]
+
+        if expired:
+            await asyncio.to_thread(self._close, expired)
+        return len(expired)
+
+    @staticmethod
+    def _close(clients: List):
+        for client in clients:
+            try:
+                client.close_connect()
+            except Exception as e:
+                print(f"Ошибка при закрытии соединения {client.email_user}: {e}")
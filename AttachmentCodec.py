@@ -0,0 +1,54 @@
+import asyncio
+import base64
+import os
+from concurrent import futures
+from typing import List, Optional
+
+from config import ATTACHMENT_CODEC_WORKERS, ATTACHMENT_CODEC_PARALLEL_MIN_SIZE
+
+_executor: Optional[futures.ProcessPoolExecutor] = None
+
+
+def _get_executor() -> futures.ProcessPoolExecutor:
+    """Пул процессов создается при первом большом вложении."""
+    global _executor
+    if _executor is None:
+        _executor = futures.ProcessPoolExecutor(max_workers=ATTACHMENT_CODEC_WORKERS or os.cpu_count())
+    return _executor
+
+
+def shutdown():
+    """Останавливает пул процессов кодирования."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _b64encode_str(content: bytes) -> str:
+    return base64.b64encode(content).decode("utf-8")
+
+
+async def _map_parts(func, parts: List) -> List:
+    """
+    Применяет func к каждой части: большие части - параллельно в пуле процессов,
+    маленькие - в текущем процессе. Порядок результатов совпадает с порядком частей.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run(part):
+        if len(part) < ATTACHMENT_CODEC_PARALLEL_MIN_SIZE:
+            return func(part)
+        return await loop.run_in_executor(_get_executor(), func, part)
+
+    return list(await asyncio.gather(*(run(part) for part in parts)))
+
+
+async def b64encode_parts(parts: List[bytes]) -> List[str]:
+    """Кодирует содержимое вложений в Base64-строки."""
+    return await _map_parts(_b64encode_str, parts)
+
+
+async def b64decode_parts(parts: List) -> List[bytes]:
+    """Декодирует Base64-содержимое вложений."""
+    return await _map_parts(base64.b64decode, parts)
@@ -0,0 +1,118 @@
+import hashlib
+import mimetypes
+import mmap
+import os
+import re
+from typing import Callable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response, StreamingResponse
+
+# Размер фрагмента при отдаче вложения
+RESPONSE_CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def content_etag(content: bytes) -> str:
+    """Строгий ETag по SHA-256 содержимого."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range с одним диапазоном байт. Возвращает (start, end) включительно
+    или None, если диапазон не указан или не поддерживается (тогда отдается весь файл).
+
+    Raises:
+        HTTPException: 416, если диапазон лежит за пределами файла.
+    """
+    if not range_header:
+        return None
+
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Несколько диапазонов или другие единицы - отдаем весь файл
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # bytes=-N: последние N байт
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range Not Satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _attachment_response(
+        request: Request, filename: str, size: int, etag: str,
+        read_range: Callable[[int, int], Iterator[bytes]], media_type: Optional[str] = None,
+) -> Response:
+    """Общая часть ответа: условные запросы, диапазоны и заголовки."""
+    quoted_etag = f'"{etag}"'
+    headers = {
+        "ETag": quoted_etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or quoted_etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == quoted_etag:
+        byte_range = parse_range(request.headers.get("range"), size)
+
+    if size == 0:
+        return Response(b"", media_type=media_type, headers=headers)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, media_type=media_type, headers=headers)
+    return StreamingResponse(read_range(start, end), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def blob_response(request: Request, path: str, filename: str, etag: str, media_type: Optional[str] = None) -> Response:
+    """
+    Отдает файл блоба через отображение в память: фрагменты копируются прямо из страничного кэша,
+    без системных вызовов read. Генератор синхронный, поэтому Starlette выполняет его в пуле потоков.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    def read_range(start: int, end: int) -> Iterator[bytes]:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end + 1, RESPONSE_CHUNK_SIZE):
+                yield mapped[offset:min(offset + RESPONSE_CHUNK_SIZE, end + 1)]
+
+    return _attachment_response(request, filename, size, etag, read_range, media_type)
+
+
+def bytes_response(request: Request, content: bytes, filename: str, etag: str, media_type: Optional[str] = None) -> Response:
+    """Отдает вложение, уже находящееся в памяти (например, расшифрованное из кэша писем)."""
+    view = memoryview(content)
+
+    def read_range(start: int, end: int) -> Iterator[bytes]:
+        for offset in range(start, end + 1, RESPONSE_CHUNK_SIZE):
+            yield view[offset:min(offset + RESPONSE_CHUNK_SIZE, end + 1)]
+
+    return _attachment_response(request, filename, len(content), etag, read_range, media_type)
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from DB.compression import CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, compress, decompress, encode
+from config import BLOB_STORE_DIR
+
+# Расширение файла блоба для каждого кодека
+_CODEC_SUFFIXES = {CODEC_NONE: "", CODEC_ZLIB: ".zz", CODEC_ZSTD: ".zst"}
+
+
+class BlobStore:
+    """
+    Хранилище содержимого вложений вне SQLite с адресацией по SHA-256.
+
+    Файл блоба лежит в root/<первые 2 символа хэша>/<хэш>[.zz|.zst], поэтому одинаковые
+    вложения хранятся один раз. Хэш считается по исходному содержимому, расширение
+    указывает кодек сжатия. Учет ссылок и кодек блоба ведутся в таблице Blobs; сам
+    BlobStore только читает, записывает и удаляет файлы.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    @staticmethod
+    def hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def path(self, blob_hash: str, codec: str = CODEC_NONE) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash + _CODEC_SUFFIXES[codec])
+
+    def stored_codec(self, blob_hash: str) -> Optional[str]:
+        """Кодек, в котором блоб уже лежит на диске, или None, если файла нет."""
+        for codec in _CODEC_SUFFIXES:
+            if os.path.exists(self.path(blob_hash, codec)):
+                return codec
+        return None
+
+    def write(
+            self, content: bytes, content_type: Optional[str] = None, codec: Optional[str] = None
+    ) -> Tuple[str, int, str, bool]:
+        """
+        Сохраняет содержимое, если блоба с таким хэшем еще нет.
+
+        Кодек выбирается по типу содержимого и размеру (см. compression.encode), если не
+        задан явно. Если блоб уже есть на диске, он не перезаписывается и возвращается
+        его кодек. Возвращает хэш, исходный размер, кодек и признак того, что файл создан
+        этим вызовом. Запись атомарна: через временный файл и os.replace.
+        """
+        blob_hash = self.hash(content)
+        existing_codec = self.stored_codec(blob_hash)
+        if existing_codec is not None:
+            return blob_hash, len(content), existing_codec, False
+
+        if codec is None:
+            codec, data = encode(content, content_type)
+        else:
+            data = compress(content, codec)
+        self._write_file(self.path(blob_hash, codec), data)
+        return blob_hash, len(content), codec, True
+
+    def recompress(self, blob_hash: str, codec: str, content_type: Optional[str] = None) -> str:
+        """
+        Перезаписывает блоб в кодеке, выбранном для его содержимого. Старый файл не удаляется:
+        это делается после того, как новый кодек записан в Blobs. Возвращает новый кодек.
+        """
+        content = self.read(blob_hash, codec)
+        new_codec, data = encode(content, content_type)
+        if new_codec != codec:
+            self._write_file(self.path(blob_hash, new_codec), data)
+        return new_codec
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def read(self, blob_hash: str, codec: str = CODEC_NONE) -> bytes:
+        """
+        Читает блоб и распаковывает его. Если файла в этом кодеке уже нет (блоб только что
+        пересжат), читается файл в том кодеке, который есть на диске.
+        """
+        try:
+            with open(self.path(blob_hash, codec), "rb") as f:
+                return decompress(f.read(), codec)
+        except FileNotFoundError:
+            stored_codec = self.stored_codec(blob_hash)
+            if stored_codec is None or stored_codec == codec:
+                raise
+        with open(self.path(blob_hash, stored_codec), "rb") as f:
+            return decompress(f.read(), stored_codec)
+
+    def remove(self, blob_hash: str, codec: Optional[str] = None):
+        """
+        Удаляет файл блоба в указанном кодеке или во всех кодеках сразу (codec=None);
+        отсутствие файла ошибкой не считается.
+        """
+        for file_codec in ([codec] if codec is not None else _CODEC_SUFFIXES):
+            try:
+                os.remove(self.path(blob_hash, file_codec))
+            except FileNotFoundError:
+                pass
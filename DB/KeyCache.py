@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from config import KEY_CACHE_MAX_ENTRIES
+
+
+class KeyCache:
+    """
+    LRU-кэш наборов ключей-кандидатов для пары адресов (свой, собеседник).
+
+    Записи помечены версией таблиц ключей из базы (KeyVersion), которую увеличивают
+    триггеры при любом изменении ключей, в том числе из других рабочих процессов.
+    Обращение с более новой версией сбрасывает кэш целиком; результат запроса, начатого
+    до изменения, сохраняется со старой версией и потому больше не будет выдан.
+    """
+
+    def __init__(self, max_entries: int = KEY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self, version: int):
+        """Сбрасывает кэш, если версия ключей в базе выросла."""
+        if self.version is None or version > self.version:
+            self.version = version
+            self._entries.clear()
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        with self._lock:
+            self._sync(version)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, version: int):
+        with self._lock:
+            if version != self.version or self.max_entries <= 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,1034 @@
+import asyncio
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from DB.BlobStore import BlobStore
+from DB.SQLiteStore import IN_QUERY_CHUNK_SIZE, SQLiteStore
+from DB.compression import CODEC_NONE, content_type_of, decompress, encode, preferred_codec
+from DB.dates import email_date_to_timestamp
+from DB.migrations import MAILBOX_MIGRATIONS, migrate
+from DB.pagination import decode_cursor, encode_cursor
+from Models.models import SummaryEmailResponse
+from config import (
+    BLOB_STORE_DIR, RECOMPRESS_BATCH_SIZE, STORAGE_COMPRESSION_MIN_SIZE,
+    RETENTION_MAX_AGE_DAYS, RETENTION_MAX_COUNT, RETENTION_MAX_BYTES, RETENTION_BATCH_SIZE,
+)
+
+
+class MailStore(SQLiteStore):
+    """
+    Почтовый ящик одного аккаунта: письма, вложения (в собственном хранилище блобов),
+    полнотекстовый индекс и политики хранения в отдельном файле базы.
+    Ящики открывает RSAKeyDatabase.mailbox; у каждого свой писатель, поэтому
+    аккаунты не ждут друг друга.
+    """
+
+    def __init__(self, database_url: str, blob_store_dir: str = BLOB_STORE_DIR):
+        super().__init__(database_url)
+        self.blob_store = BlobStore(blob_store_dir)
+
+        # Кэш справочника папок (имя -> ID)
+        self.folder_ids: Dict[str, int] = {}
+        self._identity_caches["Folders"] = self.folder_ids
+
+        # Время открытия писем (ID письма, ID папки) -> UTC, копится в памяти
+        # и записывается в Letters.last_opened пачкой (flush_opened_letters)
+        self._opened_letters: Dict[Tuple[int, int], int] = {}
+
+    async def disconnect(self):
+        """Закрыть подключение к базе данных."""
+        if self.database.is_connected:
+            await self.flush_opened_letters()
+        await self.database.disconnect()
+
+    async def create_tables(self):
+        """Приводит схему базы данных к актуальной версии, применяя недостающие миграции."""
+        await migrate(self.database, MAILBOX_MIGRATIONS, blob_store=self.blob_store)
+        await self.database.enable_incremental_vacuum()
+        await self.warm_identity_caches()
+
+    async def import_legacy_mail(self, legacy_path: str) -> int:
+        """
+        Переносит письма, вложения, папки и политики хранения из общей базы (до разделения
+        на ящики) в этот ящик. Блобы остаются на месте: ящик, принявший общую почту,
+        использует прежний каталог блобов. Уже перенесенные строки пропускаются.
+
+        Returns:
+            int: Количество перенесенных писем.
+        """
+        tables = ("Emails", "Folders", "Blobs", "Letters", "LetterBodies", "Files", "RetentionPolicies")
+        # Присоединять и отсоединять базу можно только вне транзакции
+        await self.database.execute("ATTACH DATABASE :path AS legacy", {"path": legacy_path})
+        try:
+            async with self.database.transaction():
+                moved = 0
+                # Таблицы писем удаляются из общей базы после переноса (возможно, другим процессом)
+                if not await self.database.fetch_val(
+                    "SELECT EXISTS (SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = 'Letters')"
+                ):
+                    return 0
+                for table in tables:
+                    await self.database.execute(f"INSERT OR IGNORE INTO main.{table} SELECT * FROM legacy.{table}")
+                    if table == "Letters":
+                        moved = await self.database.fetch_val("SELECT changes()")
+        finally:
+            await self.database.execute("DETACH DATABASE legacy")
+        await self.warm_identity_caches()
+        return moved
+
+    async def add_letter(
+            self,
+            folder_name: str,
+            sender: str,
+            recipient: str,
+            to_name: str,
+            subject: str,
+            date: datetime,
+            body: bytes,
+            attachments: List[Dict[str, bytes]],
+            letter_id: int,  # ID письма теперь обязательное
+    ):
+        """Добавляет новое письмо в указанную папку с обязательными параметрами ID письма и папки."""
+        await self.add_letters([{
+            "folder_name": folder_name,
+            "sender": sender,
+            "recipient": recipient,
+            "to_name": to_name,
+            "subject": subject,
+            "date": date,
+            "body": body,
+            "attachments": attachments,
+            "letter_id": letter_id,
+        }])
+
+    async def add_letters(self, letters: List[Dict]) -> int:
+        """
+        Добавляет пачку писем одной транзакцией.
+
+        Каждый элемент содержит те же поля, что и параметры add_letter. Папки и адреса
+        разрешаются в ID пачкой, письма и вложения вставляются через executemany.
+        Письма, уже сохраненные в своей папке (и повторы внутри пачки), пропускаются.
+
+        Returns:
+            int: Количество добавленных писем.
+        """
+        if not letters:
+            return 0
+
+        # Тела сжимаются до захвата писателя
+        encoded = await asyncio.to_thread(lambda: [encode(letter["body"]) for letter in letters])
+        letters = [dict(letter, body=body, body_codec=codec) for letter, (codec, body) in zip(letters, encoded)]
+
+        async with self.database.transaction():
+            folder_ids = await self._resolve_ids("Folders", "name", {letter["folder_name"] for letter in letters})
+            email_ids = await self._resolve_ids(
+                "Emails", "email", {letter[key] for letter in letters for key in ("sender", "recipient")}
+            )
+
+            # Отбрасываем письма, которые уже есть в базе или повторяются в пачке
+            existing = await self._existing_letter_keys(
+                {(letter["letter_id"], folder_ids[letter["folder_name"]]) for letter in letters}
+            )
+            new_letters = []
+            for letter in letters:
+                key = (letter["letter_id"], folder_ids[letter["folder_name"]])
+                if key not in existing:
+                    existing.add(key)
+                    new_letters.append(letter)
+
+            if not new_letters:
+                return 0
+
+            now = int(time.time())
+            await self.database.execute_many(
+                """
+                INSERT INTO Letters (
+                    id, folder_id, sender_id, recipient_id, to_name, subject, date, date_ts, last_opened, size
+                )
+                VALUES (
+                    :id, :folder_id, :sender_id, :recipient_id, :to_name, :subject, :date, :date_ts, :last_opened, :size
+                )
+                """,
+                [
+                    {
+                        "id": letter["letter_id"],
+                        "folder_id": folder_ids[letter["folder_name"]],
+                        "sender_id": email_ids[letter["sender"]],
+                        "recipient_id": email_ids[letter["recipient"]],
+                        "to_name": letter["to_name"],
+                        "subject": letter["subject"],
+                        "date": letter["date"],
+                        # Заголовок Date разбирается один раз при сохранении
+                        "date_ts": email_date_to_timestamp(letter["date"]),
+                        # Письмо сохраняется, когда его открывают, - это и есть первое открытие
+                        "last_opened": now,
+                        "size": len(letter["body"]) + sum(
+                            len(attachment["content"]) for attachment in letter.get("attachments") or []
+                        ),
+                    }
+                    for letter in new_letters
+                ],
+            )
+
+            # Тела хранятся отдельно от заголовков; вставка тела индексирует письмо в LettersFTS
+            await self.database.execute_many(
+                """
+                INSERT INTO LetterBodies (letter_id, folder_id, body, body_codec)
+                VALUES (:letter_id, :folder_id, :body, :body_codec)
+                """,
+                [
+                    {
+                        "letter_id": letter["letter_id"],
+                        "folder_id": folder_ids[letter["folder_name"]],
+                        "body": letter["body"],
+                        "body_codec": letter["body_codec"],
+                    }
+                    for letter in new_letters
+                ],
+            )
+
+            # Добавляем вложения
+            files = [
+                (letter, attachment) for letter in new_letters for attachment in letter.get("attachments") or []
+            ]
+            if files:
+                blob_hashes = await self.add_blobs([attachment for _, attachment in files])
+                await self.database.execute_many(
+                    """
+                    INSERT INTO Files (letter_id, folder_id, file_name, blob_hash, size)
+                    VALUES (:letter_id, :folder_id, :file_name, :blob_hash, :size)
+                    """,
+                    [
+                        {
+                            "letter_id": letter["letter_id"],
+                            "folder_id": folder_ids[letter["folder_name"]],  # Указываем также folder_id для внешнего ключа
+                            "file_name": attachment["filename"],
+                            "blob_hash": blob_hash,
+                            "size": len(attachment["content"]),
+                        }
+                        for (letter, attachment), blob_hash in zip(files, blob_hashes)
+                    ],
+                )
+
+        return len(new_letters)
+
+    async def _existing_letter_keys(self, keys) -> set:
+        """Возвращает те пары (ID письма, ID папки), которые уже есть в Letters."""
+        keys = list(keys)
+        existing = set()
+        for offset in range(0, len(keys), IN_QUERY_CHUNK_SIZE):
+            chunk = keys[offset:offset + IN_QUERY_CHUNK_SIZE]
+            placeholders = ", ".join(f"(:id{i}, :folder{i})" for i in range(len(chunk)))
+            values = {}
+            for i, (letter_id, folder_id) in enumerate(chunk):
+                values[f"id{i}"] = letter_id
+                values[f"folder{i}"] = folder_id
+            rows = await self.database.fetch_all(
+                f"SELECT id, folder_id FROM Letters WHERE (id, folder_id) IN (VALUES {placeholders})", values
+            )
+            existing.update((row["id"], row["folder_id"]) for row in rows)
+        return existing
+
+    async def add_blobs(self, attachments: List[Dict[str, bytes]]) -> List[str]:
+        """
+        Сохраняет содержимое вложений ({"filename", "content"}) в хранилище блобов и увеличивает
+        счетчики ссылок на него. Кодек сжатия выбирается по типу файла и размеру; у уже
+        существующего блоба сохраняется прежний кодек.
+        Вызывается внутри транзакции вместе со вставкой ссылок в Files. Файлы, созданные
+        этим вызовом, удаляются, если транзакция откатится. Возвращает хэши блобов.
+        """
+        blobs = await asyncio.to_thread(lambda: [
+            self.blob_store.write(attachment["content"], content_type_of(attachment.get("filename")))
+            for attachment in attachments
+        ])
+        created = [(blob_hash, codec) for blob_hash, _, codec, is_new in blobs if is_new]
+        if created:
+            def remove_created_files():
+                for blob_hash, codec in created:
+                    self.blob_store.remove(blob_hash, codec)
+
+            self.database.on_rollback(remove_created_files)
+
+        await self.database.execute_many(
+            """
+            INSERT INTO Blobs (hash, size, refcount, codec) VALUES (:hash, :size, 1, :codec)
+            ON CONFLICT (hash) DO UPDATE SET refcount = refcount + 1
+            """,
+            [{"hash": blob_hash, "size": size, "codec": codec} for blob_hash, size, codec, _ in blobs],
+        )
+        return [blob_hash for blob_hash, _, _, _ in blobs]
+
+    async def release_letter_blobs(self, letter_id: int, folder_id: int):
+        """
+        Уменьшает счетчики ссылок на блобы вложений письма и удаляет блобы без ссылок.
+        Вызывается внутри транзакции до удаления строк Files.
+        """
+        await self.database.execute(
+            """
+            UPDATE Blobs SET refcount = refcount - (
+                SELECT COUNT(*) FROM Files
+                WHERE Files.blob_hash = Blobs.hash AND letter_id = :letter_id AND folder_id = :folder_id
+            )
+            WHERE hash IN (SELECT blob_hash FROM Files WHERE letter_id = :letter_id AND folder_id = :folder_id)
+            """,
+            {"letter_id": letter_id, "folder_id": folder_id},
+        )
+
+    async def collect_garbage_blobs(self):
+        """
+        Удаляет блобы, на которые больше не ссылается ни одно вложение.
+        Файлы удаляются только после фиксации транзакции (при откате строки Blobs
+        возвращаются вместе с файлами) и еще под блокировкой писателя, поэтому add_blobs
+        не может одновременно сослаться на удаляемый файл.
+        """
+        rows = await self.database.fetch_all(
+            "DELETE FROM Blobs WHERE refcount <= 0 AND hash NOT IN (SELECT blob_hash FROM Files) RETURNING hash"
+        )
+        if not rows:
+            return
+
+        hashes = [row["hash"] for row in rows]
+
+        def remove_files():
+            for blob_hash in hashes:
+                self.blob_store.remove(blob_hash)
+
+        self.database.on_commit(remove_files)
+
+    async def recompress_letters(self, after_rowid: int = 0, batch_size: int = RECOMPRESS_BATCH_SIZE) -> Optional[int]:
+        """
+        Пересжимает очередную пачку тел писем, сохраненных не в текущем кодеке (например, до
+        появления сжатия). Тела выбираются по rowid LetterBodies после after_rowid, сжатие идет вне
+        блокировки писателя, запись - одной короткой транзакцией; письмо, измененное
+        за это время, пропускается.
+
+        Returns:
+            Optional[int]: rowid, с которого продолжать, или None, если письма закончились.
+        """
+        codec = preferred_codec()
+        if codec == CODEC_NONE:
+            return None
+
+        rows = await self.reader.fetch_all(
+            """
+            SELECT rowid, body, body_codec FROM LetterBodies
+            WHERE rowid > :after AND body_codec != :codec AND length(body) >= :min_size
+            ORDER BY rowid
+            LIMIT :limit
+            """,
+            {"after": after_rowid, "codec": codec, "min_size": STORAGE_COMPRESSION_MIN_SIZE, "limit": batch_size},
+        )
+        if not rows:
+            return None
+
+        def recode():
+            updates = []
+            for row in rows:
+                new_codec, body = encode(decompress(row["body"], row["body_codec"]))
+                if new_codec != row["body_codec"]:
+                    updates.append({
+                        "rowid": row["rowid"], "old_codec": row["body_codec"], "codec": new_codec, "body": body,
+                        "delta": len(body) - len(row["body"]),
+                    })
+            return updates
+
+        updates = await asyncio.to_thread(recode)
+        if updates:
+            async with self.database.transaction():
+                # Размер письма поправляется, пока у тела еще прежний кодек
+                await self.database.execute_many(
+                    """
+                    UPDATE Letters SET size = size + :delta
+                    WHERE (id, folder_id) = (
+                        SELECT letter_id, folder_id FROM LetterBodies WHERE rowid = :rowid AND body_codec = :old_codec
+                    )
+                    """,
+                    updates,
+                )
+                await self.database.execute_many(
+                    """
+                    UPDATE LetterBodies SET body = :body, body_codec = :codec
+                    WHERE rowid = :rowid AND body_codec = :old_codec
+                    """,
+                    updates,
+                )
+        return rows[-1]["rowid"]
+
+    async def recompress_blobs(self, after_hash: str = "", batch_size: int = RECOMPRESS_BATCH_SIZE) -> Optional[str]:
+        """
+        Пересжимает очередную пачку блобов вложений, сохраненных не в текущем кодеке.
+        Файлы перезаписываются под блокировкой писателя (как и в add_blobs/collect_garbage_blobs),
+        старый файл удаляется после фиксации нового кодека в Blobs, новый - при откате.
+
+        Returns:
+            Optional[str]: Хэш, с которого продолжать, или None, если блобы закончились.
+        """
+        codec = preferred_codec()
+        if codec == CODEC_NONE:
+            return None
+
+        async with self.database.transaction():
+            rows = await self.database.fetch_all(
+                """
+                SELECT b.hash, b.codec,
+                    (SELECT file_name FROM Files WHERE blob_hash = b.hash LIMIT 1) AS file_name
+                FROM Blobs b
+                WHERE b.hash > :after AND b.codec != :codec AND b.size >= :min_size
+                ORDER BY b.hash
+                LIMIT :limit
+                """,
+                {"after": after_hash, "codec": codec, "min_size": STORAGE_COMPRESSION_MIN_SIZE, "limit": batch_size},
+            )
+            if not rows:
+                return None
+
+            def recode():
+                changed = []
+                for row in rows:
+                    try:
+                        new_codec = self.blob_store.recompress(row["hash"], row["codec"], content_type_of(row["file_name"]))
+                    except (OSError, ValueError, zlib.error) as e:
+                        print(f"Ошибка при пересжатии блоба {row['hash']}: {e}")
+                        continue
+                    if new_codec != row["codec"]:
+                        changed.append((row["hash"], row["codec"], new_codec))
+                return changed
+
+            changed = await asyncio.to_thread(recode)
+            if changed:
+                def remove_old_files():
+                    for blob_hash, old_codec, _ in changed:
+                        self.blob_store.remove(blob_hash, old_codec)
+
+                def remove_new_files():
+                    for blob_hash, _, new_codec in changed:
+                        self.blob_store.remove(blob_hash, new_codec)
+
+                self.database.on_rollback(remove_new_files)
+                await self.database.execute_many(
+                    "UPDATE Blobs SET codec = :codec WHERE hash = :hash",
+                    [{"hash": blob_hash, "codec": new_codec} for blob_hash, _, new_codec in changed],
+                )
+                self.database.on_commit(remove_old_files)
+
+        return rows[-1]["hash"]
+
+    async def get_email_from_db(self, email_id: int, folder_name: str) -> Optional[Dict]:
+        """Получает письмо и вложения из базы данных по ID письма и имени папки."""
+        # Получаем ID папки по имени
+        folder_id = await self.get_folder_id(folder_name)
+        if folder_id is None:
+            return None
+
+        # Получаем письмо из таблицы Letters
+        query = """
+        SELECT 
+            l.id AS email_id,
+            e1.email AS sender,
+            e2.email AS recipient,
+            l.to_name,
+            l.subject,
+            l.date,
+            b.body,
+            b.body_codec
+        FROM Letters l
+        JOIN LetterBodies b ON b.letter_id = l.id AND b.folder_id = l.folder_id
+        JOIN Emails e1 ON l.sender_id = e1.id
+        JOIN Emails e2 ON l.recipient_id = e2.id
+        WHERE l.id = :email_id AND l.folder_id = :folder_id
+        """
+        letter = await self.reader.fetch_one(query, {"email_id": email_id, "folder_id": folder_id})
+        if not letter:
+            return None
+
+        # Получаем вложения из таблицы Files
+        attachments_query = """
+        SELECT fl.file_name, fl.blob_hash, b.codec
+        FROM Files fl
+        JOIN Blobs b ON b.hash = fl.blob_hash
+        WHERE fl.letter_id = :email_id AND fl.folder_id = :folder_id
+        ORDER BY fl.id
+        """
+        rows = await self.reader.fetch_all(attachments_query, {"email_id": email_id, "folder_id": folder_id})
+
+        # Содержимое вложений читается из хранилища блобов
+        attachments = []
+        for row in rows:
+            try:
+                content = await asyncio.to_thread(self.blob_store.read, row["blob_hash"], row["codec"])
+            except (OSError, ValueError, zlib.error) as e:
+                print(f"Ошибка при чтении вложения '{row['file_name']}' письма {email_id}: {e}")
+                continue
+            attachments.append({"filename": row["file_name"], "content": content})
+
+        # Возвращаем результат в виде словаря
+        return {
+            "id": letter["email_id"],
+            "sender": letter["sender"],
+            "recipient": letter["recipient"],
+            "to": letter["to_name"],
+            "subject": letter["subject"],
+            "date": letter["date"],
+            "body": decompress(letter["body"], letter["body_codec"]),
+            "attachments": attachments,
+        }
+
+    async def get_letter_attachment(self, email_id: int, folder_name: str, index: int) -> Optional[Dict]:
+        """
+        Возвращает сведения о вложении письма по его порядковому номеру: имя, хэш, размер и кодек
+        блоба, а также признак того, что письмо зашифровано (тогда блоб содержит шифротекст).
+        Путь указывает на файл блоба в его кодеке, то есть на сжатые данные, если кодек не none.
+        Возвращает None, если письма или вложения нет в базе.
+        """
+        folder_id = await self.get_folder_id(folder_name)
+        if folder_id is None:
+            return None
+
+        # Тело распаковывается один раз: MATERIALIZED не дает SQLite подставить выражение
+        # в каждое место использования
+        query = """
+        WITH lb AS MATERIALIZED (
+            SELECT letter_id, folder_id, CAST(storage_decompress(body_codec, body) AS TEXT) AS body_text
+            FROM LetterBodies
+            WHERE letter_id = :email_id AND folder_id = :folder_id
+        )
+        SELECT
+            fl.file_name,
+            fl.blob_hash,
+            fl.size,
+            bl.codec,
+            CASE
+                WHEN json_valid(lb.body_text) THEN json_type(lb.body_text, '$.encrypted_content') IS NOT NULL
+                ELSE 0
+            END AS encrypted
+        FROM Files fl
+        JOIN lb ON lb.letter_id = fl.letter_id AND lb.folder_id = fl.folder_id
+        JOIN Blobs bl ON bl.hash = fl.blob_hash
+        WHERE fl.letter_id = :email_id AND fl.folder_id = :folder_id
+        ORDER BY fl.id
+        LIMIT 1 OFFSET :index
+        """
+        row = await self.reader.fetch_one(query, {"email_id": email_id, "folder_id": folder_id, "index": index})
+        if not row:
+            return None
+
+        return {
+            "filename": row["file_name"],
+            "blob_hash": row["blob_hash"],
+            "size": row["size"],
+            "codec": row["codec"],
+            "path": self.blob_store.path(row["blob_hash"], row["codec"]),
+            "encrypted": bool(row["encrypted"]),
+        }
+
+    async def get_folder_id(self, folder_name: str) -> Optional[int]:
+        """
+        ID папки из кэша, а при промахе - из таблицы Folders (папку мог добавить другой
+        рабочий процесс). Возвращает None, если такой папки нет.
+        """
+        folder_id = self.folder_ids.get(folder_name)
+        if folder_id is None:
+            folder_id = await self.reader.fetch_val("SELECT id FROM Folders WHERE name = :name", {"name": folder_name})
+            if folder_id is not None:
+                self.folder_ids[folder_name] = folder_id
+        return folder_id
+
+    async def add_or_get_folder_id(self, folder_name: str) -> int:
+        """
+        Добавляет папку в таблицу Folders, если её ещё нет, и возвращает её ID.
+        Если папка уже существует, просто возвращает её ID.
+
+        Args:
+            folder_name (str): Название папки.
+
+        Returns:
+            int: ID папки.
+        """
+        try:
+            # Проверяем, существует ли папка
+            folder_id = await self.get_folder_id(folder_name)
+            if folder_id is not None:
+                return folder_id
+
+            # Если папки нет, добавляем её
+            folder_ids = await self._resolve_ids("Folders", "name", [folder_name])
+            return folder_ids[folder_name]
+        except Exception as e:
+            raise ValueError(f"Ошибка при добавлении или получении папки '{folder_name}': {e}")
+
+    async def move_letter(self, letter_id: int, source_folder_name: str, target_folder_name: str):
+        """
+        Перемещает указанное письмо из одной папки в другую, а также перепривязывает все файлы,
+        связанные с этим письмом, в новую папку.
+
+        Args:
+            letter_id (int): ID письма.
+            source_folder_name (str): Имя папки, из которой перемещается письмо.
+            target_folder_name (str): Имя папки, в которую перемещается письмо.
+
+        Raises:
+            ValueError: Если письмо или папка не найдены.
+        """
+        # Получаем ID исходной папки
+        source_folder_id = await self.add_or_get_folder_id(source_folder_name)
+        if not source_folder_id:
+            raise ValueError(f"Source folder '{source_folder_name}' does not exist.")
+
+        # Получаем ID целевой папки
+        target_folder_id = await self.add_or_get_folder_id(target_folder_name)
+
+        # Проверяем, что письмо существует в исходной папке
+        letter_exists = await self.database.fetch_val(
+            "SELECT 1 FROM Letters WHERE id = :letter_id AND folder_id = :folder_id",
+            {"letter_id": letter_id, "folder_id": source_folder_id}
+        )
+        if not letter_exists:
+            raise ValueError(f"Letter with ID {letter_id} does not exist in folder '{source_folder_name}'.")
+
+        async with self.database.transaction():
+            # Files ссылается на (id, folder_id) письма: проверку внешнего ключа
+            # откладываем до фиксации, когда обе таблицы уже обновлены
+            await self.database.execute("PRAGMA defer_foreign_keys = ON")
+
+            # Получаем все файлы, связанные с этим письмом в исходной папке
+            await self.database.execute(
+                "UPDATE Files SET folder_id = :target_folder_id WHERE letter_id = :letter_id AND folder_id = :source_folder_id",
+                {"target_folder_id": target_folder_id, "letter_id": letter_id, "source_folder_id": source_folder_id}
+            )
+
+            # Обновляем папку для письма
+            await self.database.execute(
+                "UPDATE Letters SET folder_id = :target_folder_id WHERE id = :letter_id AND folder_id = :source_folder_id",
+                {"target_folder_id": target_folder_id, "letter_id": letter_id, "source_folder_id": source_folder_id}
+            )
+
+    async def delete_letter(self, letter_id: int, folder_name: str):
+        """
+        Удаляет указанное письмо из указанной папки, а также все вложения, связанные с этим письмом.
+
+        Args:
+            letter_id (int): ID письма.
+            folder_name (str): Имя папки.
+
+        Raises:
+            ValueError: Если письмо или папка не найдены.
+        """
+        # Получаем ID папки
+        folder_id = await self.get_folder_id(folder_name)
+        if not folder_id:
+            raise ValueError(f"Folder '{folder_name}' does not exist.")
+
+        async with self.database.transaction():
+            # Освобождаем блобы вложений письма
+            await self.release_letter_blobs(letter_id, folder_id)
+
+            # Удаляем все файлы, связанные с письмом в указанной папке
+            await self.database.execute(
+                "DELETE FROM Files WHERE letter_id = :letter_id AND folder_id = :folder_id",
+                {"letter_id": letter_id, "folder_id": folder_id}
+            )
+
+            # Удаляем письмо из папки
+            result = await self.database.execute(
+                "DELETE FROM Letters WHERE id = :letter_id AND folder_id = :folder_id",
+                {"letter_id": letter_id, "folder_id": folder_id}
+            )
+            if result == 0:
+                raise ValueError(f"Letter with ID {letter_id} does not exist in folder '{folder_name}'.")
+
+            await self.collect_garbage_blobs()
+
+    async def touch_letter(self, letter_id: int, folder_name: str):
+        """Отмечает, что письмо открыли. Время попадает в базу при следующем flush_opened_letters."""
+        folder_id = await self.get_folder_id(folder_name)
+        if folder_id is not None:
+            self._opened_letters[(letter_id, folder_id)] = int(time.time())
+
+    async def flush_opened_letters(self):
+        """Записывает накопленное время открытия писем в Letters.last_opened одним executemany."""
+        if not self._opened_letters:
+            return
+        opened, self._opened_letters = self._opened_letters, {}
+        await self.database.execute_many(
+            "UPDATE Letters SET last_opened = :last_opened WHERE id = :id AND folder_id = :folder_id",
+            [
+                {"id": letter_id, "folder_id": folder_id, "last_opened": last_opened}
+                for (letter_id, folder_id), last_opened in opened.items()
+            ],
+        )
+
+    async def get_retention_policies(self) -> List[Dict]:
+        """
+        Возвращает действующие политики хранения для всех папок: собственную политику папки
+        или политику по умолчанию из настроек. None в ограничении означает "без ограничения".
+        """
+        rows = await self.reader.fetch_all("""
+        SELECT f.id AS folder_id, f.name AS folder_name, p.folder_id AS custom,
+            p.max_age_days, p.max_count, p.max_bytes
+        FROM Folders f
+        LEFT JOIN RetentionPolicies p ON p.folder_id = f.id
+        ORDER BY f.name
+        """)
+        default = {
+            "max_age_days": RETENTION_MAX_AGE_DAYS or None,
+            "max_count": RETENTION_MAX_COUNT or None,
+            "max_bytes": RETENTION_MAX_BYTES or None,
+        }
+        return [
+            {
+                "folder_id": row["folder_id"],
+                "folder_name": row["folder_name"],
+                **({
+                    "max_age_days": row["max_age_days"],
+                    "max_count": row["max_count"],
+                    "max_bytes": row["max_bytes"],
+                } if row["custom"] is not None else default),
+            }
+            for row in rows
+        ]
+
+    async def set_retention_policy(
+            self, folder_name: str, max_age_days: Optional[int] = None,
+            max_count: Optional[int] = None, max_bytes: Optional[int] = None
+    ):
+        """
+        Задает политику хранения папки; None в ограничении означает "без ограничения".
+        Ограничения применяет фоновая задача RetentionJob.
+        """
+        folder_id = await self.add_or_get_folder_id(folder_name)
+        await self.database.execute(
+            """
+            INSERT INTO RetentionPolicies (folder_id, max_age_days, max_count, max_bytes)
+            VALUES (:folder_id, :max_age_days, :max_count, :max_bytes)
+            ON CONFLICT (folder_id) DO UPDATE SET
+                max_age_days = excluded.max_age_days,
+                max_count = excluded.max_count,
+                max_bytes = excluded.max_bytes
+            """,
+            {"folder_id": folder_id, "max_age_days": max_age_days, "max_count": max_count, "max_bytes": max_bytes},
+        )
+
+    async def reset_retention_policy(self, folder_name: str):
+        """Удаляет собственную политику папки: к ней снова применяется политика по умолчанию."""
+        folder_id = await self.get_folder_id(folder_name)
+        if folder_id is not None:
+            await self.database.execute("DELETE FROM RetentionPolicies WHERE folder_id = :folder_id", {"folder_id": folder_id})
+
+    async def evict_letters(self, policy: Dict, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        """
+        Удаляет из папки очередную пачку писем, нарушающих политику хранения (см. get_retention_policies):
+        не открывавшихся дольше max_age_days, а также лишние сверх max_count и max_bytes.
+        Вытесняются письма, которые дольше всего не открывались. Кандидаты выбираются
+        через пул читателей, удаление - одной транзакцией, как в delete_letter.
+
+        Returns:
+            int: Количество удаленных писем (0 - папка укладывается в политику).
+        """
+        # Открытия, накопленные в памяти, должны защитить письма от вытеснения
+        await self.flush_opened_letters()
+
+        folder_id = policy["folder_id"]
+        totals = await self.reader.fetch_one(
+            "SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS bytes FROM Letters WHERE folder_id = :folder_id",
+            {"folder_id": folder_id},
+        )
+        values = {
+            "folder_id": folder_id,
+            "cutoff": int(time.time()) - policy["max_age_days"] * 86400 if policy["max_age_days"] else None,
+            "excess_count": max(totals["count"] - policy["max_count"], 0) if policy["max_count"] is not None else 0,
+            "excess_bytes": max(totals["bytes"] - policy["max_bytes"], 0) if policy["max_bytes"] is not None else 0,
+            "limit": batch_size,
+        }
+        if values["cutoff"] is None and not values["excess_count"] and not values["excess_bytes"]:
+            return 0
+
+        # Письма по возрастанию last_opened: номер и объем всех писем перед текущим
+        rows = await self.reader.fetch_all(
+            """
+            SELECT id, last_opened FROM (
+                SELECT id, last_opened,
+                    ROW_NUMBER() OVER w AS position,
+                    COALESCE(SUM(size) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0) AS bytes_before
+                FROM Letters
+                WHERE folder_id = :folder_id
+                WINDOW w AS (ORDER BY last_opened, id)
+            )
+            WHERE last_opened < :cutoff OR position <= :excess_count OR bytes_before < :excess_bytes
+            ORDER BY position
+            LIMIT :limit
+            """,
+            values,
+        )
+        if not rows:
+            return 0
+
+        placeholders = ", ".join(f"(:id{i}, :opened{i})" for i in range(len(rows)))
+        keys = {}
+        for i, row in enumerate(rows):
+            keys[f"id{i}"] = row["id"]
+            keys[f"opened{i}"] = row["last_opened"]
+        # Письмо, открытое после выбора кандидатов, не удаляется
+        selected = f"""
+            SELECT id FROM Letters
+            WHERE folder_id = :folder_id AND (id, last_opened) IN (VALUES {placeholders})
+        """
+
+        async with self.database.transaction():
+            await self.database.execute(
+                f"""
+                UPDATE Blobs SET refcount = refcount - (
+                    SELECT COUNT(*) FROM Files
+                    WHERE Files.blob_hash = Blobs.hash AND folder_id = :folder_id AND letter_id IN ({selected})
+                )
+                WHERE hash IN (SELECT blob_hash FROM Files WHERE folder_id = :folder_id AND letter_id IN ({selected}))
+                """,
+                {"folder_id": folder_id, **keys},
+            )
+            await self.database.execute(
+                f"DELETE FROM Files WHERE folder_id = :folder_id AND letter_id IN ({selected})",
+                {"folder_id": folder_id, **keys},
+            )
+            evicted = await self.database.execute(
+                f"DELETE FROM Letters WHERE folder_id = :folder_id AND id IN ({selected})",
+                {"folder_id": folder_id, **keys},
+            )
+            await self.collect_garbage_blobs()
+
+        return evicted
+
+    async def get_emails_summary_from_db(
+            self, folder_name: str, offset: Optional[int] = None, limit: Optional[int] = None,
+            date_from: Optional[datetime] = None, date_to: Optional[datetime] = None
+    ) -> List[SummaryEmailResponse]:
+        """
+        Возвращает список краткой информации о письмах из указанной папки, новые письма первыми.
+
+        Args:
+            folder_name (str): Имя папки.
+            offset (Optional[int]): Смещение для пагинации (по умолчанию None).
+            limit (Optional[int]): Лимит количества возвращаемых писем (по умолчанию None).
+            date_from (Optional[datetime]): Только письма не раньше этой даты (по умолчанию None).
+            date_to (Optional[datetime]): Только письма раньше этой даты (по умолчанию None).
+
+        Returns:
+            List[SummaryEmailResponse]: Список писем.
+        """
+        query = """
+        SELECT 
+            l.id AS letter_id,
+            e.email AS sender_email,
+            l.subject,
+            l.date
+        FROM Letters l
+        INNER JOIN Folders f ON l.folder_id = f.id
+        INNER JOIN Emails e ON l.sender_id = e.id
+        WHERE f.name = :folder_name
+        """
+
+        # Подготовка параметров запроса
+        values = {"folder_name": folder_name}
+
+        # Диапазон дат проверяется по индексу (folder_id, date_ts)
+        if date_from is not None:
+            query += " AND l.date_ts >= :date_from"
+            values["date_from"] = email_date_to_timestamp(date_from)
+        if date_to is not None:
+            query += " AND l.date_ts < :date_to"
+            values["date_to"] = email_date_to_timestamp(date_to)
+
+        query += " ORDER BY l.date_ts DESC, l.id DESC"
+
+        # Дополняем запрос LIMIT и OFFSET только если они указаны
+        # (OFFSET в SQLite допустим только после LIMIT; -1 означает "без ограничения")
+        if limit is not None or offset is not None:
+            query += " LIMIT :limit"
+            values["limit"] = limit if limit is not None else -1
+        if offset is not None:
+            query += " OFFSET :offset"
+            values["offset"] = offset
+
+        # Выполняем запрос
+        rows = await self.reader.fetch_all(query, values)
+
+        # Формируем список SummaryEmailResponse
+        return [self._summary_from_row(row) for row in rows]
+
+    async def get_emails_page_from_db(
+            self, folder_name: str, limit: int, cursor: Optional[str] = None,
+            date_from: Optional[datetime] = None, date_to: Optional[datetime] = None
+    ) -> Tuple[List[SummaryEmailResponse], Optional[str]]:
+        """
+        Возвращает страницу писем из папки (новые первыми) с пагинацией по ключу (date_ts, id).
+
+        Вместо OFFSET запрос продолжает покрывающий индекс (folder_id, date_ts, id, ...) с позиции
+        последнего выданного письма, поэтому любая страница стоит столько же, сколько первая.
+        Письма с неразобранной датой (date_ts IS NULL) идут после всех остальных.
+
+        Args:
+            folder_name (str): Имя папки.
+            limit (int): Размер страницы.
+            cursor (Optional[str]): Токен продолжения из предыдущего ответа (None - первая страница).
+            date_from (Optional[datetime]): Только письма не раньше этой даты (по умолчанию None).
+            date_to (Optional[datetime]): Только письма раньше этой даты (по умолчанию None).
+
+        Returns:
+            Tuple[List[SummaryEmailResponse], Optional[str]]: Письма и токен следующей страницы
+            (None, если страница последняя).
+
+        Raises:
+            ValueError: Если токен продолжения поврежден.
+        """
+        position = decode_cursor(cursor) if cursor else None
+
+        folder_id = await self.get_folder_id(folder_name)
+        if folder_id is None or limit <= 0:
+            return [], None
+
+        query = """
+        SELECT
+            l.id AS letter_id,
+            l.date_ts,
+            e.email AS sender_email,
+            l.subject,
+            l.date
+        FROM Letters l
+        INNER JOIN Emails e ON l.sender_id = e.id
+        WHERE l.folder_id = :folder_id AND {condition}
+        ORDER BY l.date_ts DESC, l.id DESC
+        LIMIT :limit
+        """
+        values = {"folder_id": folder_id, "limit": limit}
+
+        # Диапазон дат проверяется по тому же индексу
+        bounds = ""
+        if date_from is not None:
+            bounds += " AND l.date_ts >= :date_from"
+            values["date_from"] = email_date_to_timestamp(date_from)
+        if date_to is not None:
+            bounds += " AND l.date_ts < :date_to"
+            values["date_to"] = email_date_to_timestamp(date_to)
+
+        rows = []
+        if position is None or position[0] is not None:
+            # Письма с датой: сравнение кортежей превращается в поиск по индексу
+            if position is None:
+                condition = "l.date_ts IS NOT NULL"
+            else:
+                condition = "(l.date_ts, l.id) < (:date_ts, :letter_id)"
+                values.update(date_ts=position[0], letter_id=position[1])
+            rows = list(await self.reader.fetch_all(query.format(condition=condition + bounds), values))
+
+        if len(rows) < limit and not bounds:
+            # Хвост из писем без даты, упорядоченный по id
+            condition = "l.date_ts IS NULL"
+            if position is not None and position[0] is None:
+                condition += " AND l.id < :letter_id"
+                values["letter_id"] = position[1]
+            values["limit"] = limit - len(rows)
+            rows += await self.reader.fetch_all(query.format(condition=condition), values)
+
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1]["date_ts"], rows[-1]["letter_id"])
+
+        return [self._summary_from_row(row) for row in rows], next_cursor
+
+    @staticmethod
+    def _summary_from_row(row) -> SummaryEmailResponse:
+        return SummaryEmailResponse(
+            id=row["letter_id"],
+            sender=row["sender_email"],
+            subject=row["subject"],
+            date=row["date"].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row["date"], datetime) else row["date"]
+        )
+
+    @staticmethod
+    def fts_query(text: str) -> Optional[str]:
+        """
+        Превращает пользовательскую строку поиска в безопасный запрос FTS5: каждое слово
+        берется в кавычки (все слова обязательны), последнее ищется как префикс.
+        Возвращает None, если в строке нет слов.
+        """
+        words = re.findall(r"\w+", text)
+        if not words:
+            return None
+        terms = ['"' + word.replace('"', '""') + '"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    async def search_letters(
+            self, query: str, folder_name: Optional[str] = None, offset: int = 0, limit: int = 20
+    ) -> List[Dict]:
+        """
+        Полнотекстовый поиск по сохраненным письмам (отправитель, получатель, тема, открытый текст).
+        Результаты упорядочены по релевантности (bm25, совпадения в теме весят больше).
+
+        Args:
+            query (str): Строка поиска.
+            folder_name (Optional[str]): Искать только в этой папке (по умолчанию во всех).
+            offset (int): Смещение для пагинации.
+            limit (int): Количество результатов.
+
+        Returns:
+            List[Dict]: Письма с фрагментом текста, где найденные слова выделены <b>...</b>.
+        """
+        match = self.fts_query(query)
+        if match is None:
+            return []
+
+        values = {"match": match, "limit": limit, "offset": offset}
+        folder_filter = ""
+        if folder_name is not None:
+            folder_id = await self.get_folder_id(folder_name)
+            if folder_id is None:
+                return []
+            folder_filter = "AND l.folder_id = :folder_id"
+            values["folder_id"] = folder_id
+
+        rows = await self.reader.fetch_all(f"""
+        SELECT
+            l.id AS letter_id,
+            f.name AS folder_name,
+            fts.sender,
+            fts.subject,
+            l.date,
+            snippet(LettersFTS, -1, '<b>', '</b>', '…', 16) AS snippet
+        FROM LettersFTS fts
+        JOIN Letters l ON l.rowid = fts.rowid
+        JOIN Folders f ON f.id = l.folder_id
+        WHERE LettersFTS MATCH :match {folder_filter}
+        ORDER BY bm25(LettersFTS, 2.0, 1.0, 5.0, 1.0)
+        LIMIT :limit OFFSET :offset
+        """, values)
+
+        return [
+            {
+                "id": row["letter_id"],
+                "folder_name": row["folder_name"],
+                "sender": row["sender"],
+                "subject": row["subject"],
+                "date": row["date"],
+                "snippet": row["snippet"],
+            }
+            for row in rows
+        ]
+
+    async def get_folder_by_letter_id(self, letter_id: int):
+        """
+        Возвращает название папки для указанного письма по его ID.
+
+        :param letter_id: Идентификатор письма.
+        :return: Название папки или None, если письмо не найдено.
+        """
+        query = """
+        SELECT f.name AS folder_name
+        FROM Letters l
+        JOIN Folders f ON l.folder_id = f.id
+        WHERE l.id = :letter_id
+        """
+
+        row = await self.reader.fetch_one(query, {"letter_id": letter_id})
+        return row["folder_name"] if row else None
@@ -0,0 +1,66 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List
+
+from config import MAILBOX_MAX_OPEN
+
+
+class MailboxPool:
+    """
+    LRU открытых почтовых ящиков (MailStore) по адресу аккаунта.
+
+    Ящик открывается при первом обращении через open_mailbox. Когда открытых ящиков
+    больше max_open, закрываются давно не использовавшиеся; ящик, с которым сейчас
+    работает запрос, не закрывается, поэтому предел может ненадолго превышаться.
+    """
+
+    def __init__(self, open_mailbox: Callable[[str], Awaitable], max_open: int = MAILBOX_MAX_OPEN):
+        self.open_mailbox = open_mailbox
+        self.max_open = max(max_open, 1)
+        self._mailboxes: OrderedDict = OrderedDict()
+        self._users: Dict[str, int] = {}
+        self._opening: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def accounts(self) -> List[str]:
+        """Аккаунты с открытыми ящиками."""
+        return list(self._mailboxes)
+
+    @asynccontextmanager
+    async def acquire(self, account: str) -> AsyncIterator:
+        mailbox = self._mailboxes.get(account)
+        if mailbox is None:
+            # Один аккаунт открывается один раз, даже если запросы пришли одновременно
+            lock = self._opening.setdefault(account, asyncio.Lock())
+            async with lock:
+                mailbox = self._mailboxes.get(account)
+                if mailbox is None:
+                    mailbox = await self.open_mailbox(account)
+                    self._mailboxes[account] = mailbox
+            self._opening.pop(account, None)
+
+        self._mailboxes.move_to_end(account)
+        self._users[account] = self._users.get(account, 0) + 1
+        try:
+            yield mailbox
+        finally:
+            self._users[account] -= 1
+            if not self._users[account]:
+                del self._users[account]
+            await self._evict()
+
+    async def _evict(self):
+        """Закрывает давно не использовавшиеся ящики сверх max_open."""
+        while len(self._mailboxes) > self.max_open:
+            idle = next((account for account in self._mailboxes if account not in self._users), None)
+            if idle is None:
+                return
+            mailbox = self._mailboxes.pop(idle)
+            await mailbox.disconnect()
+
+    async def close(self):
+        """Закрывает все ящики."""
+        while self._mailboxes:
+            _, mailbox = self._mailboxes.popitem(last=False)
+            await mailbox.disconnect()
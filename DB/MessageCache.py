@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # Дисковый уровень кэша требует пакет cryptography
+    Fernet = None
+    InvalidToken = Exception
+
+from DB.credentials import load_or_create_key
+from config import MESSAGE_CACHE_MAX_BYTES, MESSAGE_CACHE_DIR, MESSAGE_CACHE_KEY_FILE
+
+
+class MessageCache:
+    """
+    Двухуровневый кэш расшифрованных писем.
+
+    Первый уровень - LRU в памяти, ограниченный суммарным размером писем.
+    Второй (необязательный) - файлы на диске, зашифрованные локальным ключом; файл ключа
+    должен лежать вне каталога кэша, иначе шифрование ничего не защищает.
+    Запись адресуется парой (аккаунт, папка, UID); UIDVALIDITY папки хранится вместе
+    с письмом и сверяется при чтении, так что после смены UIDVALIDITY запись не используется.
+    """
+
+    def __init__(self, max_bytes: int = MESSAGE_CACHE_MAX_BYTES, cache_dir: Optional[str] = MESSAGE_CACHE_DIR,
+                 key_file: str = MESSAGE_CACHE_KEY_FILE):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[Dict, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.cache_dir = None
+        self._fernet = None
+        if cache_dir:
+            if Fernet is None:
+                print("Пакет cryptography не установлен, дисковый уровень кэша писем отключен.")
+            elif self._is_inside(key_file, cache_dir):
+                print(f"Файл ключа {key_file} лежит в каталоге кэша {cache_dir}, дисковый уровень кэша писем отключен.")
+            else:
+                self.cache_dir = cache_dir
+                os.makedirs(cache_dir, exist_ok=True)
+                self._fernet = Fernet(load_or_create_key(key_file))
+
+    @staticmethod
+    def _is_inside(path: str, directory: str) -> bool:
+        """Лежит ли path внутри каталога directory."""
+        path, directory = os.path.realpath(path), os.path.realpath(directory)
+        return os.path.commonpath([path, directory]) == directory
+
+    @staticmethod
+    def _message_size(message: Dict) -> int:
+        """Приблизительный объем письма в памяти."""
+        body = message.get("body") or ""
+        return len(body) + sum(len(att["content"] or b"") for att in message.get("attachments", []))
+
+    def _disk_path(self, key: Tuple[str, str, int]) -> str:
+        digest = hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def get(self, account: str, folder_name: str, uid: int, uidvalidity: Optional[int]) -> Optional[Dict]:
+        """Возвращает расшифрованное письмо из кэша или None."""
+        message = self.lookup(account, folder_name, uid)
+        if message is None:
+            return None
+        if message["uidvalidity"] != uidvalidity:
+            self.invalidate(account, folder_name, uid)
+            return None
+        return message
+
+    def lookup(self, account: str, folder_name: str, uid: int) -> Optional[Dict]:
+        """
+        Возвращает письмо из кэша без сверки UIDVALIDITY (она в поле "uidvalidity") или None.
+        Позволяет не запрашивать UIDVALIDITY у сервера, когда проверять нечего.
+        """
+        key = (account, folder_name, int(uid))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        message = self._read_from_disk(key)
+        if message is not None:
+            # Поднимаем письмо с диска в память
+            self._put_in_memory(key, message)
+        return message
+
+    def put(self, account: str, folder_name: str, uid: int, uidvalidity: Optional[int], message: Dict):
+        """
+        Сохраняет расшифрованное письмо в кэш.
+
+        message: словарь с полями sender, to, subject, date, body и attachments
+        ([{"filename": имя, "content": байты}, ...]).
+        """
+        key = (account, folder_name, int(uid))
+        message = dict(message, uidvalidity=uidvalidity)
+        self._put_in_memory(key, message)
+        self._write_to_disk(key, message)
+
+    def invalidate(self, account: str, folder_name: str, uid: int):
+        """Удаляет письмо из обоих уровней кэша (при удалении или перемещении письма)."""
+        key = (account, folder_name, int(uid))
+        with self._lock:
+            self._pop(key)
+        self._remove_from_disk(key)
+
+    def _put_in_memory(self, key, message: Dict):
+        size = self._message_size(message)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (message, size)
+            self.current_bytes += size
+            # Вытесняем самые давно использованные письма
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def _write_to_disk(self, key, message: Dict):
+        if not self._fernet:
+            return
+
+        data = dict(message, attachments=[
+            {"filename": att["filename"], "content": base64.b64encode(att["content"] or b"").decode("ascii")}
+            for att in message.get("attachments", [])
+        ])
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            token = self._fernet.encrypt(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(token)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Не удалось записать письмо в дисковый кэш: {e}")
+
+    def _read_from_disk(self, key) -> Optional[Dict]:
+        if not self._fernet:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(self._fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, InvalidToken) as e:
+            print(f"Поврежденная запись дискового кэша {path}: {e}")
+            self._remove_from_disk(key)
+            return None
+
+        data["attachments"] = [
+            {"filename": att["filename"], "content": base64.b64decode(att["content"])}
+            for att in data.get("attachments", [])
+        ]
+        return data
+
+    def _remove_from_disk(self, key):
+        if not self._fernet:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except FileNotFoundError:
+            pass
@@ -1,127 +1,277 @@
-import io
+import asyncio
+import hashlib
 import json
+import os
+import secrets
+import textwrap
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import AsyncContextManager, AsyncIterator, Iterator, Optional, List, Dict, Tuple
 
-from databases import Database
 from fastapi import HTTPException
 
-from Models.models import SummaryEmailResponse
+from DB.BlobStore import BlobStore
+from DB.credentials import CredentialCipher
+from DB.KeyCache import KeyCache
+from DB.fingerprints import key_fingerprint
+from DB.MailStore import MailStore
+from DB.MailboxPool import MailboxPool
+from DB.SQLiteStore import SQLiteStore
+from DB.json_stream import iter_json_sections
+from DB.migrations import CATALOG_MIGRATIONS, drop_legacy_mail_tables, migrate, table_exists
+from config import BLOB_STORE_DIR, DEFAULT_EMAIL_USER, MAILBOX_DIR, MAILBOX_MAX_OPEN
 
 DATABASE_URL = "sqlite:///rsa_keys.db"
 
-class RSAKeyDatabase:
-    def __init__(self, database_url=DATABASE_URL):
-        self.database = Database(database_url)
+# Примерный размер фрагмента (в символах) при потоковом экспорте ключей
+EXPORT_CHUNK_SIZE = 64 * 1024
 
-    async def connect(self):
-        """Открыть подключение к базе данных."""
-        await self.database.connect()
+# Сколько ключей вставлять одним executemany при импорте
+IMPORT_BATCH_SIZE = 5000
+
+# Протоколы, учетные данные которых хранятся в сессии (префиксы столбцов Sessions)
+SESSION_PROTOCOLS = ("imap", "smtp")
+
+# Обязательные поля записей каждой секции файла импорта
+IMPORT_KEY_FIELDS = {
+    "public_keys": ("sender_email", "recipient_email", "public_key_sign", "public_key_encrypt"),
+    "private_keys": (
+        "sender_email", "recipient_email",
+        "private_key_sign", "public_key_sign", "private_key_encrypt", "public_key_encrypt",
+    ),
+}
+
+# Поля, по которым считается отпечаток ключа (уникальность ключей в паре адресов)
+KEY_FINGERPRINT_FIELDS = {
+    "public_keys": ("public_key_sign", "public_key_encrypt"),
+    "private_keys": ("private_key_sign", "private_key_encrypt"),
+}
+
+class RSAKeyDatabase(SQLiteStore):
+    """
+    Каталог: ключи, пул ключей и список аккаунтов. Письма каждого аккаунта хранятся
+    в отдельном почтовом ящике (MailStore) - своем файле базы с собственным писателем;
+    ящики открываются по требованию через mailbox() и держатся в LRU открытых файлов.
+    """
+
+    def __init__(self, database_url=DATABASE_URL, mailbox_dir=MAILBOX_DIR, max_open_mailboxes=MAILBOX_MAX_OPEN):
+        super().__init__(database_url)
+        self.mailbox_dir = mailbox_dir
+        self.mailboxes = MailboxPool(self._open_mailbox, max_open_mailboxes)
+
+        # Кэш ключей-кандидатов для пар адресов; сбрасывается при вставке ключей
+        self.key_cache = KeyCache()
+
+        # Шифрование паролей, сохраненных в сессиях
+        self.credentials = CredentialCipher()
 
     async def disconnect(self):
-        """Закрыть подключение к базе данных."""
+        """Закрыть подключение к базе данных и все открытые почтовые ящики."""
+        await self.mailboxes.close()
         await self.database.disconnect()
 
     async def create_tables(self):
-        """Создает таблицы с уникальными ограничениями для ключей и email-адресов."""
-        # Создаем таблицу Emails
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS Emails (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL
-        )
-        """)
-
-        # Создаем таблицу PrivateRSAKeys
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS PrivateRSAKeys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender_email_id INTEGER NOT NULL,
-            current_recipient_email_id INTEGER NOT NULL,
-            private_key_sign BLOB NOT NULL,
-            public_key_sign BLOB NOT NULL,
-            private_key_encrypt BLOB NOT NULL,
-            public_key_encrypt BLOB NOT NULL,
-            create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
-            UNIQUE (sender_email_id, current_recipient_email_id, private_key_sign, private_key_encrypt),
-            FOREIGN KEY (sender_email_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE 
-                ON UPDATE CASCADE,
-            FOREIGN KEY (current_recipient_email_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE 
-                ON UPDATE CASCADE
+        """Приводит схему базы данных к актуальной версии, применяя недостающие миграции."""
+        # Вложения, сохраненные до разделения на ящики, лежат в общем каталоге блобов
+        await migrate(self.database, CATALOG_MIGRATIONS, blob_store=BlobStore(BLOB_STORE_DIR))
+        await self.database.enable_incremental_vacuum()
+        await self.warm_identity_caches()
+
+    def mailbox(self, account: str) -> AsyncContextManager[MailStore]:
+        """
+        Почтовый ящик аккаунта; используется как async with db.mailbox(account) as mailbox.
+        Пока ящик используется, он не закрывается.
+        """
+        return self.mailboxes.acquire(account)
+
+    async def get_accounts(self) -> List[str]:
+        """Адреса всех аккаунтов, для которых заведены почтовые ящики."""
+        rows = await self.reader.fetch_all("SELECT email FROM Accounts ORDER BY id")
+        return [row["email"] for row in rows]
+
+    async def _open_mailbox(self, account: str) -> MailStore:
+        """
+        Открывает почтовый ящик аккаунта, при первом обращении создавая его файл.
+        Письма, сохраненные в общей базе до разделения, забирает ящик их получателя
+        (см. _legacy_mail_owner).
+        """
+        row = await self._claim_mailbox(account)
+        path, blob_dir = row["path"], row["blob_dir"]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        mailbox = MailStore(f"sqlite:///{path}", blob_dir)
+        await mailbox.connect()
+        try:
+            await mailbox.create_tables()
+            # Перенос повторяется при открытии, пока общая база не очищена, поэтому сбой
+            # между регистрацией ящика и переносом не теряет письма; повторные строки пропускаются
+            if blob_dir == BLOB_STORE_DIR and await self._has_legacy_mail():
+                moved = await mailbox.import_legacy_mail(self.database.path)
+                print(f"Письма из общей базы перенесены в ящик {account}: {moved}")
+                await self._drop_legacy_mail()
+        except Exception:
+            await mailbox.disconnect()
+            raise
+        return mailbox
+
+    async def _claim_mailbox(self, account: str):
+        """
+        Запись Accounts ящика; при первом обращении регистрирует ящик. Регистрация идет
+        в одной транзакции с выбором владельца общей почты, поэтому одновременные открытия
+        (в том числе из разных рабочих процессов) не забирают ее дважды.
+        """
+        query = "SELECT path, blob_dir FROM Accounts WHERE email = :email"
+        async with self.database.transaction():
+            row = await self.database.fetch_one(query, {"email": account})
+            if row is not None:
+                return row
+
+            directory = os.path.join(self.mailbox_dir, hashlib.sha256(account.lower().encode("utf-8")).hexdigest()[:32])
+            # Ящик, принявший общую почту, использует прежний каталог блобов
+            if await self._legacy_mail_owner() == account.lower():
+                blob_dir = BLOB_STORE_DIR
+            else:
+                blob_dir = os.path.join(directory, "blobs")
+            await self.database.execute(
+                """
+                INSERT INTO Accounts (email, path, blob_dir) VALUES (:email, :path, :blob_dir)
+                ON CONFLICT (email) DO NOTHING
+                """,
+                {"email": account, "path": os.path.join(directory, "mail.db"), "blob_dir": blob_dir},
+            )
+            return await self.database.fetch_one(query, {"email": account})
+
+    async def _legacy_mail_owner(self) -> Optional[str]:
+        """
+        Аккаунт (в нижнем регистре), которому достается почта из общей базы: получатель
+        большинства писем, а если среди получателей есть аккаунт по умолчанию - он.
+        None, если общих писем нет или владелец уже выбран.
+        """
+        claimed = await self.database.fetch_val(
+            "SELECT EXISTS (SELECT 1 FROM Accounts WHERE blob_dir = :blob_dir)", {"blob_dir": BLOB_STORE_DIR}
         )
-        """)
-
-        # Создаем таблицу PublicRSAKeys
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS PublicRSAKeys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            current_sender_email_id INTEGER NOT NULL,
-            recipient_email_id INTEGER NOT NULL,
-            public_key_sign BLOB NOT NULL,
-            public_key_encrypt BLOB NOT NULL,
-            create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
-            UNIQUE (current_sender_email_id, recipient_email_id, public_key_sign, public_key_encrypt),
-            FOREIGN KEY (current_sender_email_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE 
-                ON UPDATE CASCADE,
-            FOREIGN KEY (recipient_email_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE 
-                ON UPDATE CASCADE
+        if claimed or not await self._has_legacy_mail():
+            return None
+
+        rows = await self.database.fetch_all(
+            """
+            SELECT lower(e.email) AS email FROM Letters l
+            JOIN Emails e ON e.id = l.recipient_id
+            GROUP BY lower(e.email)
+            ORDER BY COUNT(*) DESC
+            """
         )
-        """)
+        recipients = [row["email"] for row in rows]
+        if not recipients:
+            return None
+        default_account = DEFAULT_EMAIL_USER.lower()
+        return default_account if default_account in recipients else recipients[0]
 
-        # Создаем таблицу Folders
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS Folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE -- Имя папки
+    async def _has_legacy_mail(self) -> bool:
+        """Остались ли в общей базе письма, сохраненные до разделения на ящики."""
+        return await table_exists(self.database, "Letters") and bool(
+            await self.database.fetch_val("SELECT EXISTS (SELECT 1 FROM Letters)")
         )
-        """)
-
-        # Создаем таблицу Letters
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS Letters (
-            id INTEGER NOT NULL,
-            folder_id INTEGER NOT NULL,
-            sender_id INTEGER NOT NULL,
-            recipient_id INTEGER NOT NULL,
-            to_name TEXT NOT NULL,
-            subject TEXT NOT NULL,
-            date DATETIME NOT NULL,
-            body BLOB NOT NULL,
-            PRIMARY KEY (id, folder_id),
-            FOREIGN KEY (folder_id) REFERENCES Folders (id) 
-                ON DELETE CASCADE ON UPDATE CASCADE,
-            FOREIGN KEY (sender_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE ON UPDATE CASCADE,
-            FOREIGN KEY (recipient_id) REFERENCES Emails (id) 
-                ON DELETE CASCADE ON UPDATE CASCADE
+
+    async def _drop_legacy_mail(self):
+        """Удаляет перенесенную в ящик почту вместе с таблицами писем из общей базы."""
+        async with self.database.transaction():
+            # Таблицы удаляются без сборки мусора: файлы блобов теперь принадлежат ящику
+            await drop_legacy_mail_tables(self.database)
+
+    def _session_values(self, protocol: str, account: Dict) -> Dict:
+        """Значения столбцов Sessions для учетной записи протокола (imap или smtp)."""
+        if protocol not in SESSION_PROTOCOLS:
+            raise ValueError(f"Unknown session protocol: {protocol}")
+        return {
+            f"{protocol}_user": account["email_user"],
+            f"{protocol}_pass": self.credentials.encrypt(account["email_pass"]),
+            f"{protocol}_server": account["server"],
+            f"{protocol}_port": account["port"],
+        }
+
+    async def create_session(self, imap: Dict, smtp: Dict, token: Optional[str] = None) -> str:
+        """
+        Создает сессию с учетными записями IMAP и SMTP (словари email_user, email_pass,
+        server, port). Если token задан и сессия уже есть, она не меняется.
+
+        Returns:
+            str: Токен сессии.
+        """
+        token = token or secrets.token_urlsafe(32)
+        values = {"token": token, **self._session_values("imap", imap), **self._session_values("smtp", smtp)}
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{column}" for column in values)
+        await self.database.execute(
+            f"INSERT OR IGNORE INTO Sessions ({columns}) VALUES ({placeholders})", values
         )
-        """)
-
-        # Создаем таблицу Files
-        await self.database.execute("""
-        CREATE TABLE IF NOT EXISTS Files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            letter_id INTEGER NOT NULL,
-            folder_id INTEGER NOT NULL,
-            file_name TEXT NOT NULL,
-            file_data BLOB NOT NULL,
-            FOREIGN KEY (letter_id, folder_id) REFERENCES Letters (id, folder_id) 
-                ON DELETE CASCADE
+        return token
+
+    async def get_session(self, token: str) -> Optional[Dict]:
+        """
+        Сессия по токену: {"token", "revision", "imap": {...}, "smtp": {...}} с расшифрованными
+        паролями. Возвращает None, если сессии нет или ее пароли не расшифровываются.
+        """
+        row = await self.reader.fetch_one("SELECT * FROM Sessions WHERE token = :token", {"token": token})
+        if row is None:
+            return None
+
+        session = {"token": row["token"], "revision": row["revision"]}
+        for protocol in SESSION_PROTOCOLS:
+            email_pass = self.credentials.decrypt(row[f"{protocol}_pass"])
+            if email_pass is None:
+                print(f"Не удалось расшифровать пароль {protocol} сессии: ключ сессий изменился")
+                return None
+            session[protocol] = {
+                "email_user": row[f"{protocol}_user"],
+                "email_pass": email_pass,
+                "server": row[f"{protocol}_server"],
+                "port": row[f"{protocol}_port"],
+            }
+        return session
+
+    async def update_session_account(self, token: str, protocol: str, account: Dict) -> bool:
+        """Меняет учетную запись протокола (imap или smtp) в сессии. Возвращает False, если сессии нет."""
+        values = self._session_values(protocol, account)
+        assignments = ", ".join(f"{column} = :{column}" for column in values)
+        updated = await self.database.execute(
+            f"""
+            UPDATE Sessions SET {assignments}, revision = revision + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE token = :token
+            """,
+            {**values, "token": token},
         )
-        """)
+        return updated > 0
+
+    async def delete_session(self, token: str) -> bool:
+        """Удаляет сессию. Возвращает False, если сессии нет."""
+        deleted = await self.database.execute("DELETE FROM Sessions WHERE token = :token", {"token": token})
+        return deleted > 0
+
+    async def get_email_id(self, email: str) -> Optional[int]:
+        """
+        ID адреса из кэша, а при промахе - из таблицы Emails (адрес мог добавить другой
+        рабочий процесс). Возвращает None, если адреса нет.
+        """
+        email_id = self.email_ids.get(email)
+        if email_id is None:
+            email_id = await self.reader.fetch_val("SELECT id FROM Emails WHERE email = :email", {"email": email})
+            if email_id is not None:
+                self.email_ids[email] = email_id
+        return email_id
 
     async def insert_email(self, email: str) -> int:
         """Вставляет email в таблицу Emails и возвращает ID."""
+        email_id = self.email_ids.get(email)
+        if email_id is not None:
+            return email_id
+
         query = "INSERT OR IGNORE INTO Emails (email) VALUES (:email)"
         await self.database.execute(query, {"email": email})
 
         select_query = "SELECT id FROM Emails WHERE email = :email"
         row = await self.database.fetch_one(select_query, {"email": email})
         if row:
+            self._remember_ids("Emails", {email: row["id"]})
             return row["id"]
         raise HTTPException(status_code=500, detail="Не удалось вставить email.")
 
@@ -147,24 +297,26 @@ class RSAKeyDatabase:
             sender_email_id, current_recipient_email_id, 
             private_key_sign, public_key_sign, 
             private_key_encrypt, public_key_encrypt, 
-            create_date
+            fingerprint, create_date
         ) 
         VALUES (
             :sender_id, :recipient_id, 
             :private_key_sign, :public_key_sign, 
             :private_key_encrypt, :public_key_encrypt, 
-            :create_date
+            :fingerprint, :create_date
         )
         """
-        return await self.database.execute(query, {
+        key_id = await self.database.execute(query, {
             "sender_id": sender_id,
             "recipient_id": recipient_id,
             "private_key_sign": private_key_sign,
             "public_key_sign": public_key_sign,
             "private_key_encrypt": private_key_encrypt,
             "public_key_encrypt": public_key_encrypt,
+            "fingerprint": key_fingerprint(private_key_sign, private_key_encrypt),
             "create_date": create_date,
         })
+        return key_id
 
     async def insert_public_keys(
             self,
@@ -185,21 +337,23 @@ class RSAKeyDatabase:
         INSERT INTO PublicRSAKeys (
             current_sender_email_id, recipient_email_id, 
             public_key_sign, public_key_encrypt, 
-            create_date
+            fingerprint, create_date
         ) 
         VALUES (
             :sender_id, :recipient_id, 
             :public_key_sign, :public_key_encrypt, 
-            :create_date
+            :fingerprint, :create_date
         )
         """
-        return await self.database.execute(query, {
+        key_id = await self.database.execute(query, {
             "sender_id": sender_id,
             "recipient_id": recipient_id,
             "public_key_sign": public_key_sign,
             "public_key_encrypt": public_key_encrypt,
+            "fingerprint": key_fingerprint(public_key_sign, public_key_encrypt),
             "create_date": create_date,
         })
+        return key_id
 
     async def get_current_public_keys(
             self, current_sender_email: str, recipient_email: str, date_limit: str = None
@@ -219,7 +373,7 @@ class RSAKeyDatabase:
             AND prk.create_date <= :date_limit
         ORDER BY prk.create_date DESC
         """
-        rows = await self.database.fetch_all(query, {
+        rows = await self.reader.fetch_all(query, {
             "sender_email": current_sender_email,
             "recipient_email": recipient_email,
             "date_limit": date_limit
@@ -234,35 +388,19 @@ class RSAKeyDatabase:
         if not date_limit:
             date_limit = self.get_current_date()
 
-        query = """
-        SELECT 
-            prk.private_key_encrypt AS recipient_private_key_encrypt,
-            pub.public_key_sign AS sender_public_key_sign
-        FROM PublicRSAKeys pub
-        JOIN Emails sender ON pub.current_sender_email_id = sender.id
-        JOIN Emails recipient ON pub.recipient_email_id = recipient.id
-        JOIN PrivateRSAKeys prk ON prk.current_recipient_email_id = recipient.id
-        WHERE 
-            sender.email = :sender_email 
-            AND recipient.email = :recipient_email 
-            AND pub.create_date <= :date_limit
-            AND prk.create_date <= :date_limit
-        ORDER BY pub.create_date DESC
-        """
-        rows = await self.database.fetch_all(query, {
-            "sender_email": sender_email,
-            "recipient_email": current_recipient_email,
-            "date_limit": date_limit
-        })
+        public_keys, private_keys = await self._get_key_candidates("decrypt", current_recipient_email, sender_email)
 
-        if rows:
-            return [
-                {
-                    "private_key_encrypt": row["recipient_private_key_encrypt"],
-                    "public_key_sign": row["sender_public_key_sign"],
-                }
-                for row in rows
-            ]
+        # Все сочетания ключей не позже date_limit: новые публичные ключи первыми
+        key_pairs = [
+            {
+                "private_key_encrypt": private_key["private_key_encrypt"],
+                "public_key_sign": public_key["public_key_sign"],
+            }
+            for public_key in public_keys if public_key["create_date"] <= date_limit
+            for private_key in private_keys if private_key["create_date"] <= date_limit
+        ]
+        if key_pairs:
+            return key_pairs
 
         raise HTTPException(status_code=404, detail="Для этой почты не было найдено ключей.")
 
@@ -275,36 +413,82 @@ class RSAKeyDatabase:
         if not date_limit:
             date_limit = self.get_current_date()
 
-        query = """
-        SELECT 
-            pub.public_key_encrypt AS recipient_public_key_encrypt,
-            prk.private_key_sign AS sender_private_key_sign
-        FROM PublicRSAKeys pub
-        JOIN Emails sender ON pub.current_sender_email_id = sender.id
-        JOIN Emails recipient ON pub.recipient_email_id = recipient.id
-        JOIN PrivateRSAKeys prk ON prk.sender_email_id = sender.id
-        WHERE 
-            sender.email = :sender_email 
-            AND recipient.email = :recipient_email 
-            AND pub.create_date <= :date_limit
-            AND prk.create_date <= :date_limit
-        ORDER BY pub.create_date DESC
-        LIMIT 1
-        """
-        row = await self.database.fetch_one(query, {
-            "sender_email": current_sender_email,
-            "recipient_email": recipient_email,
-            "date_limit": date_limit
-        })
+        public_keys, private_keys = await self._get_key_candidates("encrypt", current_sender_email, recipient_email)
 
-        if row:
+        public_key = next((key for key in public_keys if key["create_date"] <= date_limit), None)
+        private_key = next((key for key in private_keys if key["create_date"] <= date_limit), None)
+        if public_key and private_key:
             return {
-                "public_key_encrypt": row["recipient_public_key_encrypt"],
-                "private_key_sign": row["sender_private_key_sign"],
+                "public_key_encrypt": public_key["public_key_encrypt"],
+                "private_key_sign": private_key["private_key_sign"],
             }
 
         raise HTTPException(status_code=404, detail="Для этой почты не было найдено ключей.")
 
+    async def _get_key_candidates(self, purpose: str, self_email: str, peer_email: str):
+        """
+        Возвращает ключи-кандидаты для пары адресов, отсортированные от новых к старым:
+        (публичные ключи из PublicRSAKeys, приватные ключи из PrivateRSAKeys).
+        Списки берутся из кэша, если версия ключей в базе не менялась; фильтрация по дате
+        выполняется вызывающим методом. Пустые списки не кэшируются: ключи могут появиться
+        в другом рабочем процессе.
+
+        Для purpose="decrypt" self_email - получатель, peer_email - отправитель письма,
+        для purpose="encrypt" - наоборот.
+        """
+        cache_key = (purpose, self_email, peer_email)
+        version = await self.reader.fetch_val("SELECT version FROM KeyVersion WHERE id = 1")
+        candidates = self.key_cache.get(cache_key, version)
+        if candidates is not None:
+            return candidates
+
+        self_id = await self.get_email_id(self_email)
+        peer_id = await self.get_email_id(peer_email)
+
+        if self_id is None or peer_id is None:
+            return [], []
+
+        if purpose == "decrypt":
+            public_keys = await self.reader.fetch_all(
+                """
+                SELECT public_key_sign, create_date FROM PublicRSAKeys
+                WHERE current_sender_email_id = :peer_id AND recipient_email_id = :self_id
+                ORDER BY create_date DESC
+                """,
+                {"peer_id": peer_id, "self_id": self_id},
+            )
+            private_keys = await self.reader.fetch_all(
+                """
+                SELECT private_key_encrypt, create_date FROM PrivateRSAKeys
+                WHERE current_recipient_email_id = :self_id
+                ORDER BY create_date DESC
+                """,
+                {"self_id": self_id},
+            )
+            candidates = ([dict(row) for row in public_keys], [dict(row) for row in private_keys])
+        else:
+            public_keys = await self.reader.fetch_all(
+                """
+                SELECT public_key_encrypt, create_date FROM PublicRSAKeys
+                WHERE current_sender_email_id = :self_id AND recipient_email_id = :peer_id
+                ORDER BY create_date DESC
+                """,
+                {"self_id": self_id, "peer_id": peer_id},
+            )
+            private_keys = await self.reader.fetch_all(
+                """
+                SELECT private_key_sign, create_date FROM PrivateRSAKeys
+                WHERE sender_email_id = :self_id
+                ORDER BY create_date DESC
+                """,
+                {"self_id": self_id},
+            )
+            candidates = ([dict(row) for row in public_keys], [dict(row) for row in private_keys])
+
+        if candidates[0] or candidates[1]:
+            self.key_cache.put(cache_key, candidates, version)
+        return candidates
+
     async def get_last_insert_public_keys_date(self, current_sender_email, recipient_email):
         """Возвращает последнюю дату добавления публичного ключа для указанных email адрессов"""
 
@@ -321,7 +505,7 @@ class RSAKeyDatabase:
         LIMIT 1
         """
 
-        row = await self.database.fetch_one(query, {
+        row = await self.reader.fetch_one(query, {
             "sender_email": current_sender_email,
             "recipient_email": recipient_email
         })
@@ -344,25 +528,78 @@ class RSAKeyDatabase:
         LIMIT 1
         """
 
-        row = await self.database.fetch_one(query, {
+        row = await self.reader.fetch_one(query, {
             "sender_email": sender_email,
             "recipient_email": current_recipient_email
         })
 
         return datetime.fromisoformat(row["last_create_date"]) if row else None
 
+    async def add_pooled_key_pair(
+            self,
+            private_key_sign: bytes,
+            public_key_sign: bytes,
+            private_key_encrypt: bytes,
+            public_key_encrypt: bytes,
+    ):
+        """Добавляет заранее сгенерированный набор ключей в пул."""
+        query = """
+        INSERT INTO KeyPairPool (private_key_sign, public_key_sign, private_key_encrypt, public_key_encrypt)
+        VALUES (:private_key_sign, :public_key_sign, :private_key_encrypt, :public_key_encrypt)
+        """
+        return await self.database.execute(query, {
+            "private_key_sign": private_key_sign,
+            "public_key_sign": public_key_sign,
+            "private_key_encrypt": private_key_encrypt,
+            "public_key_encrypt": public_key_encrypt,
+        })
+
+    async def pop_pooled_key_pair(self) -> Optional[Dict]:
+        """Извлекает из пула самый старый набор ключей. Возвращает None, если пул пуст."""
+        select_query = """
+        SELECT id, private_key_sign, public_key_sign, private_key_encrypt, public_key_encrypt
+        FROM KeyPairPool
+        ORDER BY id
+        LIMIT 1
+        """
+        delete_query = "DELETE FROM KeyPairPool WHERE id = :id"
+
+        while True:
+            row = await self.database.fetch_one(select_query)
+            if not row:
+                return None
+
+            # Набор мог забрать параллельный запрос - тогда пробуем следующий
+            if await self.database.execute(delete_query, {"id": row["id"]}):
+                return {
+                    "private_key_sign": row["private_key_sign"],
+                    "public_key_sign": row["public_key_sign"],
+                    "private_key_encrypt": row["private_key_encrypt"],
+                    "public_key_encrypt": row["public_key_encrypt"],
+                }
+
+    async def count_pooled_key_pairs(self) -> int:
+        """Возвращает количество наборов ключей в пуле."""
+        return await self.database.fetch_val("SELECT COUNT(*) FROM KeyPairPool")
+
     async def get_emails(self):
         """Возвращает список всех email из таблицы Emails."""
         query = "SELECT email FROM Emails"
-        rows = await self.database.fetch_all(query)
+        rows = await self.reader.fetch_all(query)
         return [row["email"] for row in rows] if rows else []
 
     def get_current_date(self):
         """Возвращает текущую дату и время."""
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    async def export_keys_to_file(self):
-        """Экспорт всех ключей в JSON-файл с использованием email-адресов и возврат файла в памяти."""
+    async def export_keys(self, account: str) -> AsyncIterator[bytes]:
+        """
+        Экспорт ключей аккаунта (account - отправитель или получатель) в JSON с использованием email-адресов.
+
+        JSON отдается фрагментами по мере чтения строк курсором, поэтому потребление памяти
+        не зависит от количества ключей. Структура документа прежняя:
+        {"public_keys": [...], "private_keys": [...]}.
+        """
         # Получение публичных ключей
         public_query = """
         SELECT 
@@ -374,13 +611,8 @@ class RSAKeyDatabase:
         FROM PublicRSAKeys pub
         JOIN Emails sender ON pub.current_sender_email_id = sender.id
         JOIN Emails recipient ON pub.recipient_email_id = recipient.id
+        WHERE sender.email = :account OR recipient.email = :account
         """
-        public_rows = await self.database.fetch_all(public_query)
-        public_keys = [
-            {key: (value.decode("utf-8") if isinstance(value, bytes) else value)
-             for key, value in dict(row).items()}
-            for row in public_rows
-        ]
 
         # Получение приватных ключей
         private_query = """
@@ -395,426 +627,185 @@ class RSAKeyDatabase:
         FROM PrivateRSAKeys priv
         JOIN Emails sender ON priv.sender_email_id = sender.id
         JOIN Emails recipient ON priv.current_recipient_email_id = recipient.id
+        WHERE sender.email = :account OR recipient.email = :account
         """
-        private_rows = await self.database.fetch_all(private_query)
-        private_keys = [
-            {key: (value.decode("utf-8") if isinstance(value, bytes) else value)
-             for key, value in dict(row).items()}
-            for row in private_rows
-        ]
 
         # Формируем JSON с двумя массивами
-        data = {
-            "public_keys": public_keys,
-            "private_keys": private_keys,
-        }
-
-        # Создаем JSON-строку и записываем ее в BytesIO
-        file_obj = io.BytesIO()
-        json_data = json.dumps(data, ensure_ascii=False, indent=4)
-        file_obj.write(json_data.encode("utf-8"))  # Кодируем строку в байты
-        file_obj.seek(0)  # Сбрасываем указатель на начало файла
-
-        return file_obj
-
-    async def import_keys_from_file(self, file_obj):
-        """Импорт ключей из JSON-файла с использованием email-адресов."""
-        # Загружаем содержимое файла
-        file_obj.seek(0)
-        data = json.load(file_obj)
-
-        added_public_count = 0
-        added_private_count = 0
-
-        # Импорт публичных ключей
-        for key in data.get("public_keys", []):
-            try:
-                await self.insert_public_keys(
-                    current_sender_email=key["sender_email"],
-                    recipient_email=key["recipient_email"],
-                    public_key_sign=key["public_key_sign"].encode("utf-8") if key.get("public_key_sign") else None,
-                    public_key_encrypt=key["public_key_encrypt"].encode("utf-8") if key.get(
-                        "public_key_encrypt") else None,
-                    create_date=key.get("create_date"),
-                )
-                added_public_count += 1
-            except Exception as e:
-                print(f"Ошибка при добавлении публичного ключа: {e}")
-
-        # Импорт приватных ключей
-        for key in data.get("private_keys", []):
-            try:
-                await self.insert_private_keys(
-                    sender_email=key["sender_email"],
-                    current_recipient_email=key["recipient_email"],
-                    private_key_sign=key["private_key_sign"].encode("utf-8") if key.get("private_key_sign") else None,
-                    public_key_sign=key["public_key_sign"].encode("utf-8") if key.get("public_key_sign") else None,
-                    private_key_encrypt=key["private_key_encrypt"].encode("utf-8") if key.get(
-                        "private_key_encrypt") else None,
-                    public_key_encrypt=key["public_key_encrypt"].encode("utf-8") if key.get(
-                        "public_key_encrypt") else None,
-                    create_date=key.get("create_date"),
-                )
-                added_private_count += 1
-            except Exception as e:
-                print(f"Ошибка при добавлении приватного ключа: {e}")
-
-        return f"Импортировано {added_public_count} публичных ключей и {added_private_count} приватных ключей."
-
-    async def add_letter(
-            self,
-            folder_name: str,
-            sender: str,
-            recipient: str,
-            to_name: str,
-            subject: str,
-            date: datetime,
-            body: bytes,
-            attachments: List[Dict[str, bytes]],
-            letter_id: int,  # ID письма теперь обязательное
-    ):
-        """Добавляет новое письмо в указанную папку с обязательными параметрами ID письма и папки."""
-
-        # Получаем или создаём папку
-        folder_query = "SELECT id FROM Folders WHERE name = :name"
-        folder = await self.database.fetch_one(folder_query, {"name": folder_name})
-        if not folder:
-            folder_insert = "INSERT INTO Folders (name) VALUES (:name)"
-            await self.database.execute(folder_insert, {"name": folder_name})
-            folder = await self.database.fetch_one(folder_query, {"name": folder_name})
-
-        folder_id = folder["id"]
-
-        # Получаем ID отправителя и получателя
-        sender_id = await self.insert_email(sender)
-        recipient_id = await self.insert_email(recipient)
-
-        # Проверяем, нет ли письма с таким ID в папке
-        check_query = "SELECT 1 FROM Letters WHERE id = :id AND folder_id = :folder_id"
-        existing_letter = await self.database.fetch_one(check_query, {"id": letter_id, "folder_id": folder_id})
-        if existing_letter:
-            # raise Exception("A letter with this ID already exists in the folder.")
-            return None
-
-        # Добавляем письмо
-        insert_letter_query = """
-        INSERT INTO Letters (id, folder_id, sender_id, recipient_id, to_name, subject, date, body)
-        VALUES (:id, :folder_id, :sender_id, :recipient_id, :to_name, :subject, :date, :body)
-        """
-        await self.database.execute(
-            insert_letter_query,
-            {
-                "id": letter_id,
-                "folder_id": folder_id,
-                "sender_id": sender_id,
-                "recipient_id": recipient_id,
-                "to_name": to_name,
-                "subject": subject,
-                "date": date,
-                "body": body,
-            },
-        )
-
-        # Добавляем вложения
-        if attachments:
-            insert_file_query = """
-            INSERT INTO Files (letter_id, folder_id, file_name, file_data)
-            VALUES (:letter_id, :folder_id, :file_name, :file_data)
-            """
-            for attachment in attachments:
-                await self.database.execute(
-                    insert_file_query,
-                    {
-                        "letter_id": letter_id,
-                        "folder_id": folder_id,  # Указываем также folder_id для внешнего ключа
-                        "file_name": attachment["filename"],
-                        "file_data": attachment["content"],
-                    },
-                )
-
-    async def get_email_from_db(self, email_id: int, folder_name: str) -> Optional[Dict]:
-        """Получает письмо и вложения из базы данных по ID письма и имени папки."""
-        # Получаем ID папки по имени
-        folder_query = "SELECT id FROM Folders WHERE name = :folder_name"
-        folder = await self.database.fetch_one(folder_query, {"folder_name": folder_name})
-        if not folder:
-            return None
-
-        folder_id = folder["id"]
-
-        # Получаем письмо из таблицы Letters
-        query = """
-        SELECT 
-            l.id AS email_id,
-            e1.email AS sender,
-            e2.email AS recipient,
-            l.to_name,
-            l.subject,
-            l.date,
-            l.body
-        FROM Letters l
-        JOIN Emails e1 ON l.sender_id = e1.id
-        JOIN Emails e2 ON l.recipient_id = e2.id
-        WHERE l.id = :email_id AND l.folder_id = :folder_id
-        """
-        letter = await self.database.fetch_one(query, {"email_id": email_id, "folder_id": folder_id})
-        if not letter:
-            return None
-
-        # Получаем вложения из таблицы Files
-        attachments_query = """
-        SELECT file_name, file_data 
-        FROM Files 
-        WHERE letter_id = :email_id AND folder_id = :folder_id
-        """
-        attachments = await self.database.fetch_all(attachments_query, {"email_id": email_id, "folder_id": folder_id})
-
-        # Возвращаем результат в виде словаря
-        return {
-            "id": letter["email_id"],
-            "sender": letter["sender"],
-            "recipient": letter["recipient"],
-            "to": letter["to_name"],
-            "subject": letter["subject"],
-            "date": letter["date"],
-            "body": letter["body"],
-            "attachments": [
-                {"filename": attachment["file_name"], "content": attachment["file_data"]} for attachment in attachments
-            ],
-        }
-
-    async def add_or_get_folder_id(self, folder_name: str) -> int:
+        buffer, buffered = ["{"], 1
+        for index, (section, query) in enumerate((("public_keys", public_query), ("private_keys", private_query))):
+            buffer.append(f'{"," if index else ""}\n    "{section}": [')
+            separator = "\n"
+            async for row in self.reader.iterate(query, {"account": account}):
+                key = {name: (value.decode("utf-8") if isinstance(value, bytes) else value)
+                       for name, value in dict(row).items()}
+                fragment = separator + textwrap.indent(json.dumps(key, ensure_ascii=False, indent=4), " " * 8)
+                buffer.append(fragment)
+                buffered += len(fragment)
+                separator = ",\n"
+
+                # Отдаем накопленные фрагменты примерно по EXPORT_CHUNK_SIZE символов
+                if buffered >= EXPORT_CHUNK_SIZE:
+                    yield "".join(buffer).encode("utf-8")
+                    buffer, buffered = [], 0
+            buffer.append("]" if separator == "\n" else "\n    ]")
+        buffer.append("\n}\n")
+        yield "".join(buffer).encode("utf-8")
+
+    async def import_keys_from_file(self, file_obj, account: str) -> Dict[str, Dict[str, int]]:
         """
-        Добавляет папку в таблицу Folders, если её ещё нет, и возвращает её ID.
-        Если папка уже существует, просто возвращает её ID.
+        Импорт ключей аккаунта из JSON-файла с использованием email-адресов.
 
-        Args:
-            folder_name (str): Название папки.
+        Файл читается и разбирается потоково в отдельном потоке, чтобы чтение, распаковка
+        и разбор не блокировали цикл событий. Ключи вставляются пачками через executemany
+        (INSERT ... ON CONFLICT DO NOTHING), каждая пачка - в своей транзакции, поэтому
+        писатель не занят на все время импорта. При ошибке разбора уже вставленные пачки
+        остаются; повторный импорт того же файла пропускает их как дубликаты.
+        Записи без обязательных полей считаются некорректными. Записи, в которых account
+        не отправитель и не получатель, отклоняются.
 
         Returns:
-            int: ID папки.
+            dict: Для "public_keys" и "private_keys" - количество вставленных (inserted),
+            пропущенных дубликатов (skipped), некорректных (invalid) и отклоненных (rejected) записей.
         """
-        query_select = """
-        SELECT id FROM Folders WHERE name = :folder_name
-        """
-        query_insert = """
-        INSERT INTO Folders (name) VALUES (:folder_name)
-        """
-        try:
-            # Проверяем, существует ли папка
-            result = await self.database.fetch_one(query_select, {"folder_name": folder_name})
-            if result:
-                return result["id"]
-
-            # Если папки нет, добавляем её
-            folder_id = await self.database.execute(query_insert, {"folder_name": folder_name})
-
-            return folder_id
-        except Exception as e:
-            raise ValueError(f"Ошибка при добавлении или получении папки '{folder_name}': {e}")
-
-    async def move_letter(self, letter_id: int, source_folder_name: str, target_folder_name: str):
-        """
-        Перемещает указанное письмо из одной папки в другую, а также перепривязывает все файлы,
-        связанные с этим письмом, в новую папку.
-
-        Args:
-            letter_id (int): ID письма.
-            source_folder_name (str): Имя папки, из которой перемещается письмо.
-            target_folder_name (str): Имя папки, в которую перемещается письмо.
-
-        Raises:
-            ValueError: Если письмо или папка не найдены.
-        """
-        # Получаем ID исходной папки
-        source_folder_id = await self.add_or_get_folder_id(source_folder_name)
-        if not source_folder_id:
-            raise ValueError(f"Source folder '{source_folder_name}' does not exist.")
-
-        # Получаем ID целевой папки
-        target_folder_id = await self.add_or_get_folder_id(target_folder_name)
-
-        # Проверяем, что письмо существует в исходной папке
-        letter_exists = await self.database.fetch_val(
-            "SELECT 1 FROM Letters WHERE id = :letter_id AND folder_id = :folder_id",
-            {"letter_id": letter_id, "folder_id": source_folder_id}
-        )
-        if not letter_exists:
-            raise ValueError(f"Letter with ID {letter_id} does not exist in folder '{source_folder_name}'.")
-
-        # Получаем все файлы, связанные с этим письмом в исходной папке
-        await self.database.execute(
-            "UPDATE Files SET folder_id = :target_folder_id WHERE letter_id = :letter_id AND folder_id = :source_folder_id",
-            {"target_folder_id": target_folder_id, "letter_id": letter_id, "source_folder_id": source_folder_id}
-        )
-
-        # Обновляем папку для письма
-        await self.database.execute(
-            "UPDATE Letters SET folder_id = :target_folder_id WHERE id = :letter_id AND folder_id = :source_folder_id",
-            {"target_folder_id": target_folder_id, "letter_id": letter_id, "source_folder_id": source_folder_id}
-        )
-
-    async def delete_letter(self, letter_id: int, folder_name: str):
+        file_obj.seek(0)
+        stats = {section: {"inserted": 0, "skipped": 0, "invalid": 0, "rejected": 0} for section in IMPORT_KEY_FIELDS}
+        batches = self._iter_import_batches(file_obj, account, stats)
+
+        while True:
+            # Генератор возобновляется в потоке пула, но всегда последовательно
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            section, rows = batch
+            async with self.database.transaction():
+                await self._import_keys_batch(section, rows, stats[section])
+
+        return stats
+
+    def _iter_import_batches(
+            self, file_obj, account: str, stats: Dict[str, Dict[str, int]]
+    ) -> Iterator[Tuple[str, List[Dict]]]:
         """
-        Удаляет указанное письмо из указанной папки, а также все вложения, связанные с этим письмом.
-
-        Args:
-            letter_id (int): ID письма.
-            folder_name (str): Имя папки.
-
-        Raises:
-            ValueError: Если письмо или папка не найдены.
+        Разбирает файл импорта и выдает пачки (секция, строки) до IMPORT_BATCH_SIZE ключей:
+        ключевой материал уже закодирован и снабжен отпечатком, остается подставить ID адресов.
+        Некорректные и отклоненные записи только учитываются в stats.
         """
-        # Получаем ID папки
-        folder_id = await self.database.fetch_val(
-            "SELECT id FROM Folders WHERE name = :name",
-            {"name": folder_name}
-        )
-        if not folder_id:
-            raise ValueError(f"Folder '{folder_name}' does not exist.")
-
-        # Удаляем все файлы, связанные с письмом в указанной папке
-        await self.database.execute(
-            "DELETE FROM Files WHERE letter_id = :letter_id AND folder_id = :folder_id",
-            {"letter_id": letter_id, "folder_id": folder_id}
-        )
-
-        # Удаляем письмо из папки
-        result = await self.database.execute(
-            "DELETE FROM Letters WHERE id = :letter_id AND folder_id = :folder_id",
-            {"letter_id": letter_id, "folder_id": folder_id}
+        current_date = self.get_current_date()
+        batches = {section: [] for section in IMPORT_KEY_FIELDS}
+        for section, key in iter_json_sections(file_obj):
+            fields = IMPORT_KEY_FIELDS.get(section)
+            if fields is None:
+                continue
+
+            if not isinstance(key, dict) or not all(
+                    isinstance(key.get(field), str) and key[field] for field in fields
+            ):
+                stats[section]["invalid"] += 1
+                continue
+
+            if account not in (key["sender_email"], key["recipient_email"]):
+                stats[section]["rejected"] += 1
+                continue
+
+            row = {
+                "sender_email": key["sender_email"],
+                "recipient_email": key["recipient_email"],
+                "create_date": key.get("create_date") or current_date,
+            }
+            for field in fields[2:]:
+                row[field] = key[field].encode("utf-8")
+            row["fingerprint"] = key_fingerprint(*(row[field] for field in KEY_FINGERPRINT_FIELDS[section]))
+            batches[section].append(row)
+            if len(batches[section]) >= IMPORT_BATCH_SIZE:
+                yield section, batches[section]
+                batches[section] = []
+
+        for section, batch in batches.items():
+            if batch:
+                yield section, batch
+
+    async def _import_keys_batch(self, section: str, rows: List[Dict], stats: Dict[str, int]):
+        """Вставляет пачку ключей одной секции импорта (из _iter_import_batches) и обновляет счетчики."""
+        email_ids = await self._resolve_ids(
+            "Emails", "email", {row[field] for row in rows for field in ("sender_email", "recipient_email")}
         )
-        if result == 0:
-            raise ValueError(f"Letter with ID {letter_id} does not exist in folder '{folder_name}'.")
 
-    async def get_emails_summary_from_db(
-            self, folder_name: str, offset: Optional[int] = None, limit: Optional[int] = None
-    ) -> List[SummaryEmailResponse]:
-        """
-        Возвращает список краткой информации о письмах из указанной папки.
-
-        Args:
-            folder_name (str): Имя папки.
-            offset (Optional[int]): Смещение для пагинации (по умолчанию None).
-            limit (Optional[int]): Лимит количества возвращаемых писем (по умолчанию None).
-
-        Returns:
-            List[SummaryEmailResponse]: Список писем.
-        """
-        query = """
-        SELECT 
-            l.id AS letter_id,
-            e.email AS sender_email,
-            l.subject,
-            l.date
-        FROM Letters l
-        INNER JOIN Folders f ON l.folder_id = f.id
-        INNER JOIN Emails e ON l.sender_id = e.id
-        WHERE f.name = :folder_name
-        ORDER BY l.date DESC
-        """
-
-        # Дополняем запрос LIMIT и OFFSET только если они указаны
-        if limit is not None:
-            query += " LIMIT :limit"
-        if offset is not None:
-            query += " OFFSET :offset"
-
-        # Подготовка параметров запроса
-        values = {"folder_name": folder_name}
-        if limit is not None:
-            values["limit"] = limit
-        if offset is not None:
-            values["offset"] = offset
-
-        # Выполняем запрос
-        rows = await self.database.fetch_all(query, values)
-
-        # Формируем список SummaryEmailResponse
-        return [
-            SummaryEmailResponse(
-                id=row["letter_id"],
-                sender=row["sender_email"],
-                subject=row["subject"],
-                date=row["date"].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row["date"], datetime) else row["date"]
+        if section == "public_keys":
+            query = """
+            INSERT INTO PublicRSAKeys (
+                current_sender_email_id, recipient_email_id,
+                public_key_sign, public_key_encrypt,
+                fingerprint, create_date
             )
+            VALUES (
+                :sender_id, :recipient_id,
+                :public_key_sign, :public_key_encrypt,
+                :fingerprint, :create_date
+            )
+            ON CONFLICT DO NOTHING
+            """
+        else:
+            query = """
+            INSERT INTO PrivateRSAKeys (
+                sender_email_id, current_recipient_email_id,
+                private_key_sign, public_key_sign,
+                private_key_encrypt, public_key_encrypt,
+                fingerprint, create_date
+            )
+            VALUES (
+                :sender_id, :recipient_id,
+                :private_key_sign, :public_key_sign,
+                :private_key_encrypt, :public_key_encrypt,
+                :fingerprint, :create_date
+            )
+            ON CONFLICT DO NOTHING
+            """
+
+        values = [
+            {
+                **{field: value for field, value in row.items() if field not in ("sender_email", "recipient_email")},
+                "sender_id": email_ids[row["sender_email"]],
+                "recipient_id": email_ids[row["recipient_email"]],
+            }
             for row in rows
         ]
 
-    async def get_related_emails_and_dates(self, current_email: str) -> List[Dict]:
-        """Возвращает список всех второстепенных почт и дат для публичных и приватных ключей для текущего email, сортируя по приватным ключам."""
+        # executemany возвращает суммарное число вставленных строк; конфликты его не увеличивают
+        inserted = await self.database.execute_many(query, values)
+        stats["inserted"] += inserted
+        stats["skipped"] += len(values) - inserted
 
-        query = """
-        WITH RecipientEmails AS (
-            SELECT e.id, e.email
-            FROM Emails e
-            WHERE e.email != :current_email
-        ),
-        PrivateKeys AS (
-            SELECT pk.current_recipient_email_id, MAX(pk.create_date) AS last_private_key_update
-            FROM PrivateRSAKeys pk
-            JOIN RecipientEmails re ON pk.current_recipient_email_id = re.id
-            JOIN Emails e ON pk.sender_email_id = e.id
-            WHERE e.email = :current_email
-            GROUP BY pk.current_recipient_email_id
-        ),
-        PublicKeys AS (
-            SELECT pk.recipient_email_id, MAX(pk.create_date) AS last_public_key_update
-            FROM PublicRSAKeys pk
-            JOIN RecipientEmails re ON pk.recipient_email_id = re.id
-            JOIN Emails e ON pk.current_sender_email_id = e.id
-            WHERE e.email = :current_email
-            GROUP BY pk.recipient_email_id
-        )
-        SELECT re.email AS related_email,
-               pk.last_private_key_update,
-               pub.last_public_key_update
-        FROM RecipientEmails re
-        LEFT JOIN PrivateKeys pk ON re.id = pk.current_recipient_email_id
-        LEFT JOIN PublicKeys pub ON re.id = pub.recipient_email_id
-        ORDER BY 
-            CASE 
-                WHEN pk.last_private_key_update IS NULL THEN 1 
-                ELSE 0 
-            END, 
-            pk.last_private_key_update ASC;
-        """
-
-        rows = await self.database.fetch_all(query, {"current_email": current_email})
-
-        result = []
-        for row in rows:
-            result.append({
-                "related_email": row["related_email"],
-                "last_public_key_date": row["last_public_key_update"] if row[
-                                                                             "last_public_key_update"] is not None else None,
-                "last_private_key_date": row["last_private_key_update"] if row[
-                                                                               "last_private_key_update"] is not None else None,
-            })
-
-        return result
-
-    async def get_folder_by_letter_id(self, letter_id: int):
+    async def get_related_emails_and_dates(self, current_email: str) -> List[Dict]:
         """
-        Возвращает название папки для указанного письма по его ID.
-
-        :param letter_id: Идентификатор письма.
-        :return: Название папки или None, если письмо не найдено.
+        Возвращает список всех второстепенных почт и дат для публичных и приватных ключей для текущего email,
+        сортируя по приватным ключам. Даты берутся из KeyPairSummary по первичному ключу пары,
+        без агрегации по истории ключей.
         """
         query = """
-        SELECT f.name AS folder_name
-        FROM Letters l
-        JOIN Folders f ON l.folder_id = f.id
-        WHERE l.id = :letter_id
+        SELECT e.email AS related_email,
+               s.last_private_key_date,
+               s.last_public_key_date
+        FROM Emails e
+        LEFT JOIN KeyPairSummary s ON s.self_email_id = :self_id AND s.peer_email_id = e.id
+        WHERE e.email != :current_email
+        ORDER BY s.last_private_key_date IS NULL, s.last_private_key_date ASC
         """
 
-        row = await self.database.fetch_one(query, {"letter_id": letter_id})
-        return row["folder_name"] if row else None
+        self_id = await self.get_email_id(current_email)
+        rows = await self.reader.fetch_all(query, {"self_id": self_id, "current_email": current_email})
+
+        return [
+            {
+                "related_email": row["related_email"],
+                "last_public_key_date": row["last_public_key_date"],
+                "last_private_key_date": row["last_private_key_date"],
+            }
+            for row in rows
+        ]
 
 
 if __name__ == "__main__":
 
-    import asyncio
     import base64
 
     async def insert_test_data(db, sender_email, recipient_email, keys_base64_str):
@@ -0,0 +1,276 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import aiosqlite
+
+from config import (
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, SQLITE_READ_POOL_SIZE,
+)
+
+
+def database_path(database_url: str) -> str:
+    """Путь к файлу базы из URL вида sqlite:///rsa_keys.db."""
+    return urlsplit(database_url).path[1:] or ":memory:"
+
+
+class ReadPool:
+    """Пул соединений только для чтения. В режиме WAL читатели не ждут писателя."""
+
+    def __init__(self, connections: List[aiosqlite.Connection]):
+        self._connections = connections
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for connection in connections:
+            self._idle.put_nowait(connection)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def fetch_all(self, query: str, values: Optional[Dict] = None) -> List[sqlite3.Row]:
+        async with self.connection() as connection:
+            return list(await connection.execute_fetchall(query, values or {}))
+
+    async def fetch_one(self, query: str, values: Optional[Dict] = None) -> Optional[sqlite3.Row]:
+        async with self.connection() as connection:
+            async with connection.execute(query, values or {}) as cursor:
+                return await cursor.fetchone()
+
+    async def fetch_val(self, query: str, values: Optional[Dict] = None, column: Any = 0) -> Any:
+        row = await self.fetch_one(query, values)
+        return row[column] if row is not None else None
+
+    async def iterate(self, query: str, values: Optional[Dict] = None) -> AsyncIterator[sqlite3.Row]:
+        async with self.connection() as connection:
+            async with connection.execute(query, values or {}) as cursor:
+                async for row in cursor:
+                    yield row
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+
+
+class SQLiteDatabase:
+    """
+    Слой подключения к SQLite: одно соединение-писатель и пул соединений только для чтения.
+
+    Методы execute/fetch_*/iterate/transaction повторяют интерфейс databases.Database
+    и выполняются на соединении-писателе; запросы, которым не нужны собственные
+    незафиксированные изменения, можно направлять в пул читателей (атрибут reader).
+    Каждое соединение настраивается прагмами: WAL, synchronous=NORMAL, размер кэша,
+    mmap, busy_timeout и foreign_keys=ON. Функции из functions (имя, число аргументов,
+    функция) регистрируются на каждом соединении, поэтому доступны и в триггерах.
+    """
+
+    def __init__(
+            self, database_url: str, read_pool_size: int = SQLITE_READ_POOL_SIZE,
+            functions: Sequence[Tuple[str, int, Callable]] = (),
+    ):
+        self.path = database_path(database_url)
+        self.read_pool_size = read_pool_size
+        self.functions = list(functions)
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.reader: Optional[ReadPool] = None
+        self._write_lock = asyncio.Lock()
+        self._lock_owner: Optional[asyncio.Task] = None
+        self._transaction_depth = 0
+        self._commit_callbacks: List[Callable[[], None]] = []
+        self._rollback_callbacks: List[Callable[[], None]] = []
+
+    @property
+    def is_connected(self) -> bool:
+        return self.writer is not None
+
+    async def _open(self, read_only: bool) -> aiosqlite.Connection:
+        if read_only:
+            connection = await aiosqlite.connect(f"file:{self.path}?mode=ro", uri=True, isolation_level=None)
+        else:
+            connection = await aiosqlite.connect(self.path, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+
+        await connection.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        await connection.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")
+        await connection.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        await connection.execute("PRAGMA temp_store = MEMORY")
+        for name, num_params, function in self.functions:
+            await connection.create_function(name, num_params, function, deterministic=True)
+        if read_only:
+            await connection.execute("PRAGMA query_only = ON")
+        else:
+            # Действует сразу только для новой базы; существующую переводит enable_incremental_vacuum
+            await connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await connection.execute("PRAGMA journal_mode = WAL")
+            await connection.execute("PRAGMA synchronous = NORMAL")
+            await connection.execute("PRAGMA foreign_keys = ON")
+        return connection
+
+    async def connect(self):
+        if self.is_connected:
+            return
+
+        self.writer = await self._open(read_only=False)
+
+        # База в памяти не разделяется между соединениями - читаем через писателя
+        if self.path == ":memory:" or self.read_pool_size <= 0:
+            self.reader = ReadPool([])
+            self.reader.connection = self._writer_connection
+        else:
+            self.reader = ReadPool([await self._open(read_only=True) for _ in range(self.read_pool_size)])
+
+    async def disconnect(self):
+        if not self.is_connected:
+            return
+
+        await self.reader.close()
+        try:
+            # Переносим WAL в основной файл, чтобы он не рос между запусками
+            await self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            await self.writer.close()
+            self.writer = None
+            self.reader = None
+
+    @asynccontextmanager
+    async def _writer_connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Захватывает соединение-писатель. Повторный захват той же задачей не блокируется."""
+        task = asyncio.current_task()
+        if self._lock_owner is task:
+            yield self.writer
+            return
+
+        async with self._write_lock:
+            self._lock_owner = task
+            try:
+                yield self.writer
+            finally:
+                self._lock_owner = None
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator["SQLiteDatabase"]:
+        """
+        Транзакция на соединении-писателе. Вложенные транзакции той же задачи
+        оформляются точками сохранения.
+        """
+        async with self._writer_connection() as connection:
+            depth = self._transaction_depth
+            savepoint = f"sp_{depth}"
+            callbacks_count = len(self._commit_callbacks)
+            rollback_callbacks_count = len(self._rollback_callbacks)
+            await connection.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                # Изменения отменены - обработчики фиксации этой транзакции не нужны
+                del self._commit_callbacks[callbacks_count:]
+                rollback_callbacks = self._rollback_callbacks[rollback_callbacks_count:]
+                del self._rollback_callbacks[rollback_callbacks_count:]
+                try:
+                    for callback in reversed(rollback_callbacks):
+                        callback()
+                finally:
+                    if depth == 0:
+                        await connection.execute("ROLLBACK")
+                    else:
+                        await connection.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                        await connection.execute(f"RELEASE SAVEPOINT {savepoint}")
+                raise
+            else:
+                self._transaction_depth -= 1
+                await connection.execute("COMMIT" if depth == 0 else f"RELEASE SAVEPOINT {savepoint}")
+                if depth == 0:
+                    self._rollback_callbacks = []
+                    callbacks, self._commit_callbacks = self._commit_callbacks, []
+                    for callback in callbacks:
+                        callback()
+
+    def on_commit(self, callback: Callable[[], None]):
+        """
+        Выполняет callback после фиксации текущей транзакции этой задачи
+        (сразу, если задача не в транзакции). При откате callback отбрасывается.
+        """
+        if self._transaction_depth and self._lock_owner is asyncio.current_task():
+            self._commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def on_rollback(self, callback: Callable[[], None]):
+        """
+        Выполняет callback при откате текущей транзакции этой задачи (или точки сохранения,
+        внутри которой он зарегистрирован). Обработчики выполняются в обратном порядке до
+        ROLLBACK, пока база еще заблокирована на запись: так они успевают убрать то, что
+        транзакция сделала вне базы, раньше, чем другой писатель на это сошлется.
+        Вне транзакции callback не нужен и отбрасывается.
+        """
+        if self._transaction_depth and self._lock_owner is asyncio.current_task():
+            self._rollback_callbacks.append(callback)
+
+    async def execute(self, query: str, values: Optional[Dict] = None) -> Any:
+        """
+        Выполняет запрос. Для INSERT возвращает ID вставленной строки,
+        для остальных запросов - количество затронутых строк.
+        """
+        async with self._writer_connection() as connection:
+            async with connection.execute(query, values or {}) as cursor:
+                if query.lstrip().upper().startswith(("INSERT", "REPLACE")):
+                    return cursor.lastrowid
+                return cursor.rowcount
+
+    async def execute_many(self, query: str, values: List[Dict]) -> int:
+        """Выполняет запрос для каждого набора параметров одним executemany. Возвращает число затронутых строк."""
+        async with self._writer_connection() as connection:
+            async with connection.executemany(query, values) as cursor:
+                return cursor.rowcount
+
+    async def fetch_all(self, query: str, values: Optional[Dict] = None) -> List[sqlite3.Row]:
+        async with self._writer_connection() as connection:
+            return list(await connection.execute_fetchall(query, values or {}))
+
+    async def fetch_one(self, query: str, values: Optional[Dict] = None) -> Optional[sqlite3.Row]:
+        async with self._writer_connection() as connection:
+            async with connection.execute(query, values or {}) as cursor:
+                return await cursor.fetchone()
+
+    async def fetch_val(self, query: str, values: Optional[Dict] = None, column: Any = 0) -> Any:
+        row = await self.fetch_one(query, values)
+        return row[column] if row is not None else None
+
+    async def iterate(self, query: str, values: Optional[Dict] = None) -> AsyncIterator[sqlite3.Row]:
+        async with self._writer_connection() as connection:
+            async with connection.execute(query, values or {}) as cursor:
+                async for row in cursor:
+                    yield row
+
+    async def enable_incremental_vacuum(self):
+        """
+        Включает auto_vacuum = INCREMENTAL в существующей базе. Для этого SQLite перестраивает
+        файл целиком (VACUUM), поэтому вызывается один раз при запуске, до обработки запросов.
+        """
+        if self.path == ":memory:" or await self.fetch_val("PRAGMA auto_vacuum") == 2:
+            return
+        async with self._writer_connection() as connection:
+            await connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await connection.execute("VACUUM")
+        print("Файл базы данных перестроен для incremental_vacuum")
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """
+        Возвращает системе до pages свободных страниц файла базы.
+        Возвращает количество освобожденных страниц (меньше pages - свободных страниц не осталось).
+        """
+        async with self._writer_connection() as connection:
+            if self._transaction_depth:
+                raise RuntimeError("incremental_vacuum cannot run inside a transaction")
+            before = await self.fetch_val("PRAGMA freelist_count")
+            # Прагма освобождает по странице на каждом шаге выполнения, а execute делает
+            # только один шаг; executescript выполняет ее до конца
+            await connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            return before - await self.fetch_val("PRAGMA freelist_count")
@@ -0,0 +1,89 @@
+from typing import Dict
+
+from DB.SQLiteDatabase import SQLiteDatabase
+from DB.compression import sql_decompress
+from DB.fingerprints import key_fingerprint
+
+# Сколько значений подставлять в один запрос с IN (...): ограничение SQLite на число параметров
+IN_QUERY_CHUNK_SIZE = 500
+
+# Столбец значения в справочниках, которые кэшируются в памяти
+IDENTITY_COLUMNS = {"Emails": "email", "Folders": "name"}
+
+
+class SQLiteStore:
+    """
+    Общая часть хранилищ на SQLite (каталог ключей и почтовые ящики): подключение
+    и кэш справочника Emails в памяти (почтовые ящики кэшируют еще и Folders).
+    """
+
+    def __init__(self, database_url: str):
+        # storage_decompress нужна триггерам LettersFTS и запросам, читающим тело письма в SQL,
+        # key_fingerprint - миграции, заполняющей отпечатки уже сохраненных ключей
+        self.database = SQLiteDatabase(database_url, functions=[
+            ("storage_decompress", 2, sql_decompress),
+            ("key_fingerprint", 2, key_fingerprint),
+        ])
+
+        # Кэши справочников (таблица -> значение -> ID), прогреваются в create_tables
+        # и пополняются только после фиксации вставок
+        self.email_ids: Dict[str, int] = {}
+        self._identity_caches: Dict[str, Dict[str, int]] = {"Emails": self.email_ids}
+
+    @property
+    def reader(self):
+        """Пул соединений только для чтения: для запросов, которым не нужны незафиксированные изменения."""
+        return self.database.reader
+
+    async def connect(self):
+        """Открыть подключение к базе данных."""
+        await self.database.connect()
+
+    async def disconnect(self):
+        """Закрыть подключение к базе данных."""
+        await self.database.disconnect()
+
+    async def compact(self, pages: int) -> int:
+        """
+        Возвращает системе до pages свободных страниц файла базы (PRAGMA incremental_vacuum).
+        Возвращает количество освобожденных страниц.
+        """
+        return await self.database.incremental_vacuum(pages)
+
+    async def warm_identity_caches(self):
+        """Загружает кэшируемые справочники в память."""
+        for table, cache in self._identity_caches.items():
+            column = IDENTITY_COLUMNS[table]
+            rows = await self.database.fetch_all(f"SELECT id, {column} FROM {table}")
+            cache.update((row[column], row["id"]) for row in rows)
+
+    def _remember_ids(self, table: str, ids: Dict[str, int]):
+        """Добавляет ID в кэш справочника после фиксации транзакции, в которой они получены."""
+        if ids:
+            self.database.on_commit(lambda: self._identity_caches[table].update(ids))
+
+    async def _resolve_ids(self, table: str, column: str, names) -> Dict[str, int]:
+        """Вставляет недостающие значения в справочник (Folders или Emails) и возвращает словарь значение -> ID."""
+        cache = self._identity_caches[table]
+        ids = {name: cache[name] for name in names if name in cache}
+        names = [name for name in names if name not in cache]
+        if not names:
+            return ids
+
+        await self.database.execute_many(
+            f"INSERT OR IGNORE INTO {table} ({column}) VALUES (:name)", [{"name": name} for name in names]
+        )
+
+        resolved = {}
+        for offset in range(0, len(names), IN_QUERY_CHUNK_SIZE):
+            chunk = names[offset:offset + IN_QUERY_CHUNK_SIZE]
+            placeholders = ", ".join(f":n{i}" for i in range(len(chunk)))
+            rows = await self.database.fetch_all(
+                f"SELECT id, {column} FROM {table} WHERE {column} IN ({placeholders})",
+                {f"n{i}": name for i, name in enumerate(chunk)},
+            )
+            resolved.update((row[column], row["id"]) for row in rows)
+
+        self._remember_ids(table, resolved)
+        ids.update(resolved)
+        return ids
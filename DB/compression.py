@@ -0,0 +1,98 @@
+import mimetypes
+import zlib
+from typing import Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # Кодек zstd требует пакет zstandard; без него используется zlib
+    zstandard = None
+
+from config import STORAGE_CODEC, STORAGE_COMPRESSION_MIN_SIZE
+
+# Теги кодеков, которые хранятся рядом с данными (Letters.body_codec, Blobs.codec)
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Сжатие оставляется, только если экономит хотя бы такую долю размера
+MIN_SAVINGS = 0.1
+
+# Форматы, которые уже сжаты: повторное сжатие только тратит процессор
+_COMPRESSED_TYPES = {
+    "application/zip", "application/gzip", "application/x-gzip", "application/x-bzip2",
+    "application/x-xz", "application/x-7z-compressed", "application/x-rar-compressed",
+    "application/vnd.rar", "application/zstd", "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "application/vnd.oasis.opendocument.text", "application/vnd.oasis.opendocument.spreadsheet",
+}
+_COMPRESSED_PREFIXES = ("image/", "audio/", "video/", "font/")
+# SVG и BMP хранятся несжатыми и хорошо сжимаются
+_COMPRESSIBLE_IMAGES = {"image/svg+xml", "image/bmp"}
+
+
+def preferred_codec() -> str:
+    """Кодек для новых данных: из настроек, zstd заменяется на zlib, если пакет не установлен."""
+    if STORAGE_CODEC == CODEC_ZSTD and zstandard is None:
+        return CODEC_ZLIB
+    return STORAGE_CODEC if STORAGE_CODEC in (CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD) else CODEC_ZLIB
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if content_type is None or content_type in _COMPRESSIBLE_IMAGES:
+        return True
+    return content_type not in _COMPRESSED_TYPES and not content_type.startswith(_COMPRESSED_PREFIXES)
+
+
+def content_type_of(filename: Optional[str]) -> Optional[str]:
+    return mimetypes.guess_type(filename)[0] if filename else None
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported storage codec: {codec}")
+
+
+def decompress(data: Union[bytes, str, None], codec: Optional[str]) -> Union[bytes, str, None]:
+    """Распаковывает данные по тегу кодека; несжатые данные возвращаются как есть."""
+    if data is None or codec in (None, CODEC_NONE):
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Data is compressed with zstd, but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unsupported storage codec: {codec}")
+
+
+def encode(data: Union[bytes, str], content_type: Optional[str] = None) -> Tuple[str, Union[bytes, str]]:
+    """
+    Выбирает кодек по типу содержимого и размеру и сжимает данные.
+
+    Маленькие данные и уже сжатые форматы хранятся как есть; сжатие, которое экономит
+    меньше MIN_SAVINGS, тоже отбрасывается. Возвращает тег кодека и данные для записи.
+    """
+    codec = preferred_codec()
+    if codec == CODEC_NONE or len(data) < STORAGE_COMPRESSION_MIN_SIZE or not is_compressible(content_type):
+        return CODEC_NONE, data
+
+    raw = data.encode("utf-8") if isinstance(data, str) else data
+    compressed = compress(raw, codec)
+    if len(compressed) > len(raw) * (1 - MIN_SAVINGS):
+        return CODEC_NONE, data
+    return codec, compressed
+
+
+def sql_decompress(codec: Optional[str], data: Union[bytes, str, None]) -> Union[bytes, str, None]:
+    """Функция storage_decompress(codec, data) для SQL: триггерам нужен открытый текст тела письма."""
+    return decompress(data, codec)
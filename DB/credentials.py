@@ -0,0 +1,71 @@
+import os
+import tempfile
+from typing import Optional
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # Пароли в сессиях шифруются пакетом cryptography
+    Fernet = None
+    InvalidToken = Exception
+
+from config import SESSION_SECRET, SESSION_KEY_FILE
+
+
+def load_or_create_key(key_file: str) -> bytes:
+    """
+    Читает ключ Fernet из файла или создает его. Файл появляется целиком (через link временного
+    файла), поэтому процессы, стартующие одновременно, получают один и тот же ключ
+    и никогда не читают недописанный файл.
+    """
+    if not os.path.exists(key_file):
+        directory = os.path.dirname(key_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(Fernet.generate_key())
+            os.link(tmp_path, key_file)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    with open(key_file, "rb") as f:
+        return f.read().strip()
+
+
+class CredentialCipher:
+    """
+    Шифрует пароли почтовых аккаунтов, которые хранятся в таблице Sessions,
+    и токены ссылок на вложения.
+
+    Ключ берется из SESSION_SECRET или из файла ключа, который создается при первом
+    обращении; все рабочие процессы используют один и тот же ключ.
+    """
+
+    def __init__(self, secret: str = SESSION_SECRET, key_file: str = SESSION_KEY_FILE):
+        self.secret = secret
+        self.key_file = key_file
+        self._fernet = None
+
+    @property
+    def fernet(self):
+        if self._fernet is None:
+            if Fernet is None:
+                raise RuntimeError("Для хранения сессий нужен пакет cryptography")
+            key = self.secret.encode("ascii") if self.secret else load_or_create_key(self.key_file)
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def encrypt(self, value: str) -> bytes:
+        return self.fernet.encrypt(value.encode("utf-8"))
+
+    def decrypt(self, token: bytes, ttl: Optional[int] = None) -> Optional[str]:
+        """
+        Расшифровывает пароль; None, если он зашифрован другим ключом, поврежден
+        или (при заданном ttl) зашифрован больше ttl секунд назад.
+        """
+        try:
+            return self.fernet.decrypt(token, ttl=ttl).decode("utf-8")
+        except InvalidToken:
+            return None
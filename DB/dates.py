@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Union
+
+
+def email_date_to_timestamp(date: Union[str, datetime, None]) -> Optional[int]:
+    """
+    Переводит дату письма (заголовок Date в формате RFC 2822, ISO-строку или datetime)
+    в UTC-время в секундах от начала эпохи. Даты без часового пояса считаются UTC.
+    Возвращает None, если дату разобрать не удалось.
+    """
+    if date is None:
+        return None
+
+    if isinstance(date, datetime):
+        parsed = date
+    else:
+        try:
+            parsed = parsedate_to_datetime(date)
+        except (TypeError, ValueError, IndexError):
+            try:
+                parsed = datetime.fromisoformat(date.strip())
+            except ValueError:
+                return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
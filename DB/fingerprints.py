@@ -0,0 +1,18 @@
+import hashlib
+from typing import Union
+
+
+def key_fingerprint(*parts: Union[bytes, str, None]) -> bytes:
+    """
+    SHA-256 ключевого материала (32 байта) для проверки уникальности ключей вместо
+    индекса по самим PEM-блобам. Каждая часть предваряется своей длиной, поэтому
+    разные наборы частей не дают одинаковую склейку; строки берутся в UTF-8.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        part = part or b""
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.digest()
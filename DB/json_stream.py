@@ -0,0 +1,112 @@
+import codecs
+import json
+from typing import Any, BinaryIO, Iterator, Tuple
+
+# Сколько байт читать из файла за раз
+READ_CHUNK_SIZE = 256 * 1024
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}"
+
+
+class _Reader:
+    """Буфер над файлом: текст дочитывается по мере необходимости, прочитанное отбрасывается."""
+
+    def __init__(self, file_obj: BinaryIO, chunk_size: int):
+        self.file_obj = file_obj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Дочитывает следующий фрагмент. Возвращает False, если файл закончился."""
+        if self.eof:
+            return False
+        data = self.file_obj.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b"", final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Следующий значимый символ (пробелы пропускаются) или пустая строка в конце файла."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        """Разбирает очередное JSON-значение, дочитывая файл, пока значение не будет полным."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # Число или литерал на границе фрагмента может быть прочитан не полностью:
+            # за ним должен идти разделитель
+            if (not isinstance(value, (dict, list, str)) and not self.eof
+                    and (end == len(self.buffer) or self.buffer[end] not in _DELIMITERS)):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_sections(file_obj: BinaryIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Потоково разбирает JSON-объект вида {"секция": [элемент, ...], ...} и выдает пары
+    (имя секции, элемент) по одной, не загружая файл целиком. Значения, не являющиеся
+    массивами, пропускаются.
+
+    Raises:
+        json.JSONDecodeError: Если файл не является корректным JSON такого вида.
+    """
+    reader = _Reader(file_obj, chunk_size)
+    decoder = json.JSONDecoder()
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+
+    while True:
+        section = reader.value(decoder)
+        if not isinstance(section, str):
+            raise json.JSONDecodeError("Expecting property name", reader.buffer, reader.pos)
+        reader.expect(":")
+
+        if reader.peek() == "[":
+            reader.pos += 1
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield section, reader.value(decoder)
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            reader.value(decoder)
+
+        if reader.expect(",}") == "}":
+            break
+
+    if reader.peek():
+        raise json.JSONDecodeError("Extra data", reader.buffer, reader.pos)
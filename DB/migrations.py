@@ -0,0 +1,769 @@
+import asyncio
+from typing import Awaitable, Callable, List, NamedTuple, Union
+
+from DB.BlobStore import BlobStore
+from DB.compression import CODEC_NONE
+from DB.dates import email_date_to_timestamp
+
+# Шаг миграции: SQL-запрос или асинхронная функция, получающая подключение к базе
+# и именованные параметры, переданные в migrate (например, blob_store)
+MigrationStep = Union[str, Callable[..., Awaitable[None]]]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: List[MigrationStep]
+
+
+# Схемы каталога (ключи, сессии, список ящиков) и почтового ящика (письма одного аккаунта)
+# ведутся отдельными списками миграций, у каждого файла своя версия схемы. Номера версий
+# сохранены из общего списка, действовавшего до разделения, поэтому базы, обновленные
+# по нему, продолжают со своей версии; пропуски в номерах - миграции другой схемы.
+
+# Справочник адресов нужен обеим схемам
+EMAILS_TABLE = """
+    CREATE TABLE IF NOT EXISTS Emails (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL
+    )
+    """
+
+# Исходная схема каталога. CREATE TABLE IF NOT EXISTS позволяет применить ее и к базам,
+# созданным до появления миграций (в них остаются и таблицы писем, см. legacy_mail).
+CATALOG_INITIAL_SCHEMA = [
+    EMAILS_TABLE,
+    """
+    CREATE TABLE IF NOT EXISTS PrivateRSAKeys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_email_id INTEGER NOT NULL,
+        current_recipient_email_id INTEGER NOT NULL,
+        private_key_sign BLOB NOT NULL,
+        public_key_sign BLOB NOT NULL,
+        private_key_encrypt BLOB NOT NULL,
+        public_key_encrypt BLOB NOT NULL,
+        create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        UNIQUE (sender_email_id, current_recipient_email_id, private_key_sign, private_key_encrypt),
+        FOREIGN KEY (sender_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE,
+        FOREIGN KEY (current_recipient_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS PublicRSAKeys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        current_sender_email_id INTEGER NOT NULL,
+        recipient_email_id INTEGER NOT NULL,
+        public_key_sign BLOB NOT NULL,
+        public_key_encrypt BLOB NOT NULL,
+        create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        UNIQUE (current_sender_email_id, recipient_email_id, public_key_sign, public_key_encrypt),
+        FOREIGN KEY (current_sender_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE,
+        FOREIGN KEY (recipient_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE
+    )
+    """,
+    # Заранее сгенерированные наборы ключей
+    """
+    CREATE TABLE IF NOT EXISTS KeyPairPool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        private_key_sign BLOB NOT NULL,
+        public_key_sign BLOB NOT NULL,
+        private_key_encrypt BLOB NOT NULL,
+        public_key_encrypt BLOB NOT NULL
+    )
+    """,
+]
+
+# Исходная схема почтового ящика
+MAILBOX_INITIAL_SCHEMA = [
+    EMAILS_TABLE,
+    """
+    CREATE TABLE IF NOT EXISTS Folders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE -- Имя папки
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Letters (
+        id INTEGER NOT NULL,
+        folder_id INTEGER NOT NULL,
+        sender_id INTEGER NOT NULL,
+        recipient_id INTEGER NOT NULL,
+        to_name TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        date DATETIME NOT NULL,
+        body BLOB NOT NULL,
+        PRIMARY KEY (id, folder_id),
+        FOREIGN KEY (folder_id) REFERENCES Folders (id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        FOREIGN KEY (sender_id) REFERENCES Emails (id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        FOREIGN KEY (recipient_id) REFERENCES Emails (id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        letter_id INTEGER NOT NULL,
+        folder_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        file_data BLOB NOT NULL,
+        FOREIGN KEY (letter_id, folder_id) REFERENCES Letters (id, folder_id)
+            ON DELETE CASCADE
+    )
+    """,
+]
+
+# Индексы под листинг папок и чтение вложений
+MAIL_LOOKUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_letters_folder_date ON Letters (folder_id, date)",
+    "CREATE INDEX IF NOT EXISTS idx_files_letter ON Files (letter_id, folder_id)",
+    # Статистика для планировщика, чтобы новые индексы сразу начали использоваться
+    "ANALYZE",
+]
+
+# Индексы под поиск ключей по паре адресов
+KEY_LOOKUP_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_public_keys_pair_date
+    ON PublicRSAKeys (current_sender_email_id, recipient_email_id, create_date)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_private_keys_pair_date
+    ON PrivateRSAKeys (sender_email_id, current_recipient_email_id, create_date)
+    """,
+    # get_decrypt_keys ищет приватные ключи только по получателю
+    """
+    CREATE INDEX IF NOT EXISTS idx_private_keys_recipient_date
+    ON PrivateRSAKeys (current_recipient_email_id, create_date)
+    """,
+    # Статистика для планировщика, чтобы новые индексы сразу начали использоваться
+    "ANALYZE",
+]
+
+
+async def backfill_letters_date_ts(database, **context):
+    """Заполняет Letters.date_ts для писем, сохраненных до появления столбца."""
+    rows = await database.fetch_all("SELECT id, folder_id, date FROM Letters WHERE date_ts IS NULL")
+    values = [
+        {"id": row["id"], "folder_id": row["folder_id"], "date_ts": email_date_to_timestamp(row["date"])}
+        for row in rows
+    ]
+    if values:
+        await database.execute_many(
+            "UPDATE Letters SET date_ts = :date_ts WHERE id = :id AND folder_id = :folder_id", values
+        )
+
+
+# Дата письма в виде UTC-времени от начала эпохи: сортировка и диапазоны по индексу.
+# Исходный заголовок Date остается в Letters.date для отображения.
+LETTERS_DATE_TS = [
+    "ALTER TABLE Letters ADD COLUMN date_ts INTEGER",
+    backfill_letters_date_ts,
+    # Индекс по строке даты сортировал лексикографически и больше не нужен
+    "DROP INDEX IF EXISTS idx_letters_folder_date",
+    # id в конце индекса дает порядок "новые первыми" без сортировки во временном B-дереве
+    "CREATE INDEX IF NOT EXISTS idx_letters_folder_date_ts ON Letters (folder_id, date_ts, id)",
+    "ANALYZE Letters",
+]
+
+async def move_files_to_blob_store(database, blob_store: BlobStore = None, **context):
+    """Переносит содержимое вложений из Files.file_data в хранилище блобов."""
+    blob_store = blob_store or BlobStore()
+
+    async for row in database.iterate("SELECT id, letter_id, folder_id, file_name, file_data FROM Files ORDER BY id"):
+        blob_hash, size, _, created = await asyncio.to_thread(blob_store.write, row["file_data"], codec=CODEC_NONE)
+        if created:
+            # Если миграция откатится, вложения останутся в Files.file_data
+            database.on_rollback(lambda blob_hash=blob_hash: blob_store.remove(blob_hash, CODEC_NONE))
+        await database.execute(
+            """
+            INSERT INTO Blobs (hash, size, refcount) VALUES (:hash, :size, 1)
+            ON CONFLICT (hash) DO UPDATE SET refcount = refcount + 1
+            """,
+            {"hash": blob_hash, "size": size},
+        )
+        await database.execute(
+            """
+            INSERT INTO FilesNew (id, letter_id, folder_id, file_name, blob_hash, size)
+            VALUES (:id, :letter_id, :folder_id, :file_name, :blob_hash, :size)
+            """,
+            {
+                "id": row["id"],
+                "letter_id": row["letter_id"],
+                "folder_id": row["folder_id"],
+                "file_name": row["file_name"],
+                "blob_hash": blob_hash,
+                "size": size,
+            },
+        )
+
+
+# Содержимое вложений хранится в BlobStore один раз на каждый уникальный SHA-256,
+# в Files остаются только имя, хэш и размер. Blobs.refcount - число ссылок из Files.
+BLOB_STORE = [
+    """
+    CREATE TABLE IF NOT EXISTS Blobs (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE FilesNew (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        letter_id INTEGER NOT NULL,
+        folder_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        blob_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        FOREIGN KEY (letter_id, folder_id) REFERENCES Letters (id, folder_id)
+            ON DELETE CASCADE,
+        FOREIGN KEY (blob_hash) REFERENCES Blobs (hash)
+    )
+    """,
+    move_files_to_blob_store,
+    "DROP TABLE Files",
+    "ALTER TABLE FilesNew RENAME TO Files",
+    "CREATE INDEX IF NOT EXISTS idx_files_letter ON Files (letter_id, folder_id)",
+    "CREATE INDEX IF NOT EXISTS idx_files_blob ON Files (blob_hash)",
+]
+
+def _fts_values(letter: str, body: str = "CAST({letter}.body AS TEXT)") -> str:
+    """
+    Значения столбцов LettersFTS для письма {letter} (new в триггере или алиас в SELECT);
+    body - SQL-выражение с открытым текстом тела.
+    Тела зашифрованных писем (JSON с encrypted_content) не индексируются; CASE вычисляется
+    лениво, поэтому json_type не получает некорректный JSON.
+    """
+    body = body.format(letter=letter)
+    return f"""
+        (SELECT email FROM Emails WHERE id = {letter}.sender_id),
+        (SELECT email FROM Emails WHERE id = {letter}.recipient_id),
+        {letter}.subject,
+        CASE
+            WHEN NOT json_valid({body}) THEN {body}
+            WHEN json_type({body}, '$.encrypted_content') IS NOT NULL THEN ''
+            ELSE {body}
+        END
+    """
+
+
+# Полнотекстовый индекс по отправителю, получателю, теме и открытому тексту писем.
+# rowid записи индекса совпадает с rowid письма в Letters и поддерживается триггерами.
+LETTERS_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS LettersFTS USING fts5(
+        sender, recipient, subject, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS letters_fts_insert AFTER INSERT ON Letters BEGIN
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        VALUES (new.rowid, {_fts_values("new")});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS letters_fts_delete AFTER DELETE ON Letters BEGIN
+        DELETE FROM LettersFTS WHERE rowid = old.rowid;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS letters_fts_update
+    AFTER UPDATE OF sender_id, recipient_id, subject, body ON Letters BEGIN
+        DELETE FROM LettersFTS WHERE rowid = old.rowid;
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        VALUES (new.rowid, {_fts_values("new")});
+    END
+    """,
+    f"""
+    INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+    SELECT l.rowid, {_fts_values("l")} FROM Letters l
+    """,
+]
+
+# Тело письма в SQL после распаковки; функцию storage_decompress регистрирует SQLiteStore
+DECODED_BODY = "CAST(storage_decompress({letter}.body_codec, {letter}.body) AS TEXT)"
+
+# Тела писем и блобы вложений хранятся сжатыми; кодек записывается рядом с данными.
+# Триггеры LettersFTS индексируют распакованный текст. Пересжатие тела (тот же текст
+# в другом кодеке) индекс не перестраивает.
+STORAGE_CODECS = [
+    "ALTER TABLE Letters ADD COLUMN body_codec TEXT NOT NULL DEFAULT 'none'",
+    "ALTER TABLE Blobs ADD COLUMN codec TEXT NOT NULL DEFAULT 'none'",
+    "DROP TRIGGER IF EXISTS letters_fts_insert",
+    "DROP TRIGGER IF EXISTS letters_fts_update",
+    f"""
+    CREATE TRIGGER letters_fts_insert AFTER INSERT ON Letters BEGIN
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        VALUES (new.rowid, {_fts_values("new", DECODED_BODY)});
+    END
+    """,
+    f"""
+    CREATE TRIGGER letters_fts_update
+    AFTER UPDATE OF sender_id, recipient_id, subject, body, body_codec ON Letters
+    WHEN old.sender_id IS NOT new.sender_id
+        OR old.recipient_id IS NOT new.recipient_id
+        OR old.subject IS NOT new.subject
+        OR CAST(storage_decompress(old.body_codec, old.body) AS BLOB)
+            IS NOT CAST(storage_decompress(new.body_codec, new.body) AS BLOB)
+    BEGIN
+        DELETE FROM LettersFTS WHERE rowid = old.rowid;
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        VALUES (new.rowid, {_fts_values("new", DECODED_BODY)});
+    END
+    """,
+]
+
+# Локальное хранилище писем работает как ограниченный кэш: last_opened (UTC, секунды) задает
+# порядок вытеснения, size - примерный объем письма (хранимое тело + вложения).
+# Для уже сохраненных писем время последнего открытия неизвестно и берется из даты письма.
+RETENTION = [
+    "ALTER TABLE Letters ADD COLUMN last_opened INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE Letters ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+    """
+    UPDATE Letters SET
+        last_opened = COALESCE(date_ts, 0),
+        size = length(body) + COALESCE((
+            SELECT SUM(f.size) FROM Files f WHERE f.letter_id = Letters.id AND f.folder_id = Letters.folder_id
+        ), 0)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_letters_folder_opened ON Letters (folder_id, last_opened, id)",
+    """
+    CREATE TABLE IF NOT EXISTS RetentionPolicies (
+        folder_id INTEGER PRIMARY KEY,
+        max_age_days INTEGER,
+        max_count INTEGER,
+        max_bytes INTEGER,
+        FOREIGN KEY (folder_id) REFERENCES Folders (id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    )
+    """,
+]
+
+# Почта каждого аккаунта хранится в отдельном файле (почтовом ящике) со своей схемой;
+# в каталоге (общей базе) остаются ключи и список ящиков. Таблицы писем в каталоге
+# остаются только до переноса писем, сохраненных до разделения (см. legacy_mail).
+ACCOUNTS = [
+    """
+    CREATE TABLE IF NOT EXISTS Accounts (
+        id INTEGER PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        path TEXT NOT NULL,
+        blob_dir TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Уникальность ключей проверяется по отпечатку ключевого материала (SHA-256, 32 байта,
+# см. DB.fingerprints) вместо UNIQUE-индекса по PEM-блобам в несколько килобайт.
+# SQLite не умеет менять ограничения таблицы, поэтому таблицы пересоздаются:
+# новая таблица, перенос строк с вычислением отпечатка, удаление старой, переименование.
+KEY_FINGERPRINTS = [
+    """
+    CREATE TABLE PrivateRSAKeys_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_email_id INTEGER NOT NULL,
+        current_recipient_email_id INTEGER NOT NULL,
+        private_key_sign BLOB NOT NULL,
+        public_key_sign BLOB NOT NULL,
+        private_key_encrypt BLOB NOT NULL,
+        public_key_encrypt BLOB NOT NULL,
+        fingerprint BLOB NOT NULL, -- key_fingerprint(private_key_sign, private_key_encrypt)
+        create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        UNIQUE (sender_email_id, current_recipient_email_id, fingerprint),
+        FOREIGN KEY (sender_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE,
+        FOREIGN KEY (current_recipient_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE
+    )
+    """,
+    # OR IGNORE: один и тот же ключ, сохраненный как TEXT и как BLOB, оставляем один раз
+    """
+    INSERT OR IGNORE INTO PrivateRSAKeys_new (
+        id, sender_email_id, current_recipient_email_id,
+        private_key_sign, public_key_sign, private_key_encrypt, public_key_encrypt,
+        fingerprint, create_date
+    )
+    SELECT
+        id, sender_email_id, current_recipient_email_id,
+        private_key_sign, public_key_sign, private_key_encrypt, public_key_encrypt,
+        key_fingerprint(private_key_sign, private_key_encrypt), create_date
+    FROM PrivateRSAKeys
+    ORDER BY id
+    """,
+    "DROP TABLE PrivateRSAKeys",
+    "ALTER TABLE PrivateRSAKeys_new RENAME TO PrivateRSAKeys",
+    """
+    CREATE TABLE PublicRSAKeys_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        current_sender_email_id INTEGER NOT NULL,
+        recipient_email_id INTEGER NOT NULL,
+        public_key_sign BLOB NOT NULL,
+        public_key_encrypt BLOB NOT NULL,
+        fingerprint BLOB NOT NULL, -- key_fingerprint(public_key_sign, public_key_encrypt)
+        create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        UNIQUE (current_sender_email_id, recipient_email_id, fingerprint),
+        FOREIGN KEY (current_sender_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE,
+        FOREIGN KEY (recipient_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE
+    )
+    """,
+    """
+    INSERT OR IGNORE INTO PublicRSAKeys_new (
+        id, current_sender_email_id, recipient_email_id,
+        public_key_sign, public_key_encrypt, fingerprint, create_date
+    )
+    SELECT
+        id, current_sender_email_id, recipient_email_id,
+        public_key_sign, public_key_encrypt,
+        key_fingerprint(public_key_sign, public_key_encrypt), create_date
+    FROM PublicRSAKeys
+    ORDER BY id
+    """,
+    "DROP TABLE PublicRSAKeys",
+    "ALTER TABLE PublicRSAKeys_new RENAME TO PublicRSAKeys",
+    # Индексы удаляются вместе со старыми таблицами
+    """
+    CREATE INDEX IF NOT EXISTS idx_public_keys_pair_date
+    ON PublicRSAKeys (current_sender_email_id, recipient_email_id, create_date)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_private_keys_pair_date
+    ON PrivateRSAKeys (sender_email_id, current_recipient_email_id, create_date)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_private_keys_recipient_date
+    ON PrivateRSAKeys (current_recipient_email_id, create_date)
+    """,
+]
+
+def _key_summary_recompute(table: str, self_column: str, peer_column: str, summary_column: str, row: str) -> str:
+    """UPSERT строки KeyPairSummary для пары адресов из row (new/old) с пересчетом даты по индексу пары."""
+    return f"""
+        INSERT INTO KeyPairSummary (self_email_id, peer_email_id, {summary_column})
+        VALUES ({row}.{self_column}, {row}.{peer_column}, (
+            SELECT MAX(create_date) FROM {table}
+            WHERE {self_column} = {row}.{self_column} AND {peer_column} = {row}.{peer_column}
+        ))
+        ON CONFLICT (self_email_id, peer_email_id) DO UPDATE SET {summary_column} = excluded.{summary_column};
+    """
+
+
+def _key_summary_triggers(table: str, self_column: str, peer_column: str, summary_column: str) -> List[str]:
+    """Триггеры, поддерживающие дату последнего ключа пары в KeyPairSummary."""
+    name = table.lower()
+    return [
+        # Вставка не уменьшает максимум, поэтому достаточно сравнить с сохраненной датой
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_summary_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO KeyPairSummary (self_email_id, peer_email_id, {summary_column})
+            VALUES (new.{self_column}, new.{peer_column}, new.create_date)
+            ON CONFLICT (self_email_id, peer_email_id) DO UPDATE SET {summary_column} = CASE
+                WHEN {summary_column} IS NULL OR excluded.{summary_column} > {summary_column}
+                THEN excluded.{summary_column} ELSE {summary_column}
+            END;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_summary_delete AFTER DELETE ON {table} BEGIN
+            {_key_summary_recompute(table, self_column, peer_column, summary_column, "old")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_summary_update
+        AFTER UPDATE OF {self_column}, {peer_column}, create_date ON {table} BEGIN
+            {_key_summary_recompute(table, self_column, peer_column, summary_column, "old")}
+            {_key_summary_recompute(table, self_column, peer_column, summary_column, "new")}
+        END
+        """,
+    ]
+
+
+# Даты последних публичного и приватного ключей для каждой пары (свой адрес, собеседник).
+# Заменяет агрегаты MAX(create_date) по всей истории ключей в get_related_emails_and_dates;
+# поддерживается триггерами на таблицах ключей.
+KEY_PAIR_SUMMARY = [
+    """
+    CREATE TABLE IF NOT EXISTS KeyPairSummary (
+        self_email_id INTEGER NOT NULL,
+        peer_email_id INTEGER NOT NULL,
+        last_public_key_date DATETIME,
+        last_private_key_date DATETIME,
+        PRIMARY KEY (self_email_id, peer_email_id),
+        FOREIGN KEY (self_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        FOREIGN KEY (peer_email_id) REFERENCES Emails (id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    )
+    """,
+    *_key_summary_triggers("PublicRSAKeys", "current_sender_email_id", "recipient_email_id", "last_public_key_date"),
+    *_key_summary_triggers("PrivateRSAKeys", "sender_email_id", "current_recipient_email_id", "last_private_key_date"),
+    """
+    INSERT INTO KeyPairSummary (self_email_id, peer_email_id, last_public_key_date)
+    SELECT current_sender_email_id, recipient_email_id, MAX(create_date)
+    FROM PublicRSAKeys
+    GROUP BY current_sender_email_id, recipient_email_id
+    """,
+    """
+    INSERT INTO KeyPairSummary (self_email_id, peer_email_id, last_private_key_date)
+    SELECT sender_email_id, current_recipient_email_id, MAX(create_date)
+    FROM PrivateRSAKeys
+    WHERE true
+    GROUP BY sender_email_id, current_recipient_email_id
+    ON CONFLICT (self_email_id, peer_email_id) DO UPDATE SET last_private_key_date = excluded.last_private_key_date
+    """,
+]
+
+# Тела писем вынесены из Letters в LetterBodies: в Letters остаются только узкие столбцы
+# заголовков, и листинг папки не тащит страницы переполнения тел через кэш страниц.
+# DROP COLUMN переписывает Letters на месте и сохраняет rowid, поэтому LettersFTS остается
+# согласованным (пересоздание таблицы через DROP TABLE удалило бы по каскаду Files).
+# Тело ссылается на письмо по (id, folder_id) и переезжает вместе с ним по каскаду.
+_LETTER_OF_BODY = "Letters l WHERE l.id = {body}.letter_id AND l.folder_id = {body}.folder_id"
+
+LETTER_BODIES = [
+    """
+    CREATE TABLE IF NOT EXISTS LetterBodies (
+        letter_id INTEGER NOT NULL,
+        folder_id INTEGER NOT NULL,
+        body BLOB NOT NULL,
+        body_codec TEXT NOT NULL DEFAULT 'none',
+        PRIMARY KEY (letter_id, folder_id),
+        FOREIGN KEY (letter_id, folder_id) REFERENCES Letters (id, folder_id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    )
+    """,
+    """
+    INSERT INTO LetterBodies (letter_id, folder_id, body, body_codec)
+    SELECT id, folder_id, body, body_codec FROM Letters ORDER BY rowid
+    """,
+    "DROP TRIGGER IF EXISTS letters_fts_insert",
+    "DROP TRIGGER IF EXISTS letters_fts_update",
+    "ALTER TABLE Letters DROP COLUMN body",
+    "ALTER TABLE Letters DROP COLUMN body_codec",
+    # Письмо вставляется раньше тела, поэтому запись индекса создается при вставке тела
+    f"""
+    CREATE TRIGGER letter_bodies_fts_insert AFTER INSERT ON LetterBodies BEGIN
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        SELECT l.rowid, {_fts_values("l", DECODED_BODY.format(letter="new"))}
+        FROM {_LETTER_OF_BODY.format(body="new")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER letter_bodies_fts_update
+    AFTER UPDATE OF body, body_codec ON LetterBodies
+    WHEN CAST(storage_decompress(old.body_codec, old.body) AS BLOB)
+        IS NOT CAST(storage_decompress(new.body_codec, new.body) AS BLOB)
+    BEGIN
+        DELETE FROM LettersFTS WHERE rowid = (SELECT l.rowid FROM {_LETTER_OF_BODY.format(body="new")});
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        SELECT l.rowid, {_fts_values("l", DECODED_BODY.format(letter="new"))}
+        FROM {_LETTER_OF_BODY.format(body="new")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER letters_fts_update
+    AFTER UPDATE OF sender_id, recipient_id, subject ON Letters
+    WHEN old.sender_id IS NOT new.sender_id
+        OR old.recipient_id IS NOT new.recipient_id
+        OR old.subject IS NOT new.subject
+    BEGIN
+        DELETE FROM LettersFTS WHERE rowid = old.rowid;
+        INSERT INTO LettersFTS (rowid, sender, recipient, subject, body)
+        SELECT new.rowid, {_fts_values("new", DECODED_BODY.format(letter="b"))}
+        FROM LetterBodies b WHERE b.letter_id = new.id AND b.folder_id = new.folder_id;
+    END
+    """,
+    # Покрывающий индекс листинга: страница папки читается из индекса, без обращения к таблице
+    "DROP INDEX IF EXISTS idx_letters_folder_date_ts",
+    """
+    CREATE INDEX IF NOT EXISTS idx_letters_folder_listing
+    ON Letters (folder_id, date_ts, id, sender_id, subject, date)
+    """,
+    "ANALYZE",
+]
+
+# Сессии: учетные данные IMAP/SMTP по токену в общей базе, чтобы любой рабочий процесс
+# API обслуживал любой запрос. Пароли зашифрованы (DB.credentials); revision растет
+# при каждой смене аккаунта, и процессы по нему пересоздают своих клиентов.
+SESSIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS Sessions (
+        token TEXT PRIMARY KEY,
+        imap_user TEXT NOT NULL,
+        imap_pass BLOB NOT NULL,
+        imap_server TEXT NOT NULL,
+        imap_port INTEGER NOT NULL,
+        smtp_user TEXT NOT NULL,
+        smtp_pass BLOB NOT NULL,
+        smtp_server TEXT NOT NULL,
+        smtp_port INTEGER NOT NULL,
+        revision INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+def _key_version_triggers(table: str) -> List[str]:
+    """Триггеры, увеличивающие KeyVersion.version при любом изменении таблицы ключей."""
+    name = table.lower()
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE KeyVersion SET version = version + 1 WHERE id = 1;
+        END
+        """
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+# Версия содержимого таблиц ключей в базе. Кэш ключей-кандидатов (DB.KeyCache) сверяет
+# свои записи с ней, поэтому изменения из других рабочих процессов видны сразу.
+KEY_VERSION = [
+    """
+    CREATE TABLE IF NOT EXISTS KeyVersion (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO KeyVersion (id, version) VALUES (1, 0)",
+    *_key_version_triggers("PublicRSAKeys"),
+    *_key_version_triggers("PrivateRSAKeys"),
+]
+
+async def table_exists(database, table: str) -> bool:
+    """Есть ли в базе таблица с таким именем."""
+    return bool(await database.fetch_val(
+        "SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name)", {"name": table}
+    ))
+
+
+async def _apply_step(database, step: MigrationStep, context):
+    if isinstance(step, str):
+        await database.execute(step)
+    else:
+        await step(database, **context)
+
+
+def legacy_mail(steps: List[MigrationStep]) -> List[MigrationStep]:
+    """
+    Шаги миграции таблиц писем для каталога. Выполняются, только если в каталоге остались
+    таблицы писем, сохраненных до разделения на ящики: ящик переносит их строки как есть
+    (MailStore.import_legacy_mail), поэтому схема этих таблиц должна совпадать со схемой ящика.
+    """
+    async def apply_to_legacy_mail(database, **context):
+        if await table_exists(database, "Letters"):
+            for step in steps:
+                await _apply_step(database, step, context)
+
+    return [apply_to_legacy_mail]
+
+
+# Таблицы писем в каталоге; ссылающиеся таблицы удаляются раньше тех, на которые они ссылаются
+LEGACY_MAIL_TABLES = ("Files", "LetterBodies", "RetentionPolicies", "Letters", "Blobs", "Folders", "LettersFTS")
+
+
+async def drop_legacy_mail_tables(database):
+    """Удаляет из каталога таблицы писем вместе с их индексами и триггерами."""
+    for table in LEGACY_MAIL_TABLES:
+        await database.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+async def drop_empty_legacy_mail_tables(database, **context):
+    """Удаляет таблицы писем из каталога, если писем в них нет (иначе их удалит перенос в ящик)."""
+    if await table_exists(database, "Letters") and not await database.fetch_val("SELECT EXISTS (SELECT 1 FROM Letters)"):
+        await drop_legacy_mail_tables(database)
+
+
+# Таблицы каталога, которые общий список миграций создавал и в почтовых ящиках (пустыми).
+# Таблицы ключей удаляются первыми вместе со своими триггерами, ссылающимися на остальные.
+MAILBOX_DROP_CATALOG_TABLES = [
+    f"DROP TABLE IF EXISTS {table}"
+    for table in ("PrivateRSAKeys", "PublicRSAKeys", "KeyPairSummary", "KeyVersion", "KeyPairPool", "Accounts", "Sessions")
+]
+
+CATALOG_MIGRATIONS: List[Migration] = [
+    Migration(1, "Исходная схема", CATALOG_INITIAL_SCHEMA),
+    Migration(2, "Индексы для листинга, вложений и поиска ключей", KEY_LOOKUP_INDEXES + legacy_mail(MAIL_LOOKUP_INDEXES)),
+    Migration(3, "Столбец Letters.date_ts с UTC-временем письма", legacy_mail(LETTERS_DATE_TS)),
+    Migration(4, "Вложения в хранилище блобов с подсчетом ссылок", legacy_mail(BLOB_STORE)),
+    Migration(5, "Полнотекстовый индекс писем LettersFTS", legacy_mail(LETTERS_FTS)),
+    Migration(6, "Сжатие тел писем и вложений с тегом кодека", legacy_mail(STORAGE_CODECS)),
+    Migration(7, "Политики хранения писем и время последнего открытия", legacy_mail(RETENTION)),
+    Migration(8, "Почтовые ящики аккаунтов в отдельных файлах", ACCOUNTS),
+    Migration(9, "Отпечатки ключей вместо уникальных индексов по блобам", KEY_FINGERPRINTS),
+    Migration(10, "Сводка дат последних ключей по парам адресов", KEY_PAIR_SUMMARY),
+    Migration(11, "Тела писем в отдельной таблице LetterBodies и покрывающий индекс листинга", legacy_mail(LETTER_BODIES)),
+    Migration(12, "Сессии с учетными данными IMAP/SMTP", SESSIONS),
+    Migration(13, "Версия таблиц ключей для кэша ключей-кандидатов", KEY_VERSION),
+    Migration(14, "Удаление пустых таблиц писем из каталога", [drop_empty_legacy_mail_tables]),
+]
+
+MAILBOX_MIGRATIONS: List[Migration] = [
+    Migration(1, "Исходная схема", MAILBOX_INITIAL_SCHEMA),
+    Migration(2, "Индексы для листинга и вложений", MAIL_LOOKUP_INDEXES),
+    Migration(3, "Столбец Letters.date_ts с UTC-временем письма", LETTERS_DATE_TS),
+    Migration(4, "Вложения в хранилище блобов с подсчетом ссылок", BLOB_STORE),
+    Migration(5, "Полнотекстовый индекс писем LettersFTS", LETTERS_FTS),
+    Migration(6, "Сжатие тел писем и вложений с тегом кодека", STORAGE_CODECS),
+    Migration(7, "Политики хранения писем и время последнего открытия", RETENTION),
+    Migration(11, "Тела писем в отдельной таблице LetterBodies и покрывающий индекс листинга", LETTER_BODIES),
+    Migration(14, "Удаление таблиц каталога из почтового ящика", MAILBOX_DROP_CATALOG_TABLES),
+]
+
+
+async def get_schema_version(database) -> int:
+    """Текущая версия схемы (0 - миграции еще не применялись)."""
+    await database.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+    )
+    """)
+    return await database.fetch_val("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+
+async def migrate(database, migrations: List[Migration], **context) -> int:
+    """
+    Применяет к базе все миграции из списка (CATALOG_MIGRATIONS или MAILBOX_MIGRATIONS)
+    новее текущей версии схемы.
+    Каждая миграция выполняется в отдельной транзакции вместе с записью в schema_version;
+    шаги-функции получают подключение и именованные параметры context.
+    Возвращает итоговую версию схемы.
+    """
+    version = await get_schema_version(database)
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= version:
+            continue
+
+        async with database.transaction():
+            for step in migration.steps:
+                await _apply_step(database, step, context)
+            await database.execute(
+                "INSERT INTO schema_version (version, description) VALUES (:version, :description)",
+                {"version": migration.version, "description": migration.description},
+            )
+
+        version = migration.version
+        print(f"Схема базы данных обновлена до версии {version}: {migration.description}")
+
+    return version
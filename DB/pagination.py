@@ -0,0 +1,31 @@
+import base64
+import binascii
+import json
+from typing import Optional, Tuple
+
+
+def encode_cursor(date_ts: Optional[int], letter_id: int) -> str:
+    """
+    Упаковывает позицию последнего выданного письма (date_ts, id) в непрозрачный
+    токен продолжения для постраничного листинга.
+    """
+    raw = json.dumps([date_ts, letter_id], separators=(",", ":")).encode("ascii")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    """
+    Разбирает токен, выданный encode_cursor.
+
+    Raises:
+        ValueError: Если токен поврежден или выдан не этим сервером.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date_ts, letter_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid pagination cursor")
+
+    if (date_ts is not None and type(date_ts) is not int) or type(letter_id) is not int:
+        raise ValueError("Invalid pagination cursor")
+    return date_ts, letter_id
@@ -1,6 +1,7 @@
 import imaplib
 import email as em
 import json
+import re
 import time
 from email.header import decode_header
 import os
@@ -13,7 +14,7 @@ class IMAPClient:
         self.port = port
         self.timeout = timeout
         self.mail = None
-        self.selected_email = None  # Переменная для хранения выбранного письма
+        self.uidvalidity = {}  # UIDVALIDITY папок, полученные при последнем выборе папки
 
     def open_connect(self):
         """Открывает соединение с почтовым сервером."""
@@ -45,6 +46,8 @@ class IMAPClient:
         if new_port:
             self.port = new_port
 
+        self.uidvalidity = {}
+
         # Открываем новое соединение с новыми учетными данными
         self.open_connect()
         print(f"Авторизация выполнена с новым аккаунтом: {self.email_user} на сервере {self.imap_server}:{self.port}")
@@ -59,8 +62,43 @@ class IMAPClient:
                 decoded_parts.append(part)
         return ''.join(decoded_parts)
 
+    def remember_uidvalidity(self, folder_name):
+        """Запоминает UIDVALIDITY, которое сервер вернул при выборе папки."""
+        _, data = self.mail.response("UIDVALIDITY")
+        if data and data[-1]:
+            self.uidvalidity[folder_name] = int(data[-1])
+
+    def get_uidvalidity(self, folder_name="Inbox"):
+        """
+        Возвращает UIDVALIDITY папки. Используется значение, полученное при последнем выборе папки,
+        иначе выполняется команда STATUS. Если сервер недоступен, возвращает None.
+        """
+        if folder_name in self.uidvalidity:
+            return self.uidvalidity[folder_name]
+
+        try:
+            if not self.is_connection_active():
+                self.close_connect()
+                self.open_connect()
+
+            status, data = self.mail.status(folder_name, "(UIDVALIDITY)")
+            if status != "OK" or not data or not data[0]:
+                return None
+
+            match = re.search(rb"UIDVALIDITY (\d+)", data[0])
+            if not match:
+                return None
+
+            self.uidvalidity[folder_name] = int(match.group(1))
+            return self.uidvalidity[folder_name]
+        except Exception as e:
+            print(f"Не удалось получить UIDVALIDITY папки '{folder_name}': {e}")
+            return None
+
     def is_connection_active(self):
         """Проверяет активность соединения с почтовым сервером."""
+        if self.mail is None:
+            return False
         try:
             status, _ = self.mail.noop()
             return status == "OK"
@@ -80,6 +118,7 @@ class IMAPClient:
             status, _ = self.mail.select(folder_name)
             if status != "OK":
                 raise Exception(f"Не удалось выбрать папку '{folder_name}'.")
+            self.remember_uidvalidity(folder_name)
 
             # Получаем UID всех писем
             status, messages = self.mail.uid("SEARCH", None, "ALL")
@@ -144,6 +183,7 @@ class IMAPClient:
             status, _ = self.mail.select(folder_name)
             if status != "OK":
                 raise Exception(f"Не удалось выбрать папку '{folder_name}'.")
+            self.remember_uidvalidity(folder_name)
 
             status, msg_data = self.mail.uid("FETCH", email_uid, "(RFC822)")
             if status != "OK" or not msg_data or not isinstance(msg_data[0], tuple):
@@ -151,7 +191,6 @@ class IMAPClient:
                 return None
 
             msg = em.message_from_bytes(msg_data[0][1])
-            self.selected_email = msg
 
             subject = self.decode_mime_words(msg["Subject"])
             from_ = self.decode_mime_words(msg["From"])
@@ -183,13 +222,15 @@ class IMAPClient:
         else:
             return msg.get_payload(decode=True).decode(msg.get_content_charset() or 'utf-8')
 
-    def save_attachment(self, save_path):
-        """Сохраняет вложения выбранного письма по указанному пути."""
-        if not self.selected_email:
-            raise ValueError("Письмо не выбрано. Сначала выберите письмо с помощью fetch_email_info().")
+    def save_attachment(self, email_info, save_path):
+        """
+        Сохраняет вложения письма, полученного через fetch_email_info(), по указанному пути.
+        Клиент не запоминает последнее письмо: один клиент обслуживает параллельные запросы.
+        """
+        if not email_info:
+            raise ValueError("Письмо не передано. Сначала получите его с помощью fetch_email_info().")
 
-        # Извлекаем вложения из выбранного письма
-        attachments = self.get_attachments(self.selected_email)
+        attachments = email_info.get("attachments")
         if not attachments:
             print("У выбранного письма нет вложений.")
             return
@@ -376,7 +417,7 @@ if __name__ == '__main__':
 
         # Сохраняем вложения письма в указанную папку
         try:
-            client.save_attachment(r"C:\Users\User\Pictures\Attachments")
+            client.save_attachment(email_info, r"C:\Users\User\Pictures\Attachments")
         except ValueError as e:
             print(e)
 
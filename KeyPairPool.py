@@ -0,0 +1,66 @@
+import asyncio
+from typing import Dict, Optional
+
+from config import KEY_POOL_SIZE, KEY_POOL_LOW_WATER
+
+
+class KeyPairPool:
+    """
+    Пул заранее сгенерированных наборов ключей (подпись + шифрование).
+
+    Наборы хранятся в таблице KeyPairPool, поэтому перезапуск сервера не опустошает пул.
+    Когда в пуле остается не больше low_water наборов, он пополняется в фоне до size.
+    """
+
+    def __init__(self, db, secure_email_client, size: int = KEY_POOL_SIZE, low_water: int = KEY_POOL_LOW_WATER):
+        self.db = db
+        self.secure_email_client = secure_email_client
+        self.size = size
+        self.low_water = min(low_water, size)
+        self._refill_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запускает пополнение пула, если в нем меньше size наборов."""
+        if await self.db.count_pooled_key_pairs() < self.size:
+            self.schedule_refill()
+
+    async def stop(self):
+        """Останавливает фоновое пополнение пула."""
+        if self._refill_task and not self._refill_task.done():
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+        self._refill_task = None
+
+    def schedule_refill(self):
+        """Запускает фоновое пополнение, если оно еще не идет."""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def pop(self) -> Dict:
+        """
+        Возвращает готовый набор ключей из пула.
+        Если пул пуст, ключи генерируются синхронно, как раньше.
+        """
+        keys = await self.db.pop_pooled_key_pair()
+        if keys is None:
+            keys = await asyncio.to_thread(self.secure_email_client.generate_keys)
+
+        if await self.db.count_pooled_key_pairs() <= self.low_water:
+            self.schedule_refill()
+
+        return keys
+
+    async def _refill(self):
+        """Генерирует наборы ключей, пока пул не заполнится до size."""
+        try:
+            while await self.db.count_pooled_key_pairs() < self.size:
+                keys = await asyncio.to_thread(self.secure_email_client.generate_keys)
+                await self.db.add_pooled_key_pair(**keys)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Например, сервис шифрования недоступен: попробуем при следующем извлечении
+            print(f"Ошибка при пополнении пула ключей: {e}")
@@ -0,0 +1,345 @@
+"""
+Встроенная реализация SecureEmailService.
+
+Выполняет GenerateKeys/ProcessEmail/VerifyEmail в пуле рабочих процессов того же хоста,
+без сетевого вызова и сериализации всего письма в protobuf. Тот же код обслуживает
+gRPC-сервер (serve), который можно поднять локально вместо внешнего сервиса, например в тестах.
+
+Схема шифрования: RSA-2048 (PKCS#1 PEM), DES-CBC для тела и вложений,
+RSA-OAEP для DES-ключа, подпись PKCS#1 v1.5 над SHA-256 от хешей тела и вложений.
+Тело и каждое вложение шифруются и хешируются независимо, поэтому письмо с несколькими
+большими вложениями обрабатывается на всех ядрах (схема SCHEME_INPROCESS_V2).
+Письма схемы SCHEME_INPROCESS_V1, где подпись шла над телом и хешами вложений,
+по-прежнему проверяются. Формат внешнего сервиса эта реализация не воспроизводит.
+"""
+import argparse
+import os
+from concurrent import futures
+from itertools import repeat
+
+import grpc
+
+try:
+    from Crypto.Cipher import DES, PKCS1_OAEP
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Random import get_random_bytes
+    from Crypto.Signature import pkcs1_15
+    from Crypto.Util.Padding import pad, unpad
+except ImportError:  # Встроенная реализация требует пакет pycryptodome
+    RSA = None
+
+from config import SECURE_EMAIL_WORKERS
+from secureemail_pb2 import (
+    Email, Attachment, EncryptedEmail, EncryptedAttachment, KeyGenerationResponse,
+    AttachmentChunk, EncryptedEmailMetadata, EncryptedEmailChunk, EmailChunk,
+)
+from secureemail_pb2_grpc import SecureEmailServiceServicer, add_SecureEmailServiceServicer_to_server
+from SecureEmailClient import SecureEmailBackend, SCHEME_INPROCESS_V1, SCHEME_INPROCESS_V2, iter_chunks
+
+RSA_KEY_SIZE = 2048
+
+
+class InvalidEmailKeys(ValueError):
+    """Ключи не подходят к письму: не удалось расшифровать DES-ключ или проверить подпись."""
+
+
+class InProcessRpcError(grpc.RpcError):
+    """Ошибка встроенной реализации в том же виде, что и ошибка gRPC-заглушки."""
+
+    def __init__(self, code: grpc.StatusCode, details: str):
+        super().__init__(details)
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+
+def _email_digest(part_digests) -> "SHA256.SHA256Hash":
+    """SHA-256 от конкатенации хешей тела и вложений (по порядку)."""
+    return SHA256.new(b"".join(part_digests))
+
+
+def _email_digest_v1(email_body: bytes, attachment_digests) -> "SHA256.SHA256Hash":
+    """SHA-256 тела письма и хешей всех вложений по порядку (схема SCHEME_INPROCESS_V1)."""
+    digest = SHA256.new(email_body)
+    for attachment_digest in attachment_digests:
+        digest.update(attachment_digest)
+    return digest
+
+
+def generate_keys() -> dict:
+    """Генерирует пары RSA-ключей для подписи и для шифрования."""
+    sign_key = RSA.generate(RSA_KEY_SIZE)
+    encrypt_key = RSA.generate(RSA_KEY_SIZE)
+    return {
+        "private_key_sign": sign_key.export_key(),
+        "public_key_sign": sign_key.publickey().export_key(),
+        "private_key_encrypt": encrypt_key.export_key(),
+        "public_key_encrypt": encrypt_key.publickey().export_key(),
+    }
+
+
+def encrypt_part(des_key: bytes, iv: bytes, content: bytes):
+    """Шифрует тело или одно вложение. Возвращает (шифротекст, SHA-256 открытого текста)."""
+    encrypted = DES.new(des_key, DES.MODE_CBC, iv).encrypt(pad(content, DES.block_size))
+    return encrypted, SHA256.new(content).digest()
+
+
+def decrypt_part(des_key: bytes, iv: bytes, content: bytes):
+    """
+    Расшифровывает тело или одно вложение. Возвращает (открытый текст, SHA-256 открытого текста).
+
+    Raises:
+        InvalidEmailKeys: Если DES-ключ не подходит (неверное дополнение).
+    """
+    try:
+        decrypted = unpad(DES.new(des_key, DES.MODE_CBC, iv).decrypt(content), DES.block_size)
+    except ValueError as e:
+        raise InvalidEmailKeys(f"Ключи не подходят к письму: {e}")
+    return decrypted, SHA256.new(decrypted).digest()
+
+
+def wrap_des_key(public_key_encrypt: bytes, des_key: bytes) -> bytes:
+    """Шифрует DES-ключ публичным ключом получателя."""
+    return PKCS1_OAEP.new(RSA.import_key(public_key_encrypt)).encrypt(des_key)
+
+
+def unwrap_des_key(private_key_encrypt: bytes, encrypted_des_key: bytes) -> bytes:
+    """Расшифровывает DES-ключ приватным ключом получателя."""
+    try:
+        return PKCS1_OAEP.new(RSA.import_key(private_key_encrypt)).decrypt(encrypted_des_key)
+    except (ValueError, TypeError) as e:
+        raise InvalidEmailKeys(f"Ключи не подходят к письму: {e}")
+
+
+def sign_digests(private_key_sign: bytes, part_digests) -> bytes:
+    """Подписывает хеши тела и вложений."""
+    return pkcs1_15.new(RSA.import_key(private_key_sign)).sign(_email_digest(part_digests))
+
+
+def verify_digests(public_key_sign: bytes, part_digests, signature: bytes):
+    """Проверяет подпись над хешами тела и вложений."""
+    _verify_signature(public_key_sign, _email_digest(part_digests), signature)
+
+
+def verify_digests_v1(public_key_sign: bytes, email_body: bytes, attachment_digests, signature: bytes):
+    """Проверяет подпись письма схемы SCHEME_INPROCESS_V1."""
+    _verify_signature(public_key_sign, _email_digest_v1(email_body, attachment_digests), signature)
+
+
+def _verify_signature(public_key_sign: bytes, digest, signature: bytes):
+    try:
+        pkcs1_15.new(RSA.import_key(public_key_sign)).verify(digest, signature)
+    except (ValueError, TypeError) as e:
+        raise InvalidEmailKeys(f"Ключи не подходят к письму: {e}")
+
+
+class InProcessSecureEmailBackend(SecureEmailBackend):
+    """Реализация SecureEmailService в пуле процессов текущего хоста."""
+
+    name = "inprocess"
+    scheme = SCHEME_INPROCESS_V2
+
+    def __init__(self, workers: int = SECURE_EMAIL_WORKERS):
+        if RSA is None:
+            raise RuntimeError("Для встроенной реализации SecureEmailService требуется пакет pycryptodome.")
+        self.executor = futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+    def _run(self, func, *args):
+        try:
+            return self.executor.submit(func, *args).result()
+        except InvalidEmailKeys as e:
+            raise InProcessRpcError(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    def _run_parts(self, func, key: bytes, iv: bytes, parts):
+        """
+        Обрабатывает тело и каждое вложение отдельной задачей пула процессов,
+        результаты возвращаются в исходном порядке.
+        """
+        try:
+            return list(self.executor.map(func, repeat(key), repeat(iv), parts))
+        except InvalidEmailKeys as e:
+            raise InProcessRpcError(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    def generate_keys(self):
+        return self._run(generate_keys)
+
+    def process_email(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        des_key = get_random_bytes(8)
+        iv = get_random_bytes(8)
+
+        wrapped_key = self.executor.submit(wrap_des_key, public_key_encrypt, des_key)
+        parts = self._run_parts(encrypt_part, des_key, iv, [email_body] + [att["content"] for att in attachments])
+        signature = self._run(sign_digests, private_key_sign, [digest for _, digest in parts])
+
+        return EncryptedEmail(
+            iv=iv,
+            encrypted_des_key=wrapped_key.result(),
+            signature=signature,
+            encrypted_content=parts[0][0],
+            encrypted_attachments=[
+                EncryptedAttachment(filename=att["filename"], content=encrypted)
+                for att, (encrypted, _) in zip(attachments, parts[1:])
+            ],
+        )
+
+    def verify_email(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        encrypted_attachments = encrypted_email.get("encrypted_attachments", [])
+
+        des_key = self._run(unwrap_des_key, private_key_encrypt, encrypted_email["encrypted_des_key"])
+        parts = self._run_parts(
+            decrypt_part, des_key, encrypted_email["iv"],
+            [encrypted_email["encrypted_content"]] + [att["content"] for att in encrypted_attachments],
+        )
+        if scheme == SCHEME_INPROCESS_V1:
+            self._run(
+                verify_digests_v1, public_key_sign, parts[0][0],
+                [digest for _, digest in parts[1:]], encrypted_email["signature"],
+            )
+        else:
+            self._run(verify_digests, public_key_sign, [digest for _, digest in parts], encrypted_email["signature"])
+
+        return Email(
+            email_body=parts[0][0],
+            attachments=[
+                Attachment(filename=att["filename"], content=decrypted)
+                for att, (decrypted, _) in zip(encrypted_attachments, parts[1:])
+            ],
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SecureEmailServicer(SecureEmailServiceServicer):
+    """gRPC-сервис поверх встроенной реализации (локальная замена внешнего сервиса)."""
+
+    def __init__(self, backend: InProcessSecureEmailBackend):
+        self.backend = backend
+
+    def _call(self, context, method, *args):
+        try:
+            return method(*args)
+        except InProcessRpcError as e:
+            context.abort(e.code(), e.details())
+
+    def GenerateKeys(self, request, context):
+        return KeyGenerationResponse(**self._call(context, self.backend.generate_keys))
+
+    def ProcessEmail(self, request, context):
+        return self._call(
+            context, self.backend.process_email,
+            request.email.email_body,
+            [{"filename": att.filename, "content": att.content} for att in request.email.attachments],
+            request.private_key_sign,
+            request.public_key_encrypt,
+        )
+
+    def VerifyEmail(self, request, context):
+        encrypted = request.encrypted_email
+        return self._call(
+            context, self.backend.verify_email,
+            {
+                "iv": encrypted.iv,
+                "encrypted_des_key": encrypted.encrypted_des_key,
+                "signature": encrypted.signature,
+                "encrypted_content": encrypted.encrypted_content,
+                "encrypted_attachments": [
+                    {"filename": att.filename, "content": att.content} for att in encrypted.encrypted_attachments
+                ],
+            },
+            request.private_key_encrypt,
+            request.public_key_sign,
+        )
+
+    @staticmethod
+    def _read_stream(request_iterator, body_field):
+        """Собирает входной поток: метаданные, тело и вложения по индексам."""
+        metadata = None
+        body = bytearray()
+        attachments = {}
+        for chunk in request_iterator:
+            payload = chunk.WhichOneof("payload")
+            if payload == "metadata":
+                metadata = chunk.metadata
+            elif payload == body_field:
+                body += getattr(chunk, body_field)
+            elif payload == "attachment_chunk":
+                part = chunk.attachment_chunk
+                filename, data = attachments.setdefault(part.index, (part.filename, bytearray()))
+                data += part.content
+        return metadata, bytes(body), [
+            {"filename": filename, "content": bytes(data)} for _, (filename, data) in sorted(attachments.items())
+        ]
+
+    @staticmethod
+    def _attachment_chunks(chunk_cls, attachments):
+        for index, att in enumerate(attachments):
+            first = True
+            for data in iter_chunks(att.content):
+                yield chunk_cls(attachment_chunk=AttachmentChunk(
+                    index=index, filename=att.filename if first else "", content=data,
+                ))
+                first = False
+            if first:
+                yield chunk_cls(attachment_chunk=AttachmentChunk(index=index, filename=att.filename))
+
+    def ProcessEmailStream(self, request_iterator, context):
+        metadata, body, attachments = self._read_stream(request_iterator, "body_chunk")
+        encrypted = self._call(
+            context, self.backend.process_email,
+            body, attachments, metadata.private_key_sign, metadata.public_key_encrypt,
+        )
+        yield EncryptedEmailChunk(metadata=EncryptedEmailMetadata(
+            iv=encrypted.iv, encrypted_des_key=encrypted.encrypted_des_key, signature=encrypted.signature,
+        ))
+        for data in iter_chunks(encrypted.encrypted_content):
+            yield EncryptedEmailChunk(content_chunk=data)
+        yield from self._attachment_chunks(EncryptedEmailChunk, encrypted.encrypted_attachments)
+
+    def VerifyEmailStream(self, request_iterator, context):
+        metadata, content, attachments = self._read_stream(request_iterator, "content_chunk")
+        email = self._call(
+            context, self.backend.verify_email,
+            {
+                "iv": metadata.iv,
+                "encrypted_des_key": metadata.encrypted_des_key,
+                "signature": metadata.signature,
+                "encrypted_content": content,
+                "encrypted_attachments": attachments,
+            },
+            metadata.private_key_encrypt,
+            metadata.public_key_sign,
+        )
+        for data in iter_chunks(email.email_body):
+            yield EmailChunk(body_chunk=data)
+        yield from self._attachment_chunks(EmailChunk, email.attachments)
+
+
+def serve(address: str = "localhost:50051", workers: int = SECURE_EMAIL_WORKERS):
+    """
+    Запускает gRPC-сервер на встроенной реализации. Возвращает (server, port);
+    для address вида "localhost:0" порт выбирается автоматически.
+    """
+    backend = InProcessSecureEmailBackend(workers)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=(workers or os.cpu_count()) * 2))
+    add_SecureEmailServiceServicer_to_server(SecureEmailServicer(backend), server)
+    port = server.add_insecure_port(address)
+    server.start()
+    return server, port
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный SecureEmailService на встроенной реализации.")
+    parser.add_argument("--address", default="localhost:50051")
+    parser.add_argument("--workers", type=int, default=SECURE_EMAIL_WORKERS)
+    args = parser.parse_args()
+
+    grpc_server, grpc_port = serve(args.address, args.workers)
+    print(f"SecureEmailService запущен на порту {grpc_port}")
+    grpc_server.wait_for_termination()
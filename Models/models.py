@@ -40,9 +40,29 @@ class FetchEmailsRequest(BaseModel):
     folder_name: Optional[str] = "Inbox"
     offset: Optional[int] = None
     limit: Optional[int] = None
+    cursor: Optional[str] = None  # Токен next_cursor из предыдущего ответа
 
 class FetchEmailsResponse(BaseModel):
     emailsList: List[SummaryEmailResponse]
+    next_cursor: Optional[str] = None  # None, если страница последняя или пагинация не по курсору
+
+# Models для полнотекстового поиска по сохраненным письмам
+class SearchEmailsRequest(BaseModel):
+    query: str
+    folder_name: Optional[str] = None  # None - искать во всех папках
+    offset: Optional[int] = 0
+    limit: Optional[int] = 20
+
+class SearchEmailResult(BaseModel):
+    id: int
+    folder_name: str
+    sender: str
+    subject: str
+    date: str
+    snippet: str  # Фрагмент текста, найденные слова выделены <b>...</b>
+
+class SearchEmailsResponse(BaseModel):
+    results: List[SearchEmailResult]
 
 # Модели данных для авторизации
 class AccountCredentials(BaseModel):
@@ -65,6 +85,7 @@ class FetchEmailInfoResponse(BaseModel):
     date: str
     body: str
     attachments: Optional[List[str]] = None
+    attachment_urls: Optional[List[str]] = None  # Ссылки на вложения в том же порядке, что и attachments
 
     class Config:
         arbitrary_types_allowed = True
@@ -85,6 +106,13 @@ class KeyDatesResponse(BaseModel):
     last_public_key_date: Optional[datetime] = None
     last_private_key_date: Optional[datetime] = None
 
+# Политика хранения писем в локальной базе; None - без ограничения
+class RetentionPolicy(BaseModel):
+    folder_name: str
+    max_age_days: Optional[int] = None  # Письма, не открывавшиеся дольше, удаляются
+    max_count: Optional[int] = None
+    max_bytes: Optional[int] = None
+
 class MoveToTrashRequest(BaseModel):
     email_id: int
     folder_name: str = "Inbox"
\ No newline at end of file
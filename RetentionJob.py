@@ -0,0 +1,88 @@
+import asyncio
+from typing import Optional
+
+from config import RETENTION_INTERVAL, VACUUM_SLICE_PAGES
+
+# Пауза между пачками вытеснения и шагами incremental_vacuum, чтобы не занимать писателя подряд
+RETENTION_PAUSE = 0.05
+
+
+class RetentionJob:
+    """
+    Фоновое применение политик хранения к локальному хранилищу писем.
+
+    Раз в interval секунд для каждого почтового ящика записывает время открытия писем,
+    вытесняет письма сверх политик хранения папок (сначала те, что дольше всего не открывались) и возвращает
+    освободившееся место файлов баз через PRAGMA incremental_vacuum. Вся работа идет
+    небольшими пачками с паузами, поэтому API не блокируется надолго.
+    """
+
+    def __init__(
+            self, db, interval: float = RETENTION_INTERVAL,
+            vacuum_pages: int = VACUUM_SLICE_PAGES, pause: float = RETENTION_PAUSE,
+    ):
+        self.db = db
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает периодическую задачу, если она еще не идет."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает периодическую задачу."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка при применении политик хранения: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """
+        Один проход по всем почтовым ящикам: вытеснение по папкам и сжатие файлов баз.
+        Возвращает число удаленных писем.
+        """
+        evicted = 0
+        for account in await self.db.get_accounts():
+            async with self.db.mailbox(account) as mailbox:
+                evicted += await self._apply_policies(mailbox)
+                await self._compact(mailbox)
+
+        if evicted:
+            print(f"Политики хранения: удалено писем - {evicted}")
+
+        # Каталог тоже освобождает место, например после переноса писем в ящики
+        await self._compact(self.db)
+        return evicted
+
+    async def _apply_policies(self, mailbox) -> int:
+        await mailbox.flush_opened_letters()
+
+        evicted = 0
+        for policy in await mailbox.get_retention_policies():
+            while True:
+                count = await mailbox.evict_letters(policy)
+                evicted += count
+                if not count:
+                    break
+                await asyncio.sleep(self.pause)
+        return evicted
+
+    async def _compact(self, store):
+        while await store.compact(self.vacuum_pages) >= self.vacuum_pages:
+            await asyncio.sleep(self.pause)
@@ -1,12 +1,105 @@
+from abc import ABC, abstractmethod
+
 import grpc
-from secureemail_pb2 import EmptyRequest, ProcessEmailRequest, VerifyEmailRequest, Email, Attachment
+from secureemail_pb2 import (
+    EmptyRequest, ProcessEmailRequest, VerifyEmailRequest, Email, Attachment,
+    EncryptedEmail, EncryptedAttachment, AttachmentChunk,
+    ProcessEmailMetadata, ProcessEmailChunk, VerifyEmailMetadata, VerifyEmailChunk,
+)
 from secureemail_pb2_grpc import SecureEmailServiceStub
 
+from config import SECURE_EMAIL_BACKEND, SECURE_EMAIL_SERVER
 
-class SecureEmailClient:
-    def __init__(self, server_address: str = "localhost:50051"):
+# Размер одного фрагмента при потоковой передаче (значительно меньше лимита gRPC в 4 МБ)
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Начиная с этого суммарного размера тела и вложений письмо передается потоком
+STREAMING_THRESHOLD = 3 * 1024 * 1024
+
+# Схемы шифрования, записываемые в поле "scheme" зашифрованного письма. Реализации несовместимы
+# по формату шифротекста и подписи, поэтому письмо проверяется той реализацией, что его создала.
+# Письма без поля "scheme" созданы до его появления и проверяются перебором LEGACY_SCHEMES
+SCHEME_GRPC = "grpc"  # Формат внешнего gRPC-сервиса
+SCHEME_INPROCESS_V1 = "inprocess-1"  # Встроенная реализация: подпись над телом и хешами вложений
+SCHEME_INPROCESS_V2 = "inprocess-2"  # Встроенная реализация: подпись над хешами тела и вложений
+
+# Реализация, проверяющая письма каждой схемы
+SCHEME_BACKENDS = {
+    SCHEME_GRPC: "grpc",
+    SCHEME_INPROCESS_V1: "inprocess",
+    SCHEME_INPROCESS_V2: "inprocess",
+}
+
+LEGACY_SCHEMES = (SCHEME_GRPC, SCHEME_INPROCESS_V2, SCHEME_INPROCESS_V1)
+
+
+def iter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Разбивает данные на фрагменты не больше chunk_size без копирования всего буфера."""
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+
+def payload_size(email_body: bytes, attachments) -> int:
+    """Суммарный размер тела письма и вложений в байтах."""
+    return len(email_body or b"") + sum(len(att["content"] or b"") for att in attachments)
+
+
+class SecureEmailBackend(ABC):
+    """
+    Интерфейс реализации SecureEmailService.
+
+    Методы принимают и возвращают те же объекты, что и gRPC-заглушка: process_email возвращает
+    EncryptedEmail, verify_email - Email. Если ключи не подходят, реализация выбрасывает
+    grpc.RpcError с кодом INVALID_ARGUMENT. process_email шифрует по схеме scheme,
+    verify_email принимает схему письма (одну из тех, что SCHEME_BACKENDS относит к name).
+    """
+
+    name: str
+    scheme: str
+
+    @abstractmethod
+    def generate_keys(self):
+        ...
+
+    @abstractmethod
+    def process_email(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        ...
+
+    @abstractmethod
+    def verify_email(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        ...
+
+    def process_email_stream(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        return self.process_email(email_body, attachments, private_key_sign, public_key_encrypt)
+
+    def verify_email_stream(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        return self.verify_email(encrypted_email, private_key_encrypt, public_key_sign, scheme)
+
+    def close(self):
+        """Освобождает ресурсы реализации."""
+
+
+class GrpcSecureEmailBackend(SecureEmailBackend):
+    """Реализация через внешний gRPC-сервис шифрования."""
+
+    name = "grpc"
+    scheme = SCHEME_GRPC
+
+    def __init__(self, server_address: str = SECURE_EMAIL_SERVER):
         self.channel = grpc.insecure_channel(server_address)
         self.stub = SecureEmailServiceStub(self.channel)
+        # Сервис старой версии не реализует потоковые методы; после первого UNIMPLEMENTED
+        # письма передаются обычными вызовами (до 4 МБ, как и раньше)
+        self.streaming_supported = True
+
+    def _streaming_unimplemented(self, error: grpc.RpcError) -> bool:
+        """Запоминает, что сервис не поддерживает потоковые методы, если error - UNIMPLEMENTED."""
+        if error.code() != grpc.StatusCode.UNIMPLEMENTED:
+            return False
+        print("Сервис шифрования не поддерживает потоковую передачу, используются обычные вызовы")
+        self.streaming_supported = False
+        return True
 
     def generate_keys(self):
         response = self.stub.GenerateKeys(EmptyRequest())
@@ -31,10 +124,212 @@ class SecureEmailClient:
         )
         return self.stub.ProcessEmail(request)
 
-    def verify_email(self, encrypted_email, private_key_encrypt, public_key_sign):
+    def verify_email(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
         request = VerifyEmailRequest(
             encrypted_email=encrypted_email,
             private_key_encrypt=private_key_encrypt,
             public_key_sign=public_key_sign,
         )
         return self.stub.VerifyEmail(request)
+
+    def process_email_stream(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        """
+        Потоковый вариант process_email: метаданные, затем тело и вложения фрагментами.
+        Возвращает EncryptedEmail, собранный из ответного потока. Если сервис не реализует
+        ProcessEmailStream, письмо отправляется обычным вызовом process_email.
+        """
+        if not self.streaming_supported:
+            return self.process_email(email_body, attachments, private_key_sign, public_key_encrypt)
+
+        def request_iterator():
+            yield ProcessEmailChunk(metadata=ProcessEmailMetadata(
+                private_key_sign=private_key_sign,
+                public_key_encrypt=public_key_encrypt,
+                attachments_count=len(attachments),
+            ))
+            for chunk in iter_chunks(email_body):
+                yield ProcessEmailChunk(body_chunk=chunk)
+            for index, att in enumerate(attachments):
+                yield from self._attachment_chunks(ProcessEmailChunk, index, att["filename"], att["content"])
+
+        content = []
+        attachments_parts = {}
+        encrypted_email = EncryptedEmail()
+
+        try:
+            for response in self.stub.ProcessEmailStream(request_iterator()):
+                payload = response.WhichOneof("payload")
+                if payload == "metadata":
+                    encrypted_email.iv = response.metadata.iv
+                    encrypted_email.encrypted_des_key = response.metadata.encrypted_des_key
+                    encrypted_email.signature = response.metadata.signature
+                elif payload == "content_chunk":
+                    content.append(response.content_chunk)
+                elif payload == "attachment_chunk":
+                    self._collect_attachment_chunk(attachments_parts, response.attachment_chunk)
+        except grpc.RpcError as e:
+            if not self._streaming_unimplemented(e):
+                raise
+            return self.process_email(email_body, attachments, private_key_sign, public_key_encrypt)
+
+        # Фрагменты склеиваются один раз, без промежуточного буфера
+        encrypted_email.encrypted_content = b"".join(content)
+        encrypted_email.encrypted_attachments.extend(
+            EncryptedAttachment(filename=filename, content=b"".join(parts))
+            for _, (filename, parts) in sorted(attachments_parts.items())
+        )
+        return encrypted_email
+
+    def verify_email_stream(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        """
+        Потоковый вариант verify_email. encrypted_email передается в том же формате,
+        что и для verify_email (словарь с полями EncryptedEmail). Возвращает Email. Если сервис
+        не реализует VerifyEmailStream, письмо проверяется обычным вызовом verify_email.
+        """
+        if not self.streaming_supported:
+            return self.verify_email(encrypted_email, private_key_encrypt, public_key_sign)
+
+        encrypted_attachments = encrypted_email.get("encrypted_attachments", [])
+
+        def request_iterator():
+            yield VerifyEmailChunk(metadata=VerifyEmailMetadata(
+                iv=encrypted_email["iv"],
+                encrypted_des_key=encrypted_email["encrypted_des_key"],
+                signature=encrypted_email["signature"],
+                private_key_encrypt=private_key_encrypt,
+                public_key_sign=public_key_sign,
+                attachments_count=len(encrypted_attachments),
+            ))
+            for chunk in iter_chunks(encrypted_email["encrypted_content"]):
+                yield VerifyEmailChunk(content_chunk=chunk)
+            for index, att in enumerate(encrypted_attachments):
+                yield from self._attachment_chunks(VerifyEmailChunk, index, att["filename"], att["content"])
+
+        body = []
+        attachments_parts = {}
+
+        try:
+            for response in self.stub.VerifyEmailStream(request_iterator()):
+                payload = response.WhichOneof("payload")
+                if payload == "body_chunk":
+                    body.append(response.body_chunk)
+                elif payload == "attachment_chunk":
+                    self._collect_attachment_chunk(attachments_parts, response.attachment_chunk)
+        except grpc.RpcError as e:
+            if not self._streaming_unimplemented(e):
+                raise
+            return self.verify_email(encrypted_email, private_key_encrypt, public_key_sign)
+
+        return Email(
+            email_body=b"".join(body),
+            attachments=[
+                Attachment(filename=filename, content=b"".join(parts))
+                for _, (filename, parts) in sorted(attachments_parts.items())
+            ],
+        )
+
+    @staticmethod
+    def _attachment_chunks(chunk_cls, index, filename, content):
+        """Фрагменты одного вложения; имя файла передается только в первом фрагменте."""
+        first = True
+        for chunk in iter_chunks(content):
+            yield chunk_cls(attachment_chunk=AttachmentChunk(
+                index=index, filename=filename if first else "", content=chunk,
+            ))
+            first = False
+        if first:
+            # Пустое вложение все равно должно дойти до сервера
+            yield chunk_cls(attachment_chunk=AttachmentChunk(index=index, filename=filename))
+
+    @staticmethod
+    def _collect_attachment_chunk(attachments_parts, chunk):
+        """Добавляет фрагмент вложения к уже полученным фрагментам с тем же индексом."""
+        filename, parts = attachments_parts.setdefault(chunk.index, (chunk.filename, []))
+        if chunk.filename and not filename:
+            attachments_parts[chunk.index] = (chunk.filename, parts)
+        parts.append(chunk.content)
+
+    def close(self):
+        self.channel.close()
+
+
+def create_backend(name: str = SECURE_EMAIL_BACKEND, server_address: str = SECURE_EMAIL_SERVER) -> SecureEmailBackend:
+    """Создает реализацию SecureEmailService по имени из конфигурации."""
+    if name == "grpc":
+        return GrpcSecureEmailBackend(server_address)
+    if name == "inprocess":
+        from LocalSecureEmailService import InProcessSecureEmailBackend
+        return InProcessSecureEmailBackend()
+    raise ValueError(f"Неизвестная реализация SecureEmailService: '{name}'")
+
+
+class SecureEmailClient:
+    """
+    Клиент SecureEmailService, делегирующий вызовы выбранной реализации. Письма шифруются
+    выбранной реализацией, а проверяются той, чья схема указана в письме; другая реализация
+    создается при первом таком письме.
+    """
+
+    def __init__(self, server_address: str = SECURE_EMAIL_SERVER, backend: SecureEmailBackend = None):
+        self.server_address = server_address
+        self.backend = backend if backend is not None else create_backend(server_address=server_address)
+        self._backends = {self.backend.name: self.backend}
+
+    @property
+    def scheme(self) -> str:
+        """Схема, по которой шифруются отправляемые письма."""
+        return self.backend.scheme
+
+    def _backend_for(self, scheme: str) -> SecureEmailBackend:
+        """Реализация, проверяющая письма схемы scheme."""
+        name = SCHEME_BACKENDS.get(scheme)
+        if name is None:
+            raise ValueError(f"Неизвестная схема шифрования письма: '{scheme}'")
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._backends[name] = create_backend(name, self.server_address)
+        return backend
+
+    def _verify(self, method: str, encrypted_email, private_key_encrypt, public_key_sign, scheme):
+        """
+        Проверяет письмо реализацией его схемы. Письмо без схемы проверяется по очереди
+        схемами LEGACY_SCHEMES, начиная со схем выбранной реализации; если не подошла ни одна,
+        выбрасывается ошибка выбранной реализации.
+        """
+        if scheme is not None:
+            backend = self._backend_for(scheme)
+            return getattr(backend, method)(encrypted_email, private_key_encrypt, public_key_sign, scheme)
+
+        first_error = None
+        for legacy_scheme in sorted(LEGACY_SCHEMES, key=lambda item: SCHEME_BACKENDS[item] != self.backend.name):
+            try:
+                backend = self._backend_for(legacy_scheme)
+            except RuntimeError as e:  # Другая реализация недоступна в этом окружении
+                print(f"Схема {legacy_scheme} не проверяется: {e}")
+                continue
+            try:
+                return getattr(backend, method)(encrypted_email, private_key_encrypt, public_key_sign, legacy_scheme)
+            except grpc.RpcError as e:
+                if backend is self.backend and e.code() != grpc.StatusCode.INVALID_ARGUMENT:
+                    raise
+                first_error = first_error or e
+        raise first_error
+
+    def generate_keys(self):
+        return self.backend.generate_keys()
+
+    def process_email(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        return self.backend.process_email(email_body, attachments, private_key_sign, public_key_encrypt)
+
+    def verify_email(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        return self._verify("verify_email", encrypted_email, private_key_encrypt, public_key_sign, scheme)
+
+    def process_email_stream(self, email_body, attachments, private_key_sign, public_key_encrypt):
+        return self.backend.process_email_stream(email_body, attachments, private_key_sign, public_key_encrypt)
+
+    def verify_email_stream(self, encrypted_email, private_key_encrypt, public_key_sign, scheme=None):
+        return self._verify("verify_email_stream", encrypted_email, private_key_encrypt, public_key_sign, scheme)
+
+    def close(self):
+        for backend in self._backends.values():
+            backend.close()
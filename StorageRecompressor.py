@@ -0,0 +1,57 @@
+import asyncio
+from typing import Optional
+
+# Пауза между пачками, чтобы фоновая задача не занимала писателя подряд
+RECOMPRESS_PAUSE = 0.05
+
+
+class StorageRecompressor:
+    """
+    Фоновое пересжатие тел писем и блобов вложений, сохраненных не в текущем кодеке
+    (например, до появления сжатия или до установки zstandard).
+
+    Работает небольшими пачками с паузами, поэтому не мешает обработке запросов.
+    Проход начинается при старте приложения и заканчивается, когда пересжимать нечего.
+    """
+
+    def __init__(self, db, pause: float = RECOMPRESS_PAUSE):
+        self.db = db
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает проход по почтовым ящикам, если он еще не идет."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновое пересжатие."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        try:
+            for account in await self.db.get_accounts():
+                async with self.db.mailbox(account) as mailbox:
+                    await self._recompress(mailbox)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Данные остаются в прежнем кодеке; следующая попытка - при следующем запуске
+            print(f"Ошибка при пересжатии хранилища: {e}")
+
+    async def _recompress(self, mailbox):
+        after_rowid = 0
+        while after_rowid is not None:
+            after_rowid = await mailbox.recompress_letters(after_rowid)
+            await asyncio.sleep(self.pause)
+
+        after_hash = ""
+        while after_hash is not None:
+            after_hash = await mailbox.recompress_blobs(after_hash)
+            await asyncio.sleep(self.pause)
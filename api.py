@@ -1,29 +1,45 @@
+import asyncio
+import binascii
+import gzip
 import os.path
 import json
 import re
-from contextlib import asynccontextmanager
+import zlib
+from contextlib import AsyncExitStack, asynccontextmanager
 
 import base64
 from datetime import datetime
-from io import BytesIO
+from urllib.parse import urlencode
 
 import grpc
 import uvicorn
-from fastapi import FastAPI, HTTPException, Form, UploadFile, File
+from fastapi import FastAPI, HTTPException, Form, UploadFile, File, Request, Depends, Header, Query
 from pydantic import BaseModel
 from typing import List, Optional
 
 from starlette.responses import JSONResponse
 
+from DB.MessageCache import MessageCache
 from DB.RSAKeyDatabase import RSAKeyDatabase
+from DB.compression import CODEC_NONE
 from EProtocols.IMAPClient import IMAPClient  # Используем существующий IMAPClient
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 
 from EProtocols.SMTPClient import SMTPClient
-from SecureEmailClient import SecureEmailClient
+from AccountRegistry import AccountRegistry
+from SecureEmailClient import SecureEmailClient, STREAMING_THRESHOLD, payload_size
+from KeyPairPool import KeyPairPool
+from StorageRecompressor import StorageRecompressor
+from RetentionJob import RetentionJob
+from AttachmentCodec import b64decode_parts, b64encode_parts, shutdown as shutdown_attachment_codec
+from AttachmentResponse import blob_response, bytes_response, content_etag
 
 from Models.models import *
+from config import (
+    DEFAULT_EMAIL_USER, DEFAULT_EMAIL_PASS, DEFAULT_IMAP_SERVER, DEFAULT_IMAP_PORT,
+    DEFAULT_SMTP_SERVER, DEFAULT_SMTP_PORT, ATTACHMENT_LINK_TTL,
+)
 
 # Использование lifespan для событий старта и остановки
 @asynccontextmanager
@@ -31,19 +47,28 @@ async def lifespan(app: FastAPI):
     # Инициализация при старте
     await db.connect()
     await db.create_tables()
-    imap_client.open_connect()
+    await key_pair_pool.start()
+    storage_recompressor.start()
+    retention_job.start()
+    account_registry.start()
+    await seed_default_session()
     print("Приложение запущено!")
     yield
     # Очистка при завершении
-    # Остановка IMAP-клиента при завершении работы сервера
-    imap_client.close_connect()
+    # Закрытие IMAP- и SMTP-соединений аккаунтов при завершении работы сервера
+    await account_registry.stop()
+    await key_pair_pool.stop()
+    await storage_recompressor.stop()
+    await retention_job.stop()
+    secure_email_client.close()
+    shutdown_attachment_codec()
     await db.disconnect()
     print("Приложение завершено!")
 
 
 app = FastAPI(lifespan=lifespan)
 
-# Инициализация gRPC клиента
+# Инициализация клиента SecureEmailService (реализация выбирается в config.SECURE_EMAIL_BACKEND)
 secure_email_client = SecureEmailClient()
 
 # Настройка CORS
@@ -64,61 +89,199 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Инициализация IMAP-клиента
-imap_client = IMAPClient("imap.mail.ru", "donntu_test@mail.ru", "9P4vtaiQX2754f1Kh32w")
+db = RSAKeyDatabase()
 
-# Инициализация SMTP-клиента
-smtp_client = SMTPClient("smtp.mail.ru", "donntu_test@mail.ru", "9P4vtaiQX2754f1Kh32w")
+# Токен сессии для запросов без заголовка X-Session-Token; она есть, только если
+# учетная запись по умолчанию задана в конфигурации
+DEFAULT_SESSION = "default"
 
-db = RSAKeyDatabase()
+async def seed_default_session():
+    """
+    Создает сессию по умолчанию из конфигурации или удаляет ее, если учетная запись
+    по умолчанию не задана: тогда запросы без токена получают 401.
+    """
+    if not (DEFAULT_EMAIL_USER and DEFAULT_EMAIL_PASS):
+        await db.delete_session(DEFAULT_SESSION)
+        return
+
+    imap = {"email_user": DEFAULT_EMAIL_USER, "email_pass": DEFAULT_EMAIL_PASS,
+            "server": DEFAULT_IMAP_SERVER, "port": DEFAULT_IMAP_PORT}
+    smtp = {"email_user": DEFAULT_EMAIL_USER, "email_pass": DEFAULT_EMAIL_PASS,
+            "server": DEFAULT_SMTP_SERVER, "port": DEFAULT_SMTP_PORT}
+    # Рабочие процессы стартуют одновременно: сессия создается один раз, а учетные данные
+    # приводятся к конфигурации, если в базе осталась другая учетная запись
+    await db.create_session(imap=imap, smtp=smtp, token=DEFAULT_SESSION)
+    session = await db.get_session(DEFAULT_SESSION)
+    for protocol, account in (("imap", imap), ("smtp", smtp)):
+        if session[protocol] != account:
+            await db.update_session_account(DEFAULT_SESSION, protocol, account)
+
+# Пулы IMAP- и SMTP-соединений аккаунтов в этом процессе; сами сессии хранятся в базе
+account_registry = AccountRegistry()
+
+class SessionContext:
+    """
+    Состояние запроса: сессия из базы и клиенты IMAP/SMTP ее аккаунтов. Клиент берется
+    из пула аккаунта при первом обращении и возвращается в пул по завершении запроса.
+    """
+
+    def __init__(self, session: dict, resources: AsyncExitStack):
+        self.token = session["token"]
+        self.session = session
+        self._resources = resources
+        self._imap: Optional[IMAPClient] = None
+        self._smtp: Optional[SMTPClient] = None
+
+    @property
+    def account(self) -> str:
+        """Адрес IMAP-аккаунта сессии."""
+        return self.session["imap"]["email_user"]
+
+    async def imap(self) -> IMAPClient:
+        """IMAP-клиент аккаунта сессии, занятый на время запроса."""
+        if self._imap is None:
+            self._imap = await self._resources.enter_async_context(account_registry.imap(self.session["imap"]))
+        return self._imap
+
+    async def smtp(self) -> SMTPClient:
+        """SMTP-клиент аккаунта сессии, занятый на время запроса."""
+        if self._smtp is None:
+            self._smtp = await self._resources.enter_async_context(account_registry.smtp(self.session["smtp"]))
+        return self._smtp
+
+    def mailbox(self):
+        """Почтовый ящик аккаунта в локальной базе (async with ctx.mailbox() as store)."""
+        return db.mailbox(self.account)
+
+@asynccontextmanager
+async def open_session_context(token: Optional[str]):
+    """
+    Контекст сессии по токену (без токена - сессия по умолчанию, если она настроена, иначе 401).
+    Сессия читается из базы, поэтому запрос может обслужить любой рабочий процесс.
+    Занятые запросом клиенты возвращаются в пулы после него.
+    """
+    session = await db.get_session(token or DEFAULT_SESSION)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Session not found")
+    async with AsyncExitStack() as resources:
+        yield SessionContext(session, resources)
+
+async def session_context(x_session_token: Optional[str] = Header(None)):
+    """Зависимость FastAPI: сессия по заголовку X-Session-Token (см. open_session_context)."""
+    async with open_session_context(x_session_token) as ctx:
+        yield ctx
+
+def attachment_link_token(ctx: SessionContext, email_id: int, folder_name: str, index: int) -> str:
+    """
+    Короткоживущий токен ссылки на одно вложение письма (параметр access ссылки). Токен сессии
+    зашифрован внутри ключом сессий и наружу не попадает; ссылка перестает действовать
+    через ATTACHMENT_LINK_TTL секунд и не открывает ничего, кроме этого вложения.
+    """
+    scope = json.dumps([ctx.token, email_id, folder_name, index])
+    return db.credentials.encrypt(scope).decode("ascii")
+
+def attachment_link_session(access: str, email_id: int, folder_name: str, index: int) -> Optional[str]:
+    """Токен сессии из токена ссылки или None, если ссылка просрочена, повреждена или выдана на другое вложение."""
+    scope = db.credentials.decrypt(access.encode("ascii", "replace"), ttl=ATTACHMENT_LINK_TTL)
+    if scope is None:
+        return None
+    token, *target = json.loads(scope)
+    return token if target == [email_id, folder_name, index] else None
+
+async def attachment_session_context(
+        email_id: int, index: int, folder_name: str = "Inbox",
+        access: Optional[str] = Query(None), x_session_token: Optional[str] = Header(None),
+):
+    """
+    Зависимость FastAPI для get_attachment: сессия по заголовку X-Session-Token, а для ссылок
+    без заголовка - по токену ссылки access (см. attachment_link_token).
+    """
+    token = x_session_token
+    if token is None and access is not None:
+        token = attachment_link_session(access, email_id, folder_name, index)
+        if token is None:
+            raise HTTPException(status_code=403, detail="Attachment link is invalid or expired")
+    async with open_session_context(token) as ctx:
+        yield ctx
+
+# Кэш расшифрованных писем
+message_cache = MessageCache()
+
+# Пул заранее сгенерированных ключей
+key_pair_pool = KeyPairPool(db, secure_email_client)
+
+# Фоновое пересжатие писем и вложений, сохраненных без сжатия
+storage_recompressor = StorageRecompressor(db)
+
+# Политики хранения писем и сжатие файла базы
+retention_job = RetentionJob(db)
+
+def verify_imap_account(account: dict):
+    """Проверяет учетные данные IMAP пробным входом; при ошибке выбрасывает исключение."""
+    client = IMAPClient(account["server"], account["email_user"], account["email_pass"], port=account["port"])
+    client.open_connect()
+    client.close_connect()
+
+def verify_smtp_account(account: dict):
+    """Проверяет учетные данные SMTP пробным входом; при ошибке выбрасывает исключение."""
+    client = SMTPClient(account["server"], account["email_user"], account["email_pass"], port=account["port"])
+    client.open_connect()
+    client.close_connect()
 
 @app.post("/change_imap_account/")
-async def change_imap_account(request: ChangeAccountRequest):
+async def change_imap_account(request: ChangeAccountRequest, ctx: SessionContext = Depends(session_context)):
+    account = {
+        "email_user": request.email_user,
+        "email_pass": request.email_pass,
+        "server": request.imap_server or ctx.session["imap"]["server"],
+        "port": request.port or ctx.session["imap"]["port"],
+    }
     try:
-        imap_client.change_account(
-            new_email_user=request.email_user,
-            new_email_pass=request.email_pass,
-            new_imap_server=request.imap_server,
-            new_port=request.port
-        )
+        await asyncio.to_thread(verify_imap_account, account)
+        await db.update_session_account(ctx.token, "imap", account)
         return {"message": f"IMAP account changed to {request.email_user}"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error changing IMAP account: {str(e)}")
 
 @app.post("/change_smtp_account/")
-async def change_smtp_account(request: ChangeAccountRequest):
+async def change_smtp_account(request: ChangeAccountRequest, ctx: SessionContext = Depends(session_context)):
+    account = {
+        "email_user": request.email_user,
+        "email_pass": request.email_pass,
+        "server": request.smtp_server or ctx.session["smtp"]["server"],
+        "port": request.port or ctx.session["smtp"]["port"],
+    }
     try:
-        smtp_client.change_account(
-            new_email_user=request.email_user,
-            new_email_pass=request.email_pass,
-            new_smtp_server=request.smtp_server,
-            new_port=request.port
-        )
+        await asyncio.to_thread(verify_smtp_account, account)
+        await db.update_session_account(ctx.token, "smtp", account)
         return {"message": f"SMTP account changed to {request.email_user}"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error changing SMTP account: {str(e)}")
 
 @app.get("/current_imap_account/")
-async def current_imap_account():
+async def current_imap_account(ctx: SessionContext = Depends(session_context)):
     return {
-        "imap_server": imap_client.imap_server,
-        "email_user": imap_client.email_user,
-        "port": imap_client.port
+        "imap_server": ctx.session["imap"]["server"],
+        "email_user": ctx.session["imap"]["email_user"],
+        "port": ctx.session["imap"]["port"]
     }
 
 @app.get("/current_smtp_account/")
-async def current_smtp_account():
+async def current_smtp_account(ctx: SessionContext = Depends(session_context)):
     return {
-        "smtp_server": smtp_client.smtp_server,
-        "email_user": smtp_client.email_user,
-        "port": smtp_client.port
+        "smtp_server": ctx.session["smtp"]["server"],
+        "email_user": ctx.session["smtp"]["email_user"],
+        "port": ctx.session["smtp"]["port"]
     }
 
 @app.post("/emails/", response_model=FetchEmailsResponse)
-async def fetch_emails(request: FetchEmailsRequest):
+async def fetch_emails(request: FetchEmailsRequest, ctx: SessionContext = Depends(session_context)):
     """
     Fetch emails from a specified folder with optional pagination.
 
+    Pages from the local database are addressed by an opaque cursor: pass next_cursor
+    from the previous response to get the following page.
+
     Args:
         request (FetchEmailsRequest): Parameters in JSON format.
 
@@ -130,9 +293,14 @@ async def fetch_emails(request: FetchEmailsRequest):
     offset = request.offset
     limit = request.limit
 
+    if request.cursor:
+        # Продолжение листинга по курсору всегда идет из базы
+        return await fetch_emails_page(ctx, folder_name, limit, request.cursor)
+
     try:
         # Пытаемся получить письма из IMAP
-        emails = imap_client.fetch_emails(folder_name=folder_name, start=offset, limit=limit)
+        imap = await ctx.imap()
+        emails = await asyncio.to_thread(imap.fetch_emails, folder_name=folder_name, start=offset, limit=limit)
     except Exception as e:
         print(f"Failed to fetch emails from IMAP for folder {folder_name}: {e}")
         emails = None
@@ -148,83 +316,177 @@ async def fetch_emails(request: FetchEmailsRequest):
             )
             for email in emails
         ]
+    elif limit and not offset:
+        # Получаем первую страницу из базы вместе с курсором следующей
+        return await fetch_emails_page(ctx, folder_name, limit)
     else:
         # Получаем данные из базы
-        emails_list = await db.get_emails_summary_from_db(folder_name=folder_name, offset=offset, limit=limit)
+        async with ctx.mailbox() as store:
+            emails_list = await store.get_emails_summary_from_db(folder_name=folder_name, offset=offset, limit=limit)
 
     # Возвращаем результат
     return FetchEmailsResponse(emailsList=emails_list)
 
-@app.post("/authorize_account/")
-async def authorize_account(credentials: AccountCredentials):
+async def fetch_emails_page(
+        ctx: SessionContext, folder_name: str, limit: Optional[int], cursor: Optional[str] = None
+) -> FetchEmailsResponse:
+    """Страница писем из базы с пагинацией по курсору."""
+    if not limit or limit <= 0:
+        raise HTTPException(status_code=400, detail="limit is required for cursor pagination")
     try:
-        # Авторизация IMAP
-        imap_client.change_account(
-            new_email_user=credentials.email_user,
-            new_email_pass=credentials.email_pass,
-            new_imap_server=credentials.imap_server,
-            new_port=credentials.imap_port
-        )
-        # Авторизация SMTP
-        smtp_client.change_account(
-            new_email_user=credentials.email_user,
-            new_email_pass=credentials.email_pass,
-            new_smtp_server=credentials.smtp_server,
-            new_port=credentials.smtp_port
-        )
+        async with ctx.mailbox() as store:
+            emails_list, next_cursor = await store.get_emails_page_from_db(
+                folder_name=folder_name, limit=limit, cursor=cursor
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FetchEmailsResponse(emailsList=emails_list, next_cursor=next_cursor)
 
-        return {"message": "IMAP and SMTP accounts successfully authorized."}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error during account authorization: {str(e)}")
+@app.post("/emails/search/", response_model=SearchEmailsResponse)
+async def search_emails(request: SearchEmailsRequest, ctx: SessionContext = Depends(session_context)):
+    """
+    Полнотекстовый поиск по письмам, сохраненным в локальной базе, без обращения к IMAP.
+    Тела зашифрованных писем в поиске не участвуют.
 
-# Глобальный массив для хранения вложений
-global_attachments = []
+    Args:
+        request (SearchEmailsRequest): Строка поиска, папка и параметры пагинации.
 
-global_keys_file = None
+    Returns:
+        SearchEmailsResponse: Письма по убыванию релевантности.
+    """
+    async with ctx.mailbox() as store:
+        results = await store.search_letters(
+            query=request.query,
+            folder_name=request.folder_name,
+            offset=request.offset or 0,
+            limit=request.limit or 20,
+        )
+    return SearchEmailsResponse(results=[SearchEmailResult(**result) for result in results])
 
-@app.get("/keys/export/")
-async def export_public_keys():
+@app.get("/retention/", response_model=List[RetentionPolicy])
+async def get_retention_policies(ctx: SessionContext = Depends(session_context)):
     """
-    Экспорт всех публичных ключей в файл и отправка его
+    Действующие политики хранения писем по папкам (собственные или по умолчанию).
+    None в ограничении означает "без ограничения".
     """
-    global global_keys_file
+    async with ctx.mailbox() as store:
+        return [RetentionPolicy(**policy) for policy in await store.get_retention_policies()]
 
-    file_obj = await db.export_keys_to_file()
+@app.post("/retention/", response_model=RetentionPolicy)
+async def set_retention_policy(policy: RetentionPolicy, ctx: SessionContext = Depends(session_context)):
+    """
+    Задает политику хранения папки. Письма сверх ограничений удаляются из локальной базы
+    фоновой задачей при следующем проходе (на сервере они остаются).
+    """
+    for limit in (policy.max_age_days, policy.max_count, policy.max_bytes):
+        if limit is not None and limit < 0:
+            raise HTTPException(status_code=400, detail="Retention limits must be non-negative")
+    async with ctx.mailbox() as store:
+        await store.set_retention_policy(policy.folder_name, policy.max_age_days, policy.max_count, policy.max_bytes)
+    return policy
+
+@app.delete("/retention/{folder_name}")
+async def reset_retention_policy(folder_name: str, ctx: SessionContext = Depends(session_context)):
+    """Возвращает папке политику хранения по умолчанию."""
+    async with ctx.mailbox() as store:
+        await store.reset_retention_policy(folder_name)
+    return {"message": f"Retention policy for folder '{folder_name}' reset to default"}
 
-    # Генерируем временное имя файла
-    temp_dir = "rsa_keys"
-    file_name = "exported_public_keys.json"
-    os.makedirs(temp_dir, exist_ok=True)
-    file_path = os.path.join(temp_dir, file_name)
+@app.post("/authorize_account/")
+async def authorize_account(credentials: AccountCredentials):
+    """
+    Проверяет учетные данные IMAP и SMTP и создает сессию. Токен из ответа передается
+    в заголовке X-Session-Token; другие сессии, в том числе сессия по умолчанию, не меняются.
+    """
+    imap = {
+        "email_user": credentials.email_user,
+        "email_pass": credentials.email_pass,
+        "server": credentials.imap_server,
+        "port": credentials.imap_port,
+    }
+    smtp = {
+        "email_user": credentials.email_user,
+        "email_pass": credentials.email_pass,
+        "server": credentials.smtp_server,
+        "port": credentials.smtp_port,
+    }
+    try:
+        # Авторизация IMAP и SMTP; пробные входы не блокируют запросы других аккаунтов
+        await asyncio.to_thread(verify_imap_account, imap)
+        await asyncio.to_thread(verify_smtp_account, smtp)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error during account authorization: {str(e)}")
 
-    # Сохраняем файл на диск (для последующего Models-запроса на скачивание)
-    with open(file_path, "wb") as f:
-        f.write(file_obj.read())
+    token = await db.create_session(imap=imap, smtp=smtp)
 
-    # Добавляем файл в global_attachments
-    global_keys_file = file_path
+    return {"message": "IMAP and SMTP accounts successfully authorized.", "session_token": token}
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, filename=file_name)
+@app.post("/logout/")
+async def logout(ctx: SessionContext = Depends(session_context)):
+    """Завершает сессию; сессию по умолчанию завершить нельзя."""
+    if ctx.token == DEFAULT_SESSION:
+        raise HTTPException(status_code=400, detail="The default session cannot be closed")
+    await db.delete_session(ctx.token)
+    return {"message": "Session closed"}
+
+async def gzip_stream(chunks):
+    """Сжимает поток байтов в формат gzip по мере поступления фрагментов."""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@app.get("/keys/export/")
+async def export_public_keys(compress: bool = False, ctx: SessionContext = Depends(session_context)):
+    """
+    Экспорт ключей аккаунта сессии в JSON-файл, который формируется и отдается потоком, без временного файла.
+
+    Args:
+        compress (bool): Сжать файл в gzip (exported_public_keys.json.gz).
+    """
+    file_name = "exported_public_keys.json"
+    content = db.export_keys(ctx.account)
+    media_type = "application/json"
+
+    if compress:
+        file_name += ".gz"
+        content = gzip_stream(content)
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
 
 @app.post("/keys/import/")
-async def import_public_keys(file: UploadFile = File(...)):
+async def import_public_keys(file: UploadFile = File(...), ctx: SessionContext = Depends(session_context)):
     """
-    Импорт публичных ключей из загруженного файла.
+    Импорт ключей аккаунта сессии из загруженного файла (JSON или JSON в gzip, как отдает /keys/export/).
+    Файл разбирается потоково, без загрузки в память целиком; ключи чужих пар адресов отклоняются.
     """
-    # Читаем файл в памяти
-    file_content = await file.read()
-    file_obj = BytesIO(file_content)
+    file_obj = file.file
+    if file_obj.read(2) == b"\x1f\x8b":
+        file_obj.seek(0)
+        file_obj = gzip.GzipFile(fileobj=file_obj)
 
     try:
-        result_message = await db.import_keys_from_file(file_obj)
-    except json.JSONDecodeError:
+        stats = await db.import_keys_from_file(file_obj, ctx.account)
+    except (json.JSONDecodeError, UnicodeDecodeError, gzip.BadGzipFile, EOFError):
         raise HTTPException(status_code=400, detail="Invalid JSON file format")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {"message": result_message}
+    public, private = stats["public_keys"], stats["private_keys"]
+    result_message = (
+        f"Импортировано {public['inserted']} публичных ключей и {private['inserted']} приватных ключей "
+        f"(пропущено дубликатов: {public['skipped'] + private['skipped']}, "
+        f"некорректных записей: {public['invalid'] + private['invalid']}, "
+        f"отклонено записей чужих адресов: {public['rejected'] + private['rejected']})."
+    )
+    return {"message": result_message, **stats}
 
 # Если почта может быть без угловых скобок, оставляем только email
 def extract_email(sender):
@@ -237,40 +499,26 @@ def extract_email(sender):
     else:
         return None
 
-@app.post("/emails/info/", response_model=FetchEmailInfoResponse)
-async def fetch_email_info(request: FetchEmailInfoRequest):
+async def get_or_fetch_letter(ctx: SessionContext, email_id: int, folder_name: str) -> Optional[dict]:
     """
-    Models для получения информации о письме с декодированием Base64 и автоматическим дешифрованием.
-
-    Args:
-        request (FetchEmailInfoRequest): Параметры запроса с ID письма и именем папки.
-
-    Returns:
-        FetchEmailInfoResponse: Информация о письме.
-
-    Raises:
-        HTTPException: Ошибка, если письмо не найдено или ключи не подошли.
+    Возвращает письмо из локальной базы, а если его там нет - загружает с IMAP-сервера
+    и сохраняет в базу. Возвращает None, если письмо не найдено.
     """
-    global global_attachments
-    global_attachments.clear()  # Очищаем предыдущие вложения
-
-    try:
-
-        # Получаем параметры из тела запроса
-        email_id = request.email_id
-        folder_name = request.folder_name
-
-        email_info = await db.get_email_from_db(email_id=email_id, folder_name=folder_name)
+    async with ctx.mailbox() as store:
+        email_info = await store.get_email_from_db(email_id=email_id, folder_name=folder_name)
 
         if not email_info:
             try:
                 # Получаем информацию о письме
-                email_info = imap_client.fetch_email_info(email_uid=str(email_id).encode(), folder_name=folder_name)
+                imap = await ctx.imap()
+                email_info = await asyncio.to_thread(
+                    imap.fetch_email_info, email_uid=str(email_id).encode(), folder_name=folder_name
+                )
 
-                await db.add_letter(
+                await store.add_letter(
                     folder_name=folder_name,
                     sender=extract_email(email_info["sender"]),
-                    recipient=imap_client.email_user,
+                    recipient=ctx.account,
                     to_name=email_info["to"],
                     subject=email_info["subject"],
                     date=email_info["date"],
@@ -283,130 +531,272 @@ async def fetch_email_info(request: FetchEmailInfoRequest):
                 print(f"Failed to fetch email info from IMAP: {e}")
                 email_info = None
 
-        if not email_info:
-            raise HTTPException(status_code=404, detail="Email not found")
+    return email_info
 
-        encrypted_body = email_info.get("body")
-        encrypted_attachments = email_info.get("attachments", [])
+async def decrypt_letter(ctx: SessionContext, email_info: dict):
+    """
+    Расшифровывает тело и вложения письма, если оно зашифровано.
 
-        decrypted_body = None
-        decrypted_attachments = []
+    Returns:
+        tuple: (тело, вложения, признак того, что результат можно кэшировать).
+        Результат не кэшируется, если письмо зашифровано, но ни один набор ключей не подошел:
+        после синхронизации ключей его можно будет расшифровать.
+    """
+    encrypted_body = email_info.get("body")
+    encrypted_attachments = email_info.get("attachments", [])
 
-        # Проверяем, является ли тело письма зашифрованным
-        try:
-            json_body = json.loads(encrypted_body)
-            if all(key in json_body for key in ("iv", "encrypted_des_key", "signature", "encrypted_content")):
-
-                sender_email = extract_email(email_info["sender"])
-
-                # Работа с базой данных через менеджер контекста
-
-                decryption_keys = await db.get_decrypt_keys(current_recipient_email=imap_client.email_user, sender_email=sender_email)
-
-                if not decryption_keys:
-                    raise HTTPException(status_code=400, detail="No decryption or signing keys found.")
-
-                # Попытка расшифровать с каждым набором ключей
-                for key_pair in decryption_keys:
-                    try:
-                        private_key_encrypt = key_pair["private_key_encrypt"]
-                        public_key_sign = key_pair["public_key_sign"]
-
-                        # Декодируем данные из Base64
-                        encrypted_email = {
-                            "iv": base64.b64decode(json_body["iv"]),
-                            "encrypted_des_key": base64.b64decode(json_body["encrypted_des_key"]),
-                            "signature": base64.b64decode(json_body["signature"]),
-                            "encrypted_content": base64.b64decode(json_body["encrypted_content"]),
-                            "encrypted_attachments": [
-                                {
-                                    "filename": att["filename"],
-                                    "content": base64.b64decode(att["content"])
-                                }
-                                for att in encrypted_attachments
-                            ]
-                        }
+    decrypted_body = None
+    decrypted_attachments = []
+    is_encrypted = False
+
+    # Проверяем, является ли тело письма зашифрованным
+    try:
+        json_body = json.loads(encrypted_body)
+        if all(key in json_body for key in ("iv", "encrypted_des_key", "signature", "encrypted_content")):
+            is_encrypted = True
+
+            sender_email = extract_email(email_info["sender"])
+
+            # Работа с базой данных через менеджер контекста
 
-                        # Производим дешифрование
-                        decrypted_email = secure_email_client.verify_email(
-                            encrypted_email=encrypted_email,
-                            private_key_encrypt=private_key_encrypt,
-                            public_key_sign=public_key_sign
-                        )
-                        decrypted_body = decrypted_email.email_body  # Тело письма
-                        decrypted_attachments = [
-                            {"filename": att.filename, "content": att.content} for att in decrypted_email.attachments
-                        ]  # Вложения
-
-                        break
-
-                    except grpc.RpcError as e:
-                        # Обрабатываем ошибки gRPC
-                        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
-                            continue
-                        else:
-                            raise HTTPException(status_code=500, detail=f"Server error: {e.details()}")
-
-                    except Exception as e:
-                        raise HTTPException(status_code=400, detail=f"Failed to decrypt email: {e}")
-
-            if not decrypted_body:
-                # Если тело не является JSON, возвращаем как есть
-                decrypted_body = encrypted_body
-                decrypted_attachments = [{"filename": att["filename"], "content": att["content"]} for att in
-                                         encrypted_attachments]
-
-        except json.JSONDecodeError:
+            decryption_keys = await db.get_decrypt_keys(current_recipient_email=ctx.account, sender_email=sender_email)
+
+            if not decryption_keys:
+                raise HTTPException(status_code=400, detail="No decryption or signing keys found.")
+
+            # Декодируем данные из Base64 один раз для всех наборов ключей;
+            # вложения декодируются параллельно
+            try:
+                decoded_contents = await b64decode_parts(
+                    [json_body["encrypted_content"]] + [att["content"] for att in encrypted_attachments]
+                )
+                encrypted_email = {
+                    "iv": base64.b64decode(json_body["iv"]),
+                    "encrypted_des_key": base64.b64decode(json_body["encrypted_des_key"]),
+                    "signature": base64.b64decode(json_body["signature"]),
+                    "encrypted_content": decoded_contents[0],
+                    "encrypted_attachments": [
+                        {
+                            "filename": att["filename"],
+                            "content": content
+                        }
+                        for att, content in zip(encrypted_attachments, decoded_contents[1:])
+                    ]
+                }
+            except (binascii.Error, ValueError, TypeError) as e:
+                raise HTTPException(status_code=400, detail=f"Failed to decrypt email: {e}")
+
+            # Большие письма передаются потоком
+            if payload_size(
+                    encrypted_email["encrypted_content"], encrypted_email["encrypted_attachments"]
+            ) > STREAMING_THRESHOLD:
+                verify_email = secure_email_client.verify_email_stream
+            else:
+                verify_email = secure_email_client.verify_email
+
+            # Попытка расшифровать с каждым набором ключей
+            for key_pair in decryption_keys:
+                try:
+                    private_key_encrypt = key_pair["private_key_encrypt"]
+                    public_key_sign = key_pair["public_key_sign"]
+
+                    # Производим дешифрование вне цикла событий
+                    decrypted_email = await asyncio.to_thread(
+                        verify_email,
+                        encrypted_email=encrypted_email,
+                        private_key_encrypt=private_key_encrypt,
+                        public_key_sign=public_key_sign,
+                        scheme=json_body.get("scheme"),
+                    )
+                    decrypted_body = decrypted_email.email_body  # Тело письма
+                    decrypted_attachments = [
+                        {"filename": att.filename, "content": att.content} for att in decrypted_email.attachments
+                    ]  # Вложения
+
+                    break
+
+                except grpc.RpcError as e:
+                    # Обрабатываем ошибки gRPC
+                    if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+                        continue
+                    else:
+                        raise HTTPException(status_code=500, detail=f"Server error: {e.details()}")
+
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Failed to decrypt email: {e}")
+
+        if not decrypted_body:
             # Если тело не является JSON, возвращаем как есть
             decrypted_body = encrypted_body
-            decrypted_attachments = [{"filename": att["filename"], "content": att["content"]} for att in encrypted_attachments]
+            decrypted_attachments = [{"filename": att["filename"], "content": att["content"]} for att in
+                                     encrypted_attachments]
+            return decrypted_body, decrypted_attachments, not is_encrypted
+
+    except json.JSONDecodeError:
+        # Если тело не является JSON, возвращаем как есть
+        decrypted_body = encrypted_body
+        decrypted_attachments = [{"filename": att["filename"], "content": att["content"]} for att in encrypted_attachments]
+
+    return decrypted_body, decrypted_attachments, True
+
+async def load_message(ctx: SessionContext, email_id: int, folder_name: str) -> Optional[dict]:
+    """
+    Возвращает письмо с расшифрованными телом и вложениями: из кэша, если письмо уже
+    открывалось, иначе из базы или с IMAP-сервера с последующим дешифрованием.
+    Возвращает None, если письмо не найдено.
+    """
+    account = ctx.account
+
+    # Время открытия защищает письмо от вытеснения политиками хранения
+    async with ctx.mailbox() as store:
+        await store.touch_letter(email_id, folder_name)
+
+    message = await get_cached_message(ctx, email_id, folder_name)
+    if message is not None:
+        return message
+
+    email_info = await get_or_fetch_letter(ctx, email_id=email_id, folder_name=folder_name)
+    if not email_info:
+        return None
+
+    decrypted_body, decrypted_attachments, cacheable = await decrypt_letter(ctx, email_info)
+
+    message = {
+        "sender": extract_email(email_info["sender"]),
+        "to": email_info["to"],
+        "subject": email_info["subject"],
+        "date": email_info["date"],
+        "body": decrypted_body.decode("utf-8") if isinstance(decrypted_body, bytes) else decrypted_body,
+        "attachments": decrypted_attachments,
+    }
+
+    if cacheable:
+        imap = await ctx.imap()
+        uidvalidity = await asyncio.to_thread(imap.get_uidvalidity, folder_name)
+        message_cache.put(account, folder_name, email_id, uidvalidity, message)
+
+    return message
+
+async def get_cached_message(ctx: SessionContext, email_id: int, folder_name: str) -> Optional[dict]:
+    """
+    Расшифрованное письмо из кэша, если UIDVALIDITY папки не изменилась, иначе None.
+    UIDVALIDITY запрашивается у IMAP-сервера, только если в кэше есть запись.
+    """
+    message = message_cache.lookup(ctx.account, folder_name, email_id)
+    if message is None:
+        return None
 
-        # Сохраняем вложения во временные файлы и обновляем global_attachments
-        attachments_dir = "attachments"
-        os.makedirs(attachments_dir, exist_ok=True)
-        for attachment in decrypted_attachments:
-            file_path = os.path.join(attachments_dir, attachment["filename"])
-            with open(file_path, "wb") as f:
-                f.write(attachment["content"])
-            global_attachments.append(file_path)
+    imap = await ctx.imap()
+    uidvalidity = await asyncio.to_thread(imap.get_uidvalidity, folder_name)
+    if message["uidvalidity"] != uidvalidity:
+        message_cache.invalidate(ctx.account, folder_name, email_id)
+        return None
+    return message
+
+def attachment_url(ctx: SessionContext, email_id: int, folder_name: str, index: int) -> str:
+    """
+    Ссылка на вложение письма для get_attachment. Токена сессии в ней нет: ссылка несет
+    короткоживущий токен только этого вложения, чтобы ее можно было открыть без заголовка.
+    """
+    query = {"folder_name": folder_name}
+    if ctx.token != DEFAULT_SESSION:
+        query["access"] = attachment_link_token(ctx, email_id, folder_name, index)
+    return f"/emails/{email_id}/attachments/{index}?{urlencode(query)}"
+
+@app.post("/emails/info/", response_model=FetchEmailInfoResponse)
+async def fetch_email_info(request: FetchEmailInfoRequest, ctx: SessionContext = Depends(session_context)):
+    """
+    Models для получения информации о письме с декодированием Base64 и автоматическим дешифрованием.
+    Расшифрованные письма берутся из кэша, если письмо уже открывалось.
+    Вложения на диск не записываются: для каждого возвращается ссылка на get_attachment.
+
+    Args:
+        request (FetchEmailInfoRequest): Параметры запроса с ID письма и именем папки.
+
+    Returns:
+        FetchEmailInfoResponse: Информация о письме.
+
+    Raises:
+        HTTPException: Ошибка, если письмо не найдено или ключи не подошли.
+    """
+    try:
+
+        # Получаем параметры из тела запроса
+        email_id = request.email_id
+        folder_name = request.folder_name
+
+        message = await load_message(ctx, email_id, folder_name)
+
+        if message is None:
+            raise HTTPException(status_code=404, detail="Email not found")
 
         # Возвращаем информацию о письме
         return FetchEmailInfoResponse(
-            sender=extract_email(email_info["sender"]),
-            to=email_info["to"],
-            subject=email_info["subject"],
-            date=email_info["date"],
-            body=decrypted_body,
-            attachments=[os.path.basename(f) for f in global_attachments],
+            sender=message["sender"],
+            to=message["to"],
+            subject=message["subject"],
+            date=message["date"],
+            body=message["body"],
+            attachments=[attachment["filename"] for attachment in message["attachments"]],
+            attachment_urls=[
+                attachment_url(ctx, email_id, folder_name, index) for index in range(len(message["attachments"]))
+            ],
         )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except HTTPException:
+        raise
 
     except Exception as e:
         print(f"Ошибка при получении информации о письме: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch email info: {e}")
 
-@app.get("/attachments/{filename}")
-async def get_attachment(filename: str):
+@app.api_route("/emails/{email_id}/attachments/{index}", methods=["GET", "HEAD"])
+async def get_attachment(
+        email_id: int, index: int, request: Request, folder_name: str = "Inbox",
+        ctx: SessionContext = Depends(attachment_session_context),
+):
     """
-    Models для загрузки вложения.
+    Models для загрузки вложения письма. Поддерживает Range и If-None-Match.
+    Сессия берется из заголовка X-Session-Token или из токена ссылки access (см. attachment_url).
+
+    Вложения незашифрованных писем отдаются прямо из хранилища блобов без обращения
+    к IMAP-серверу, расшифрованные - из кэша писем (при промахе письмо расшифровывается заново).
 
     Args:
-        filename (str): Имя файла вложения.
+        email_id (int): ID письма.
+        index (int): Порядковый номер вложения в письме.
+        folder_name (str): Имя папки.
 
     Returns:
-        FileResponse: Файл вложения.
+        Response: Содержимое вложения целиком или запрошенный диапазон.
     """
-    file_path = os.path.join("attachments", filename)
-    if not os.path.exists(file_path):
+    async with ctx.mailbox() as store:
+        stored = await store.get_letter_attachment(email_id, folder_name, index)
+        if stored and not stored["encrypted"]:
+            await store.touch_letter(email_id, folder_name)
+            if stored["codec"] == CODEC_NONE:
+                return blob_response(request, stored["path"], stored["filename"], stored["blob_hash"])
+            # Сжатый блоб распаковывается целиком; ETag - хэш исходного содержимого, как и у несжатого
+            content = await asyncio.to_thread(store.blob_store.read, stored["blob_hash"], stored["codec"])
+            return bytes_response(request, content, stored["filename"], stored["blob_hash"])
+
+    message = await get_cached_message(ctx, email_id, folder_name)
+    if message is None:
+        message = await load_message(ctx, email_id, folder_name)
+        if message is None:
+            raise HTTPException(status_code=404, detail="Email not found")
+
+    if not 0 <= index < len(message["attachments"]):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, filename=filename)
+
+    attachment = message["attachments"][index]
+    etag = await asyncio.to_thread(content_etag, attachment["content"])
+    return bytes_response(request, attachment["content"], attachment["filename"], etag)
 
 @app.post("/generate-keys/")
-async def generate_and_send_keys(sender_email: str = Form(...)):
-    # Генерация новых ключей
-    keys = secure_email_client.generate_keys()
+async def generate_and_send_keys(sender_email: str = Form(...), ctx: SessionContext = Depends(session_context)):
+    # Берем готовый набор ключей из пула
+    keys = await key_pair_pool.pop()
 
     # Кодирование публичных ключей в BASE64
     keys_base64 = {
@@ -427,7 +817,7 @@ async def generate_and_send_keys(sender_email: str = Form(...)):
 
     # test_inserts = {
     #     "sender_email": to_email,
-    #     "current_recipient_email": imap_client.email_user,
+    #     "current_recipient_email": ctx.account,
     #     "private_key_sign": keys["private_key_sign"],  # Уже байты
     #     "private_key_encrypt": keys["private_key_encrypt"],  # Уже байты
     #     "public_key_sign": keys["public_key_sign"],  # Уже байты
@@ -437,7 +827,7 @@ async def generate_and_send_keys(sender_email: str = Form(...)):
 
     await db.insert_private_keys(
         sender_email=sender_email,
-        current_recipient_email=imap_client.email_user,
+        current_recipient_email=ctx.account,
         private_key_sign=keys["private_key_sign"],  # Уже байты
         private_key_encrypt=keys["private_key_encrypt"],  # Уже байты
         public_key_sign=keys["public_key_sign"],  # Уже байты
@@ -451,7 +841,8 @@ async def generate_and_send_keys(sender_email: str = Form(...)):
         body=body,
         from_name="Sender",
         to_name="Recipient",
-        use_encrypt=False
+        use_encrypt=False,
+        ctx=ctx,
     )
 
     # Возврат успешного ответа
@@ -465,10 +856,12 @@ async def send_email(
     from_name: str = Form(None),
     to_name: str = Form(None),
     attachments: Optional[List[UploadFile]] = File(None),
-    use_encrypt: Optional[bool] = Form(True)
+    use_encrypt: Optional[bool] = Form(True),
+    ctx: SessionContext = Depends(session_context),
 ):
+    smtp = await ctx.smtp()
     try:
-        smtp_client.open_connect()
+        await asyncio.to_thread(smtp.open_connect)
 
         # Преобразуем вложения в байтовый формат
         file_attachments = []
@@ -484,7 +877,7 @@ async def send_email(
         # Проверяем, нужно ли шифрование
         if use_encrypt:
             encrypt_keys = await db.get_encrypt_sign_keys(
-                current_sender_email=smtp_client.email_user,
+                current_sender_email=smtp.email_user,
                 recipient_email=to_email
             )
 
@@ -502,33 +895,49 @@ async def send_email(
             # Преобразуем тело письма в байты
             body_bytes = body.encode("utf-8")
 
-            encrypted_email = secure_email_client.process_email(
+            # Большие письма передаем потоком, чтобы не упереться в лимит размера сообщения gRPC
+            if payload_size(body_bytes, file_attachments) > STREAMING_THRESHOLD:
+                process_email = secure_email_client.process_email_stream
+            else:
+                process_email = secure_email_client.process_email
+
+            encrypted_email = await asyncio.to_thread(
+                process_email,
                 email_body=body_bytes,
                 attachments=file_attachments,
                 private_key_sign=private_key_sign,
                 public_key_encrypt=public_key_encrypt,
             )
 
+            # Тело и вложения кодируются в Base64 параллельно
+            encoded_contents = await b64encode_parts(
+                [encrypted_email.encrypted_content]
+                + [attachment.content for attachment in encrypted_email.encrypted_attachments]
+            )
+
             content_body = {
                 "iv": base64.b64encode(encrypted_email.iv).decode("utf-8"),
                 "encrypted_des_key": base64.b64encode(encrypted_email.encrypted_des_key).decode("utf-8"),
                 "signature": base64.b64encode(encrypted_email.signature).decode("utf-8"),
-                "encrypted_content": base64.b64encode(encrypted_email.encrypted_content).decode("utf-8")
+                "encrypted_content": encoded_contents[0],
+                # Схема нужна получателю, чтобы проверить письмо той же реализацией
+                "scheme": secure_email_client.scheme,
             }
 
             body = json.dumps(content_body, ensure_ascii=False)
 
             # Корректное извлечение вложений
             file_attachments = []
-            for attachment in encrypted_email.encrypted_attachments:
+            for attachment, content in zip(encrypted_email.encrypted_attachments, encoded_contents[1:]):
                 # Предполагаем, что каждый элемент является объектом EncryptedAttachment
                 file_attachments.append({
                     "filename": attachment.filename,  # Имена вложений
-                    "content": base64.b64encode(attachment.content).decode("utf-8"),  # Контент зашифрованных вложений
+                    "content": content,  # Контент зашифрованных вложений
                 })
 
         # Отправка письма
-        message = smtp_client.send_email(
+        message = await asyncio.to_thread(
+            smtp.send_email,
             to_email=to_email,
             subject=subject,
             body=body,
@@ -536,26 +945,28 @@ async def send_email(
             to_name=to_name,
             attachments=file_attachments,
         )
-        smtp_client.close_connect()
+        await asyncio.to_thread(smtp.close_connect)
 
-        imap_client.save_to_sent_folder(message.as_string())
+        imap = await ctx.imap()
+        await asyncio.to_thread(imap.save_to_sent_folder, message.as_string())
 
         return SendEmailResponse(message="Email successfully sent.")
     except Exception as e:
         print(f"Error during email sending: {e}")
-        smtp_client.close_connect()
+        await asyncio.to_thread(smtp.close_connect)
         raise HTTPException(status_code=500, detail=f"Failed to send email: {e}")
 
 @app.get("/folders/", response_model=List[dict])
-async def get_folders():
+async def get_folders(ctx: SessionContext = Depends(session_context)):
     """
     Models для получения списка папок на IMAP-сервере.
     """
     try:
-        if not imap_client.is_connection_active():
-            imap_client.open_connect()
+        imap = await ctx.imap()
+        if not await asyncio.to_thread(imap.is_connection_active):
+            await asyncio.to_thread(imap.open_connect)
 
-        folders = imap_client.get_folders()
+        folders = await asyncio.to_thread(imap.get_folders)
         if isinstance(folders, dict) and "error" in folders:
             raise HTTPException(status_code=500, detail=folders["error"])
 
@@ -566,14 +977,16 @@ async def get_folders():
 @app.put("/sync-public-keys/")
 async def sync_public_keys(
     recipient_email: str,
+    ctx: SessionContext = Depends(session_context),
 ):
     try:
         # Получаем дату последней записи
-        last_date = await db.get_last_insert_public_keys_date(imap_client.email_user, recipient_email)
+        last_date = await db.get_last_insert_public_keys_date(ctx.account, recipient_email)
         last_date = last_date.isoformat() if last_date else datetime.fromisoformat("1970-01-01T00:00:00")
 
         # Запрашиваем письма с ключами в формате JSON
-        emails_data = imap_client.fetch_keys_emails_as_json()
+        imap = await ctx.imap()
+        emails_data = await asyncio.to_thread(imap.fetch_keys_emails_as_json)
         if not emails_data:
             return JSONResponse({"status": "No valid emails found."})
 
@@ -590,7 +1003,7 @@ async def sync_public_keys(
         # Добавляем новые ключи в базу данных
         for key_data in new_keys:
             await db.insert_public_keys(
-                current_sender_email=imap_client.email_user,
+                current_sender_email=ctx.account,
                 recipient_email=recipient_email,
                 public_key_sign=base64.b64decode(key_data["public_key_sign"]),
                 public_key_encrypt=base64.b64decode(key_data["public_key_encrypt"]),
@@ -604,14 +1017,14 @@ async def sync_public_keys(
 
 
 @app.post("/email/move_to_trash_or_delete")
-async def move_to_trash(request: MoveToTrashRequest):
+async def move_to_trash(request: MoveToTrashRequest, ctx: SessionContext = Depends(session_context)):
     """
     Перемещает письмо в корзину в БД и удаляет его с IMAP сервера.
 
     Args:
         request (MoveToTrashRequest): Параметры запроса.
         db (RSAKeyDatabase): Инстанс базы данных.
-        imap_client (IMAPClient): Инстанс IMAP клиента.
+        ctx (SessionContext): Сессия запроса с клиентом IMAP.
 
     Raises:
         HTTPException: Если произошла ошибка на этапе перемещения или удаления.
@@ -625,29 +1038,31 @@ async def move_to_trash(request: MoveToTrashRequest):
     folder_name = request.folder_name
 
     try:
-        await fetch_email_info(
-            FetchEmailInfoRequest(
-                email_id=email_id,
-                folder_name=folder_name,
-            )
-        )
+        # Письмо должно оказаться в локальной базе до удаления с сервера
+        await get_or_fetch_letter(ctx, email_id=email_id, folder_name=folder_name)
+        message_cache.invalidate(ctx.account, folder_name, email_id)
+        message_cache.invalidate(ctx.account, trash_folder, email_id)
 
         try:
             # Удаление письма с IMAP-сервера
-            imap_client.delete_email(email_uid=str(email_id), folder_name=folder_name)
+            imap = await ctx.imap()
+            await asyncio.to_thread(imap.delete_email, email_uid=str(email_id), folder_name=folder_name)
         except Exception as e:
             print(f"Failed to delete emails from IMAP for folder {folder_name}: {e}")
 
-        folder_letter = await db.get_folder_by_letter_id(email_id)
+        async with ctx.mailbox() as store:
+            folder_letter = await store.get_folder_by_letter_id(email_id)
 
-        if folder_letter != trash_folder:
-            # Перемещение письма в "Trash" в базе данных
-            await db.move_letter(letter_id=email_id, source_folder_name=folder_name, target_folder_name=trash_folder)
-            return {"message": f"Письмо с ID {email_id} перемещено в корзину и удалено с сервера."}
-        else:
-            # Удаление письма из базы данных
-            await db.delete_letter(letter_id=email_id, folder_name=trash_folder)
-            return {"message": f"Письмо с ID {email_id} успешно удалено из корзины."}
+            if folder_letter != trash_folder:
+                # Перемещение письма в "Trash" в базе данных
+                await store.move_letter(
+                    letter_id=email_id, source_folder_name=folder_name, target_folder_name=trash_folder
+                )
+                return {"message": f"Письмо с ID {email_id} перемещено в корзину и удалено с сервера."}
+            else:
+                # Удаление письма из базы данных
+                await store.delete_letter(letter_id=email_id, folder_name=trash_folder)
+                return {"message": f"Письмо с ID {email_id} успешно удалено из корзины."}
 
 
     except ValueError as e:
@@ -658,7 +1073,8 @@ async def move_to_trash(request: MoveToTrashRequest):
 
 @app.post("/email/delete_from_trash")
 async def delete_from_trash(
-        email_id: int = Form(...)
+        email_id: int = Form(...),
+        ctx: SessionContext = Depends(session_context),
 ):
     """
     Удаляет письмо из корзины окончательно (из БД и IMAP сервера).
@@ -666,7 +1082,7 @@ async def delete_from_trash(
     Args:
         request (DeleteFromTrashRequest): Параметры запроса.
         db (RSAKeyDatabase): Инстанс базы данных.
-        imap_client (IMAPClient): Инстанс IMAP клиента.
+        ctx (SessionContext): Сессия запроса с клиентом IMAP.
 
     Raises:
         HTTPException: Если произошла ошибка на этапе удаления.
@@ -679,7 +1095,9 @@ async def delete_from_trash(
     try:
 
         # Удаление письма из базы данных
-        await db.delete_letter(letter_id=email_id, folder_name=trash_folder)
+        async with ctx.mailbox() as store:
+            await store.delete_letter(letter_id=email_id, folder_name=trash_folder)
+        message_cache.invalidate(ctx.account, trash_folder, email_id)
 
         return {"message": f"Письмо с ID {email_id} успешно удалено из корзины."}
 
@@ -690,11 +1108,11 @@ async def delete_from_trash(
 
 # Эндпоинт для получения списка почт и дат
 @app.get("/keys/related-dates/", response_model=List[KeyDatesResponse])
-async def get_related_emails_and_dates():
+async def get_related_emails_and_dates(ctx: SessionContext = Depends(session_context)):
     """Возвращает список связанных email-адресов с последними датами для публичных и приватных ключей."""
 
     # Получаем данные из функции, которая выполняет запрос к БД
-    related_emails_and_dates = await db.get_related_emails_and_dates(imap_client.email_user)
+    related_emails_and_dates = await db.get_related_emails_and_dates(ctx.account)
 
     if not related_emails_and_dates:
         raise HTTPException(status_code=404, detail="Не найдены связанные email-адреса.")
@@ -0,0 +1,85 @@
+"""
+Сравнение реализаций SecureEmailService: внешний gRPC-сервис и встроенная реализация.
+
+В качестве gRPC-сервиса поднимается локальный сервер на встроенной реализации, поэтому
+разница во времени - это стоимость сетевого вызова и сериализации письма в protobuf.
+
+Запуск из корня проекта:
+    python -m benchmarks.secure_email_backends --iterations 20 --attachment-size 1048576
+"""
+import argparse
+import os
+import time
+
+from LocalSecureEmailService import InProcessSecureEmailBackend, serve
+from SecureEmailClient import GrpcSecureEmailBackend, SecureEmailClient
+
+
+def measure(func, iterations):
+    """Среднее время одного вызова в миллисекундах."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def run(client: SecureEmailClient, keys: dict, body: bytes, attachments, iterations: int):
+    encrypted = client.process_email(body, attachments, keys["private_key_sign"], keys["public_key_encrypt"])
+    encrypted_email = {
+        "iv": encrypted.iv,
+        "encrypted_des_key": encrypted.encrypted_des_key,
+        "signature": encrypted.signature,
+        "encrypted_content": encrypted.encrypted_content,
+        "encrypted_attachments": [
+            {"filename": att.filename, "content": att.content} for att in encrypted.encrypted_attachments
+        ],
+    }
+    return {
+        "ProcessEmail": measure(
+            lambda: client.process_email(body, attachments, keys["private_key_sign"], keys["public_key_encrypt"]),
+            iterations,
+        ),
+        "VerifyEmail": measure(
+            lambda: client.verify_email(encrypted_email, keys["private_key_encrypt"], keys["public_key_sign"]),
+            iterations,
+        ),
+        "GenerateKeys": measure(client.generate_keys, max(1, iterations // 10)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--body-size", type=int, default=16 * 1024)
+    parser.add_argument("--attachments", type=int, default=2)
+    parser.add_argument("--attachment-size", type=int, default=512 * 1024)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    body = os.urandom(args.body_size)
+    attachments = [
+        {"filename": f"attachment_{index}.bin", "content": os.urandom(args.attachment_size)}
+        for index in range(args.attachments)
+    ]
+
+    server, port = serve("localhost:0", args.workers)
+    clients = {
+        "grpc": SecureEmailClient(backend=GrpcSecureEmailBackend(f"localhost:{port}")),
+        "inprocess": SecureEmailClient(backend=InProcessSecureEmailBackend(args.workers)),
+    }
+
+    try:
+        keys = clients["inprocess"].generate_keys()
+        results = {name: run(client, keys, body, attachments, args.iterations) for name, client in clients.items()}
+    finally:
+        for client in clients.values():
+            client.close()
+        server.stop(None)
+
+    print(f"{'операция':<14}" + "".join(f"{name + ', мс':>16}" for name in results))
+    for operation in results["grpc"]:
+        print(f"{operation:<14}" + "".join(f"{results[name][operation]:>16.2f}" for name in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+
+# Кэш расшифрованных писем: предельный объем памяти для LRU-уровня (в байтах)
+MESSAGE_CACHE_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Каталог дискового уровня кэша; пустая строка отключает дисковый уровень
+MESSAGE_CACHE_DIR = os.getenv("MESSAGE_CACHE_DIR", "message_cache")
+
+# Файл с локальным ключом шифрования дискового уровня; должен лежать вне MESSAGE_CACHE_DIR
+MESSAGE_CACHE_KEY_FILE = os.getenv("MESSAGE_CACHE_KEY_FILE", "message_cache.key")
+
+# Учетная запись сессии по умолчанию (запросы без заголовка X-Session-Token);
+# если адрес или пароль не заданы, сессии по умолчанию нет и запросы без токена получают 401
+DEFAULT_EMAIL_USER = os.getenv("DEFAULT_EMAIL_USER", "")
+DEFAULT_EMAIL_PASS = os.getenv("DEFAULT_EMAIL_PASS", "")
+DEFAULT_IMAP_SERVER = os.getenv("DEFAULT_IMAP_SERVER", "imap.mail.ru")
+DEFAULT_IMAP_PORT = int(os.getenv("DEFAULT_IMAP_PORT", 993))
+DEFAULT_SMTP_SERVER = os.getenv("DEFAULT_SMTP_SERVER", "smtp.mail.ru")
+DEFAULT_SMTP_PORT = int(os.getenv("DEFAULT_SMTP_PORT", 587))
+
+# Сколько секунд действует ссылка на вложение из /emails/info/ (токен ссылки вместо токена сессии)
+ATTACHMENT_LINK_TTL = int(os.getenv("ATTACHMENT_LINK_TTL", 300))
+
+# Ключ Fernet для паролей, сохраненных в сессиях. Рабочие процессы на одной машине
+# делят файл ключа; при нескольких узлах ключ задается явно через SESSION_SECRET
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_KEY_FILE = os.getenv("SESSION_KEY_FILE", "session.key")
+
+# Пул заранее сгенерированных наборов ключей для /generate-keys/
+KEY_POOL_SIZE = int(os.getenv("KEY_POOL_SIZE", 10))
+
+# Пул пополняется в фоне, когда в нем остается не больше этого количества наборов
+KEY_POOL_LOW_WATER = int(os.getenv("KEY_POOL_LOW_WATER", 3))
+
+# Реализация SecureEmailService: "grpc" - внешний сервис, "inprocess" - шифрование в пуле процессов
+SECURE_EMAIL_BACKEND = os.getenv("SECURE_EMAIL_BACKEND", "grpc")
+
+# Адрес внешнего gRPC-сервиса шифрования
+SECURE_EMAIL_SERVER = os.getenv("SECURE_EMAIL_SERVER", "localhost:50051")
+
+# Количество рабочих процессов встроенной реализации (0 - по числу ядер)
+SECURE_EMAIL_WORKERS = int(os.getenv("SECURE_EMAIL_WORKERS", 0))
+
+# Количество процессов для кодирования/декодирования вложений в Base64 (0 - по числу ядер)
+ATTACHMENT_CODEC_WORKERS = int(os.getenv("ATTACHMENT_CODEC_WORKERS", 0))
+
+# Вложения меньше этого размера кодируются в текущем процессе: передача в пул обойдется дороже
+ATTACHMENT_CODEC_PARALLEL_MIN_SIZE = int(os.getenv("ATTACHMENT_CODEC_PARALLEL_MIN_SIZE", 256 * 1024))
+
+# SQLite: размер страничного кэша каждого соединения (в КиБ)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 32 * 1024))
+
+# SQLite: объем файла базы, отображаемый в память (0 отключает mmap)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# SQLite: сколько миллисекунд ждать снятия блокировки, прежде чем вернуть SQLITE_BUSY
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# SQLite: количество соединений только для чтения (0 - читать через соединение-писатель)
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", 4))
+
+# Каталог хранилища вложений с адресацией по SHA-256
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+
+# Каталог почтовых ящиков: у каждого аккаунта свой файл базы с письмами и свой каталог блобов
+MAILBOX_DIR = os.getenv("MAILBOX_DIR", "mailboxes")
+
+# Сколько почтовых ящиков держать открытыми одновременно (давно не использованные закрываются)
+MAILBOX_MAX_OPEN = int(os.getenv("MAILBOX_MAX_OPEN", 16))
+
+# Сколько пар адресов (свой, собеседник) хранить в кэше ключей шифрования/подписи
+KEY_CACHE_MAX_ENTRIES = int(os.getenv("KEY_CACHE_MAX_ENTRIES", 1024))
+
+# Кодек сжатия тел писем и вложений: "zstd" (нужен пакет zstandard, иначе zlib), "zlib" или "none"
+STORAGE_CODEC = os.getenv("STORAGE_CODEC", "zstd")
+
+# Данные меньше этого размера (в байтах) хранятся несжатыми
+STORAGE_COMPRESSION_MIN_SIZE = int(os.getenv("STORAGE_COMPRESSION_MIN_SIZE", 512))
+
+# Сколько писем и блобов пересжимать за одну транзакцию фоновой задачи
+RECOMPRESS_BATCH_SIZE = int(os.getenv("RECOMPRESS_BATCH_SIZE", 200))
+
+# Политика хранения писем по умолчанию (для папок без своей политики); 0 - без ограничения.
+# Сначала вытесняются письма, которые дольше всего не открывались
+RETENTION_MAX_AGE_DAYS = int(os.getenv("RETENTION_MAX_AGE_DAYS", 0))
+RETENTION_MAX_COUNT = int(os.getenv("RETENTION_MAX_COUNT", 0))
+RETENTION_MAX_BYTES = int(os.getenv("RETENTION_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Как часто (в секундах) фоновая задача применяет политики хранения и сжимает файл базы
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 600))
+
+# Сколько писем вытеснять за одну транзакцию
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 200))
+
+# Сколько свободных страниц возвращать системе за один шаг PRAGMA incremental_vacuum
+VACUUM_SLICE_PAGES = int(os.getenv("VACUUM_SLICE_PAGES", 256))
+
+# Сколько IMAP- и SMTP-соединений одного аккаунта держать одновременно (на каждый протокол)
+ACCOUNT_POOL_SIZE = int(os.getenv("ACCOUNT_POOL_SIZE", 4))
+
+# Через сколько секунд простоя соединение аккаунта закрывается
+ACCOUNT_IDLE_TIMEOUT = int(os.getenv("ACCOUNT_IDLE_TIMEOUT", 300))
+
+# Как часто (в секундах) проверять простаивающие соединения
+ACCOUNT_EVICT_INTERVAL = int(os.getenv("ACCOUNT_EVICT_INTERVAL", 60))
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11secureemail.proto\x12\x0bsecureemail\"I\n\x05\x45mail\x12\x12\n\nemail_body\x18\x01 \x01(\x0c\x12,\n\x0b\x61ttachments\x18\x02 \x03(\x0b\x32\x17.secureemail.Attachment\"/\n\nAttachment\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\"\xa6\x01\n\x0e\x45ncryptedEmail\x12\n\n\x02iv\x18\x01 \x01(\x0c\x12\x19\n\x11\x65ncrypted_des_key\x18\x02 \x01(\x0c\x12\x11\n\tsignature\x18\x03 \x01(\x0c\x12\x19\n\x11\x65ncrypted_content\x18\x04 \x01(\x0c\x12?\n\x15\x65ncrypted_attachments\x18\x05 \x03(\x0b\x32 .secureemail.EncryptedAttachment\"8\n\x13\x45ncryptedAttachment\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\"n\n\x13ProcessEmailRequest\x12!\n\x05\x65mail\x18\x01 \x01(\x0b\x32\x12.secureemail.Email\x12\x18\n\x10private_key_sign\x18\x02 \x01(\x0c\x12\x1a\n\x12public_key_encrypt\x18\x03 \x01(\x0c\"\x80\x01\n\x12VerifyEmailRequest\x12\x34\n\x0f\x65ncrypted_email\x18\x01 \x01(\x0b\x32\x1b.secureemail.EncryptedEmail\x12\x1b\n\x13private_key_encrypt\x18\x02 \x01(\x0c\x12\x17\n\x0fpublic_key_sign\x18\x03 \x01(\x0c\"\x83\x01\n\x15KeyGenerationResponse\x12\x18\n\x10private_key_sign\x18\x01 \x01(\x0c\x12\x17\n\x0fpublic_key_sign\x18\x02 \x01(\x0c\x12\x1b\n\x13private_key_encrypt\x18\x03 \x01(\x0c\x12\x1a\n\x12public_key_encrypt\x18\x04 \x01(\x0c\"\x0e\n\x0c\x45mptyRequest2\xf6\x01\n\x12SecureEmailService\x12M\n\x0cGenerateKeys\x12\x19.secureemail.EmptyRequest\x1a\".secureemail.KeyGenerationResponse\x12M\n\x0cProcessEmail\x12 .secureemail.ProcessEmailRequest\x1a\x1b.secureemail.EncryptedEmail\x12\x42\n\x0bVerifyEmail\x12\x1f.secureemail.VerifyEmailRequest\x1a\x12.secureemail.Emailb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11secureemail.proto\x12\x0bsecureemail\"I\n\x05\x45mail\x12\x12\n\nemail_body\x18\x01 \x01(\x0c\x12,\n\x0b\x61ttachments\x18\x02 \x03(\x0b\x32\x17.secureemail.Attachment\"/\n\nAttachment\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\"\xa6\x01\n\x0e\x45ncryptedEmail\x12\n\n\x02iv\x18\x01 \x01(\x0c\x12\x19\n\x11\x65ncrypted_des_key\x18\x02 \x01(\x0c\x12\x11\n\tsignature\x18\x03 \x01(\x0c\x12\x19\n\x11\x65ncrypted_content\x18\x04 \x01(\x0c\x12?\n\x15\x65ncrypted_attachments\x18\x05 \x03(\x0b\x32 .secureemail.EncryptedAttachment\"8\n\x13\x45ncryptedAttachment\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\"n\n\x13ProcessEmailRequest\x12!\n\x05\x65mail\x18\x01 \x01(\x0b\x32\x12.secureemail.Email\x12\x18\n\x10private_key_sign\x18\x02 \x01(\x0c\x12\x1a\n\x12public_key_encrypt\x18\x03 \x01(\x0c\"\x80\x01\n\x12VerifyEmailRequest\x12\x34\n\x0f\x65ncrypted_email\x18\x01 \x01(\x0b\x32\x1b.secureemail.EncryptedEmail\x12\x1b\n\x13private_key_encrypt\x18\x02 \x01(\x0c\x12\x17\n\x0fpublic_key_sign\x18\x03 \x01(\x0c\"\x83\x01\n\x15KeyGenerationResponse\x12\x18\n\x10private_key_sign\x18\x01 \x01(\x0c\x12\x17\n\x0fpublic_key_sign\x18\x02 \x01(\x0c\x12\x1b\n\x13private_key_encrypt\x18\x03 \x01(\x0c\x12\x1a\n\x12public_key_encrypt\x18\x04 \x01(\x0c\"\x0e\n\x0c\x45mptyRequest\"C\n\x0f\x41ttachmentChunk\x12\r\n\x05index\x18\x01 \x01(\r\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\x0c\"g\n\x14ProcessEmailMetadata\x12\x18\n\x10private_key_sign\x18\x01 \x01(\x0c\x12\x1a\n\x12public_key_encrypt\x18\x02 \x01(\x0c\x12\x19\n\x11\x61ttachments_count\x18\x03 \x01(\r\"\xa5\x01\n\x11ProcessEmailChunk\x12\x35\n\x08metadata\x18\x01 \x01(\x0b\x32!.secureemail.ProcessEmailMetadataH\x00\x12\x14\n\nbody_chunk\x18\x02 \x01(\x0cH\x00\x12\x38\n\x10\x61ttachment_chunk\x18\x03 \x01(\x0b\x32\x1c.secureemail.AttachmentChunkH\x00\x42\t\n\x07payload\"R\n\x16\x45ncryptedEmailMetadata\x12\n\n\x02iv\x18\x01 \x01(\x0c\x12\x19\n\x11\x65ncrypted_des_key\x18\x02 \x01(\x0c\x12\x11\n\tsignature\x18\x03 \x01(\x0c\"\xac\x01\n\x13\x45ncryptedEmailChunk\x12\x37\n\x08metadata\x18\x01 \x01(\x0b\x32#.secureemail.EncryptedEmailMetadataH\x00\x12\x17\n\rcontent_chunk\x18\x02 \x01(\x0cH\x00\x12\x38\n\x10\x61ttachment_chunk\x18\x03 \x01(\x0b\x32\x1c.secureemail.AttachmentChunkH\x00\x42\t\n\x07payload\"\xa0\x01\n\x13VerifyEmailMetadata\x12\n\n\x02iv\x18\x01 \x01(\x0c\x12\x19\n\x11\x65ncrypted_des_key\x18\x02 \x01(\x0c\x12\x11\n\tsignature\x18\x03 \x01(\x0c\x12\x1b\n\x13private_key_encrypt\x18\x04 \x01(\x0c\x12\x17\n\x0fpublic_key_sign\x18\x05 \x01(\x0c\x12\x19\n\x11\x61ttachments_count\x18\x06 \x01(\r\"\xa6\x01\n\x10VerifyEmailChunk\x12\x34\n\x08metadata\x18\x01 \x01(\x0b\x32 .secureemail.VerifyEmailMetadataH\x00\x12\x17\n\rcontent_chunk\x18\x02 \x01(\x0cH\x00\x12\x38\n\x10\x61ttachment_chunk\x18\x03 \x01(\x0b\x32\x1c.secureemail.AttachmentChunkH\x00\x42\t\n\x07payload\"g\n\nEmailChunk\x12\x14\n\nbody_chunk\x18\x01 \x01(\x0cH\x00\x12\x38\n\x10\x61ttachment_chunk\x18\x02 \x01(\x0b\x32\x1c.secureemail.AttachmentChunkH\x00\x42\t\n\x07payload2\xa3\x03\n\x12SecureEmailService\x12M\n\x0cGenerateKeys\x12\x19.secureemail.EmptyRequest\x1a\".secureemail.KeyGenerationResponse\x12M\n\x0cProcessEmail\x12 .secureemail.ProcessEmailRequest\x1a\x1b.secureemail.EncryptedEmail\x12\x42\n\x0bVerifyEmail\x12\x1f.secureemail.VerifyEmailRequest\x1a\x12.secureemail.Email\x12Z\n\x12ProcessEmailStream\x12\x1e.secureemail.ProcessEmailChunk\x1a .secureemail.EncryptedEmailChunk(\x01\x30\x01\x12O\n\x11VerifyEmailStream\x12\x1d.secureemail.VerifyEmailChunk\x1a\x17.secureemail.EmailChunk(\x01\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -47,6 +47,22 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_KEYGENERATIONRESPONSE']._serialized_end=760
   _globals['_EMPTYREQUEST']._serialized_start=762
   _globals['_EMPTYREQUEST']._serialized_end=776
-  _globals['_SECUREEMAILSERVICE']._serialized_start=779
-  _globals['_SECUREEMAILSERVICE']._serialized_end=1025
+  _globals['_ATTACHMENTCHUNK']._serialized_start=778
+  _globals['_ATTACHMENTCHUNK']._serialized_end=845
+  _globals['_PROCESSEMAILMETADATA']._serialized_start=847
+  _globals['_PROCESSEMAILMETADATA']._serialized_end=950
+  _globals['_PROCESSEMAILCHUNK']._serialized_start=953
+  _globals['_PROCESSEMAILCHUNK']._serialized_end=1118
+  _globals['_ENCRYPTEDEMAILMETADATA']._serialized_start=1120
+  _globals['_ENCRYPTEDEMAILMETADATA']._serialized_end=1202
+  _globals['_ENCRYPTEDEMAILCHUNK']._serialized_start=1205
+  _globals['_ENCRYPTEDEMAILCHUNK']._serialized_end=1377
+  _globals['_VERIFYEMAILMETADATA']._serialized_start=1380
+  _globals['_VERIFYEMAILMETADATA']._serialized_end=1540
+  _globals['_VERIFYEMAILCHUNK']._serialized_start=1543
+  _globals['_VERIFYEMAILCHUNK']._serialized_end=1709
+  _globals['_EMAILCHUNK']._serialized_start=1711
+  _globals['_EMAILCHUNK']._serialized_end=1814
+  _globals['_SECUREEMAILSERVICE']._serialized_start=1817
+  _globals['_SECUREEMAILSERVICE']._serialized_end=2236
 # @@protoc_insertion_point(module_scope)
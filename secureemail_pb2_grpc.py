@@ -49,6 +49,16 @@ class SecureEmailServiceStub(object):
                 request_serializer=secureemail__pb2.VerifyEmailRequest.SerializeToString,
                 response_deserializer=secureemail__pb2.Email.FromString,
                 _registered_method=True)
+        self.ProcessEmailStream = channel.stream_stream(
+                '/secureemail.SecureEmailService/ProcessEmailStream',
+                request_serializer=secureemail__pb2.ProcessEmailChunk.SerializeToString,
+                response_deserializer=secureemail__pb2.EncryptedEmailChunk.FromString,
+                _registered_method=True)
+        self.VerifyEmailStream = channel.stream_stream(
+                '/secureemail.SecureEmailService/VerifyEmailStream',
+                request_serializer=secureemail__pb2.VerifyEmailChunk.SerializeToString,
+                response_deserializer=secureemail__pb2.EmailChunk.FromString,
+                _registered_method=True)
 
 
 class SecureEmailServiceServicer(object):
@@ -72,6 +82,20 @@ class SecureEmailServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessEmailStream(self, request_iterator, context):
+        """Потоковые варианты для больших писем и вложений: сначала метаданные,
+        затем тело и вложения фрагментами ограниченного размера
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def VerifyEmailStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_SecureEmailServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -90,6 +114,16 @@ def add_SecureEmailServiceServicer_to_server(servicer, server):
                     request_deserializer=secureemail__pb2.VerifyEmailRequest.FromString,
                     response_serializer=secureemail__pb2.Email.SerializeToString,
             ),
+            'ProcessEmailStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.ProcessEmailStream,
+                    request_deserializer=secureemail__pb2.ProcessEmailChunk.FromString,
+                    response_serializer=secureemail__pb2.EncryptedEmailChunk.SerializeToString,
+            ),
+            'VerifyEmailStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.VerifyEmailStream,
+                    request_deserializer=secureemail__pb2.VerifyEmailChunk.FromString,
+                    response_serializer=secureemail__pb2.EmailChunk.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'secureemail.SecureEmailService', rpc_method_handlers)
@@ -181,3 +215,57 @@ class SecureEmailService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ProcessEmailStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/secureemail.SecureEmailService/ProcessEmailStream',
+            secureemail__pb2.ProcessEmailChunk.SerializeToString,
+            secureemail__pb2.EncryptedEmailChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def VerifyEmailStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/secureemail.SecureEmailService/VerifyEmailStream',
+            secureemail__pb2.VerifyEmailChunk.SerializeToString,
+            secureemail__pb2.EmailChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули проекта импортируются из корня репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
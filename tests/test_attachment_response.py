@@ -0,0 +1,107 @@
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from AttachmentResponse import blob_response, bytes_response, content_etag, parse_range
+
+CONTENT = bytes(range(100))
+ETAG = content_etag(CONTENT)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-9", (0, 9)),
+    (" bytes=10-19 ", (10, 19)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-1000", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-1000", (0, 99)),
+    ("bytes=99-99", (99, 99)),
+    ("bytes=0-9,20-29", None),
+    ("bytes=-", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(CONTENT)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=100-200", "bytes=10-5"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, len(CONTENT))
+    assert error.value.status_code == 416
+    assert error.value.headers == {"Content-Range": "bytes */100"}
+
+
+@pytest.fixture(params=["bytes", "blob"])
+def client(request, tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.api_route("/attachment", methods=["GET", "HEAD"])
+    def attachment(http_request: Request):
+        if request.param == "bytes":
+            return bytes_response(http_request, CONTENT, "отчет.bin", ETAG)
+        return blob_response(http_request, str(path), "отчет.bin", ETAG)
+
+    return TestClient(app)
+
+
+def test_full_response(client):
+    response = client.get("/attachment")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{ETAG}"'
+    assert response.headers["content-length"] == "100"
+    assert response.headers["content-disposition"] == "attachment; filename*=UTF-8''%D0%BE%D1%82%D1%87%D0%B5%D1%82.bin"
+
+
+def test_range_response(client):
+    response = client.get("/attachment", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/100"
+
+
+def test_head_has_no_body(client):
+    response = client.head("/attachment", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-length"] == "5"
+
+
+@pytest.mark.parametrize("if_none_match", [f'"{ETAG}"', f'"other", "{ETAG}"', "*"])
+def test_if_none_match_returns_not_modified(client, if_none_match):
+    response = client.get("/attachment", headers={"If-None-Match": if_none_match, "Range": "bytes=0-9"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{ETAG}"'
+
+
+def test_if_none_match_with_other_etag_returns_content(client):
+    response = client.get("/attachment", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range_with_current_etag_returns_range(client):
+    response = client.get("/attachment", headers={"If-Range": f'"{ETAG}"', "Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+@pytest.mark.parametrize("if_range", ['"other"', ETAG, "Mon, 01 Jan 2024 10:00:00 GMT"])
+def test_if_range_mismatch_returns_whole_file(client, if_range):
+    # Файл мог измениться: вместо диапазона отдается весь файл, даже если диапазон недопустим
+    response = client.get("/attachment", headers={"If-Range": if_range, "Range": "bytes=500-"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert "content-range" not in response.headers
+
+
+def test_unsatisfiable_range_response(client):
+    response = client.get("/attachment", headers={"Range": "bytes=500-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
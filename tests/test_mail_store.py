@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+
+from DB.MailStore import MailStore
+
+DATE = "Mon, 01 Jan 2024 10:00:00 +0000"
+
+
+def run_with_store(tmp_path, scenario):
+    async def main():
+        store = MailStore(f"sqlite:///{tmp_path / 'mail.db'}", str(tmp_path / "blobs"))
+        await store.connect()
+        try:
+            await store.create_tables()
+            await scenario(store)
+        finally:
+            await store.disconnect()
+
+    asyncio.run(main())
+
+
+def blob_files(tmp_path):
+    return sorted(name for _, _, names in os.walk(tmp_path / "blobs") for name in names)
+
+
+def test_rolled_back_letter_leaves_no_blob_files(tmp_path):
+    async def scenario(store):
+        await store.add_letter("INBOX", "a@example.com", "me@example.com", "Me", "first", DATE, b"body",
+                               [{"filename": "shared.txt", "content": b"shared"}], 1)
+        kept = blob_files(tmp_path)
+
+        # Вложение без имени нарушает NOT NULL в Files уже после записи блобов
+        with pytest.raises(sqlite3.IntegrityError):
+            await store.add_letter("INBOX", "a@example.com", "me@example.com", "Me", "second", DATE, b"body",
+                                   [{"filename": "copy.txt", "content": b"shared"},
+                                    {"filename": None, "content": b"only in the failed letter"}], 2)
+
+        assert blob_files(tmp_path) == kept
+        rows = await store.database.fetch_all("SELECT refcount FROM Blobs")
+        assert [row["refcount"] for row in rows] == [1]
+        assert await store.get_email_from_db(2, "INBOX") is None
+
+    run_with_store(tmp_path, scenario)
+
+
+def test_pages_cover_the_folder_once_with_undated_letters_last(tmp_path):
+    dates = {
+        1: "Mon, 01 Jan 2024 10:00:00 +0000",
+        2: "not a date",
+        3: "Tue, 02 Jan 2024 10:00:00 +0000",
+        4: "Mon, 01 Jan 2024 10:00:00 +0000",
+        5: "",
+        6: "Mon, 01 Jan 2024 09:00:00 +0000",
+        7: "garbage",
+        8: "Wed, 03 Jan 2024 10:00:00 +0000",
+    }
+
+    async def scenario(store):
+        await store.add_letters([
+            {"folder_name": "INBOX", "sender": "a@example.com", "recipient": "me@example.com", "to_name": "Me",
+             "subject": f"letter {letter_id}", "date": date, "body": b"body", "attachments": [], "letter_id": letter_id}
+            for letter_id, date in dates.items()
+        ])
+
+        # Страницы по 2 и по 3 письма: курсор попадает и на границу датированных и недатированных писем
+        for limit in (2, 3):
+            seen, cursor = [], None
+            while True:
+                page, cursor = await store.get_emails_page_from_db("INBOX", limit, cursor)
+                assert len(page) <= limit
+                seen.extend(summary.id for summary in page)
+                if cursor is None:
+                    break
+            # Новые первыми, при равной дате - больший id; без даты - в конце, тоже по убыванию id
+            assert seen == [8, 3, 4, 1, 6, 7, 5, 2]
+
+    run_with_store(tmp_path, scenario)
+
+
+def test_retention_evicts_least_recently_opened_letters_first(tmp_path):
+    async def scenario(store):
+        await store.add_letters([
+            {"folder_name": "INBOX", "sender": "a@example.com", "recipient": "me@example.com", "to_name": "Me",
+             "subject": f"letter {letter_id}", "date": DATE, "body": b"x" * 100, "attachments": [], "letter_id": letter_id}
+            for letter_id in range(1, 7)
+        ])
+        # Письма открывались в порядке 3, 1, 5, 2, 6, 4; письмо 3 - дольше всего назад
+        for position, letter_id in enumerate([3, 1, 5, 2, 6, 4]):
+            await store.database.execute(
+                "UPDATE Letters SET last_opened = :last_opened WHERE id = :id",
+                {"id": letter_id, "last_opened": 1_000_000 + position},
+            )
+        # Открытие, еще не записанное в базу, тоже защищает письмо
+        await store.touch_letter(3, "INBOX")
+
+        async def remaining():
+            page, _ = await store.get_emails_page_from_db("INBOX", 10)
+            return sorted(summary.id for summary in page)
+
+        await store.set_retention_policy("INBOX", max_count=4)
+        policy = next(p for p in await store.get_retention_policies() if p["folder_name"] == "INBOX")
+        assert await store.evict_letters(policy) == 2
+        assert await remaining() == [2, 3, 4, 6]
+
+        # Объем папки 400 байт: до 250 байт нужно вытеснить два письма, по одному за пачку
+        await store.set_retention_policy("INBOX", max_bytes=250)
+        policy = next(p for p in await store.get_retention_policies() if p["folder_name"] == "INBOX")
+        assert await store.evict_letters(policy, batch_size=1) == 1
+        assert await remaining() == [3, 4, 6]
+        assert await store.evict_letters(policy, batch_size=1) == 1
+        assert await remaining() == [3, 4]
+        assert await store.evict_letters(policy) == 0
+
+        await store.set_retention_policy("INBOX", max_age_days=1)
+        policy = next(p for p in await store.get_retention_policies() if p["folder_name"] == "INBOX")
+        assert await store.evict_letters(policy) == 1
+        assert await remaining() == [3]
+
+    run_with_store(tmp_path, scenario)
@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from DB.MessageCache import MessageCache
+
+MESSAGE = {"sender": "a@example.com", "body": "text", "attachments": [{"filename": "a.txt", "content": b"data"}]}
+
+
+def test_workers_share_the_disk_key(tmp_path):
+    cache_dir, key_file = str(tmp_path / "cache"), str(tmp_path / "cache.key")
+    # Рабочие процессы стартуют одновременно и создают ключ наперегонки
+    with ThreadPoolExecutor(8) as pool:
+        caches = list(pool.map(lambda _: MessageCache(cache_dir=cache_dir, key_file=key_file), range(8)))
+
+    caches[0].put("me@example.com", "INBOX", 1, 7, MESSAGE)
+    for cache in caches[1:]:
+        assert cache.get("me@example.com", "INBOX", 1, 7)["attachments"] == MESSAGE["attachments"]
+
+
+def test_key_inside_cache_dir_disables_disk_tier(tmp_path):
+    cache = MessageCache(cache_dir=str(tmp_path / "cache"), key_file=str(tmp_path / "cache" / ".key"))
+    assert cache.cache_dir is None
+    assert not (tmp_path / "cache").exists()
+
+    cache.put("me@example.com", "INBOX", 1, 7, MESSAGE)
+    assert cache.get("me@example.com", "INBOX", 1, 7)["body"] == "text"
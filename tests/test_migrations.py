@@ -0,0 +1,161 @@
+import asyncio
+import sqlite3
+
+from DB.MailStore import MailStore
+from DB.RSAKeyDatabase import RSAKeyDatabase
+from DB.migrations import CATALOG_INITIAL_SCHEMA, CATALOG_MIGRATIONS, MAILBOX_MIGRATIONS, SESSIONS, migrate
+
+ACCOUNT = "me@example.com"
+
+CATALOG_TABLES = {
+    "Accounts", "Emails", "KeyPairPool", "KeyPairSummary", "KeyVersion",
+    "PrivateRSAKeys", "PublicRSAKeys", "Sessions", "schema_version",
+}
+MAILBOX_TABLES = {
+    "Blobs", "Emails", "Files", "Folders", "LetterBodies", "Letters", "LettersFTS",
+    "RetentionPolicies", "schema_version",
+}
+
+# Схема, которую создавал RSAKeyDatabase.create_tables до появления миграций
+BASELINE_SCHEMA = """
+CREATE TABLE Emails (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL);
+CREATE TABLE PrivateRSAKeys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_email_id INTEGER NOT NULL, current_recipient_email_id INTEGER NOT NULL,
+    private_key_sign BLOB NOT NULL, public_key_sign BLOB NOT NULL,
+    private_key_encrypt BLOB NOT NULL, public_key_encrypt BLOB NOT NULL,
+    create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE (sender_email_id, current_recipient_email_id, private_key_sign, private_key_encrypt),
+    FOREIGN KEY (sender_email_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (current_recipient_email_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE TABLE PublicRSAKeys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    current_sender_email_id INTEGER NOT NULL, recipient_email_id INTEGER NOT NULL,
+    public_key_sign BLOB NOT NULL, public_key_encrypt BLOB NOT NULL,
+    create_date DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE (current_sender_email_id, recipient_email_id, public_key_sign, public_key_encrypt),
+    FOREIGN KEY (current_sender_email_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (recipient_email_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE TABLE Folders (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+CREATE TABLE Letters (
+    id INTEGER NOT NULL, folder_id INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL, recipient_id INTEGER NOT NULL,
+    to_name TEXT NOT NULL, subject TEXT NOT NULL, date DATETIME NOT NULL, body BLOB NOT NULL,
+    PRIMARY KEY (id, folder_id),
+    FOREIGN KEY (folder_id) REFERENCES Folders (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (sender_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (recipient_id) REFERENCES Emails (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE TABLE Files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    letter_id INTEGER NOT NULL, folder_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL, file_data BLOB NOT NULL,
+    FOREIGN KEY (letter_id, folder_id) REFERENCES Letters (id, folder_id) ON DELETE CASCADE
+);
+"""
+
+
+def tables(path) -> set:
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '%FTS_%'"
+        )
+        return {name for name, in rows}
+
+
+def schema_versions(path) -> list:
+    with sqlite3.connect(path) as connection:
+        return [version for version, in connection.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+async def open_catalog(tmp_path) -> RSAKeyDatabase:
+    db = RSAKeyDatabase(f"sqlite:///{tmp_path / 'rsa_keys.db'}", str(tmp_path / "mailboxes"))
+    await db.connect()
+    await db.create_tables()
+    return db
+
+
+def mailbox_path(tmp_path) -> str:
+    paths = list((tmp_path / "mailboxes").glob("*/mail.db"))
+    assert len(paths) == 1
+    return str(paths[0])
+
+
+def test_empty_databases_get_only_their_own_schema(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        db = await open_catalog(tmp_path)
+        try:
+            async with db.mailbox(ACCOUNT) as mailbox:
+                # Повторный прогон ничего не применяет
+                assert await migrate(mailbox.database, MAILBOX_MIGRATIONS) == MAILBOX_MIGRATIONS[-1].version
+            assert await migrate(db.database, CATALOG_MIGRATIONS) == CATALOG_MIGRATIONS[-1].version
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
+
+    assert tables(tmp_path / "rsa_keys.db") == CATALOG_TABLES
+    assert schema_versions(tmp_path / "rsa_keys.db") == [m.version for m in CATALOG_MIGRATIONS]
+    assert tables(mailbox_path(tmp_path)) == MAILBOX_TABLES
+    assert schema_versions(mailbox_path(tmp_path)) == [m.version for m in MAILBOX_MIGRATIONS]
+
+
+def test_baseline_database_is_upgraded_and_mail_moves_to_its_mailbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with sqlite3.connect(tmp_path / "rsa_keys.db") as connection:
+        connection.executescript(BASELINE_SCHEMA)
+        connection.executescript(f"""
+            INSERT INTO Emails (id, email) VALUES (1, 'sender@example.com'), (2, '{ACCOUNT}');
+            INSERT INTO PublicRSAKeys (current_sender_email_id, recipient_email_id, public_key_sign,
+                public_key_encrypt, create_date)
+            VALUES (2, 1, 'sign', 'encrypt', '2024-01-01 00:00:00');
+            INSERT INTO Folders (id, name) VALUES (1, 'INBOX');
+            INSERT INTO Letters VALUES (7, 1, 1, 2, 'Me', 'Report', 'Mon, 01 Jan 2024 10:00:00 +0000', 'quarterly numbers');
+            INSERT INTO Files (letter_id, folder_id, file_name, file_data) VALUES (7, 1, 'report.txt', X'0102');
+        """)
+
+    async def scenario():
+        db = await open_catalog(tmp_path)
+        try:
+            assert await db.get_related_emails_and_dates(ACCOUNT)
+            async with db.mailbox(ACCOUNT) as mailbox:
+                letter = await mailbox.get_email_from_db(7, "INBOX")
+                assert letter["subject"] == "Report"
+                assert letter["attachments"] == [{"filename": "report.txt", "content": b"\x01\x02"}]
+                page, _ = await mailbox.get_emails_page_from_db("INBOX", 10)
+                assert [summary.id for summary in page] == [7]
+                assert len(await mailbox.search_letters("quarterly")) == 1
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
+
+    # Перенесенная почта удалена из каталога вместе с таблицами писем
+    assert tables(tmp_path / "rsa_keys.db") == CATALOG_TABLES
+    assert tables(mailbox_path(tmp_path)) == MAILBOX_TABLES
+
+
+def test_mailbox_created_before_the_split_drops_catalog_tables(tmp_path):
+    async def scenario():
+        mailbox = MailStore(f"sqlite:///{tmp_path / 'mail.db'}", str(tmp_path / "blobs"))
+        await mailbox.connect()
+        try:
+            # Ящик, созданный общим списком миграций: схема писем и пустые таблицы каталога
+            await migrate(mailbox.database, [m for m in MAILBOX_MIGRATIONS if m.version <= 13])
+            for statement in CATALOG_INITIAL_SCHEMA + SESSIONS:
+                await mailbox.database.execute(statement)
+            await mailbox.database.execute(
+                "INSERT INTO schema_version (version, description) VALUES (12, 'Sessions'), (13, 'KeyVersion')"
+            )
+
+            await mailbox.create_tables()
+        finally:
+            await mailbox.disconnect()
+
+    asyncio.run(scenario())
+
+    assert tables(tmp_path / "mail.db") == MAILBOX_TABLES
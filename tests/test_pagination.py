@@ -0,0 +1,26 @@
+import pytest
+
+from DB.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("date_ts, letter_id", [(1704103200, 7), (None, 7), (0, 0), (-86400, 2 ** 40)])
+def test_cursor_round_trip(date_ts, letter_id):
+    cursor = encode_cursor(date_ts, letter_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (date_ts, letter_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    encode_cursor(1, 2)[:-2],
+    "W10",                  # []
+    "WzEsMiwzXQ",           # [1,2,3]
+    "WyIxIiwyXQ",           # ["1",2]
+    "WzEsbnVsbF0",          # [1,null]
+    "WzEuNSwyXQ",           # [1.5,2]
+    "W3RydWUsMl0",          # [true,2]
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,109 @@
+"""
+Несколько рабочих процессов (uvicorn --workers N) открывают одни и те же файлы каталога
+и почтовых ящиков; здесь процессы изображают два экземпляра хранилища на одном файле.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from DB.RSAKeyDatabase import RSAKeyDatabase
+
+ACCOUNT = "me@example.com"
+PEER = "peer@example.com"
+ACCOUNT_IMAP = {"email_user": ACCOUNT, "email_pass": "secret", "server": "imap.example.com", "port": 993}
+ACCOUNT_SMTP = {"email_user": ACCOUNT, "email_pass": "secret", "server": "smtp.example.com", "port": 587}
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Каталог блобов и файл ключа сессий по умолчанию лежат в текущем каталоге
+    monkeypatch.chdir(tmp_path)
+
+
+@asynccontextmanager
+async def open_workers(count: int = 2):
+    """Несколько экземпляров каталога на одних и тех же файлах."""
+    workers = [RSAKeyDatabase("sqlite:///rsa_keys.db", "mailboxes") for _ in range(count)]
+    try:
+        for db in workers:
+            await db.connect()
+            await db.create_tables()
+        yield workers
+    finally:
+        for db in workers:
+            await db.disconnect()
+
+
+def add_letter(mailbox, folder_name: str, letter_id: int):
+    return mailbox.add_letter(
+        folder_name, "sender@example.com", ACCOUNT, "Me", "Quarterly report",
+        "Mon, 01 Jan 2024 10:00:00 +0000", b"report body", [{"filename": "report.txt", "content": b"numbers"}],
+        letter_id,
+    )
+
+
+def test_folder_created_by_another_worker():
+    async def scenario():
+        async with open_workers() as (a, b):
+            async with a.mailbox(ACCOUNT) as mailbox_a, b.mailbox(ACCOUNT) as mailbox_b:
+                await add_letter(mailbox_a, "INBOX", 1)
+                # Ящик второго процесса уже открыт и прогрел кэш папок до появления Archive
+                assert await mailbox_b.get_email_from_db(1, "INBOX") is not None
+
+                await add_letter(mailbox_a, "Archive", 2)
+
+                letter = await mailbox_b.get_email_from_db(2, "Archive")
+                assert letter["subject"] == "Quarterly report"
+                page, _ = await mailbox_b.get_emails_page_from_db("Archive", 10)
+                assert [summary.id for summary in page] == [2]
+                assert len(await mailbox_b.search_letters("report", "Archive")) == 1
+                attachment = await mailbox_b.get_letter_attachment(2, "Archive", 0)
+                assert attachment["filename"] == "report.txt"
+
+                await mailbox_b.touch_letter(2, "Archive")
+                await mailbox_b.delete_letter(2, "Archive")
+                assert await mailbox_a.get_email_from_db(2, "Archive") is None
+
+    asyncio.run(scenario())
+
+
+def test_session_shared_between_workers():
+    async def scenario():
+        async with open_workers() as (a, b):
+            token = await a.create_session(ACCOUNT_IMAP, ACCOUNT_SMTP)
+            session = await b.get_session(token)
+            assert session["imap"] == ACCOUNT_IMAP
+            assert session["revision"] == 0
+
+            other = dict(ACCOUNT_SMTP, email_user="other@example.com")
+            assert await b.update_session_account(token, "smtp", other)
+            session = await a.get_session(token)
+            assert session["smtp"] == other
+            assert session["revision"] == 1
+
+            assert await a.delete_session(token)
+            assert await b.get_session(token) is None
+
+    asyncio.run(scenario())
+
+
+def test_keys_inserted_by_another_worker():
+    async def scenario():
+        async with open_workers() as (a, b):
+            with pytest.raises(HTTPException):
+                await b.get_encrypt_sign_keys(ACCOUNT, PEER)
+
+            await a.insert_public_keys(ACCOUNT, PEER, b"sign-1", b"encrypt-1", "2024-01-01 00:00:00")
+            await a.insert_private_keys(ACCOUNT, PEER, b"private-sign-1", b"sign-1", b"private-encrypt-1",
+                                        b"encrypt-1", "2024-01-01 00:00:00")
+            keys = await b.get_encrypt_sign_keys(ACCOUNT, PEER)
+            assert keys["public_key_encrypt"] == b"encrypt-1"
+
+            # Ключи уже в кэше второго процесса; новые ключи должны его обновить
+            await a.insert_public_keys(ACCOUNT, PEER, b"sign-2", b"encrypt-2", "2024-02-01 00:00:00")
+            keys = await b.get_encrypt_sign_keys(ACCOUNT, PEER)
+            assert keys["public_key_encrypt"] == b"encrypt-2"
+
+    asyncio.run(scenario())
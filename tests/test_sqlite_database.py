@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from DB.SQLiteDatabase import SQLiteDatabase
+
+
+def run_with_database(tmp_path, scenario, **kwargs):
+    async def main():
+        database = SQLiteDatabase(f"sqlite:///{tmp_path / 'test.db'}", **kwargs)
+        await database.connect()
+        try:
+            await database.execute("CREATE TABLE IF NOT EXISTS Items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+            await scenario(database)
+        finally:
+            await database.disconnect()
+
+    asyncio.run(main())
+
+
+def test_connections_are_tuned(tmp_path):
+    async def scenario(database):
+        assert await database.fetch_val("PRAGMA journal_mode") == "wal"
+        assert await database.fetch_val("PRAGMA synchronous") == 1
+        assert await database.fetch_val("PRAGMA foreign_keys") == 1
+        assert await database.reader.fetch_val("PRAGMA query_only") == 1
+
+        with pytest.raises(Exception):
+            await database.reader.fetch_val("INSERT INTO Items (name) VALUES ('x')")
+
+    run_with_database(tmp_path, scenario)
+
+
+def test_readers_see_only_committed_changes(tmp_path):
+    async def scenario(database):
+        async with database.transaction():
+            await database.execute("INSERT INTO Items (name) VALUES ('pending')")
+            # WAL: читатели не ждут писателя и видят последнее зафиксированное состояние
+            assert await database.reader.fetch_val("SELECT COUNT(*) FROM Items") == 0
+            assert await database.fetch_val("SELECT COUNT(*) FROM Items") == 1
+        assert await database.reader.fetch_val("SELECT COUNT(*) FROM Items") == 1
+
+    run_with_database(tmp_path, scenario)
+
+
+def test_nested_transaction_rolls_back_to_savepoint(tmp_path):
+    events = []
+
+    async def scenario(database):
+        async with database.transaction():
+            await database.execute("INSERT INTO Items (name) VALUES ('outer')")
+            database.on_commit(lambda: events.append("outer committed"))
+            with pytest.raises(RuntimeError):
+                async with database.transaction():
+                    await database.execute("INSERT INTO Items (name) VALUES ('inner')")
+                    database.on_commit(lambda: events.append("inner committed"))
+                    database.on_rollback(lambda: events.append("inner rolled back 1"))
+                    database.on_rollback(lambda: events.append("inner rolled back 2"))
+                    raise RuntimeError
+            assert events == ["inner rolled back 2", "inner rolled back 1"]
+            events.clear()
+        assert events == ["outer committed"]
+
+        rows = await database.reader.fetch_all("SELECT name FROM Items")
+        assert [row["name"] for row in rows] == ["outer"]
+
+    run_with_database(tmp_path, scenario)
+
+
+def test_concurrent_writers_are_serialized(tmp_path):
+    async def scenario(database):
+        async def writer(name):
+            async with database.transaction():
+                count = await database.fetch_val("SELECT COUNT(*) FROM Items")
+                await asyncio.sleep(0)
+                await database.execute("INSERT INTO Items (id, name) VALUES (:id, :name)", {"id": count + 1, "name": name})
+
+        await asyncio.gather(*(writer(f"item {i}") for i in range(10)))
+        assert await database.reader.fetch_val("SELECT COUNT(*) FROM Items") == 10
+
+    run_with_database(tmp_path, scenario)